@@ -0,0 +1,92 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from services.data_service import DataService
+from services.enrichment_queue import enrichment_queue, ALL_STATUSES
+from models.schemas import EnrichmentEnqueueRequest
+import asyncio
+import json
+
+router = APIRouter()
+data_service = DataService()
+
+@router.post("/projects/{project_id}/jobs")
+async def enqueue_project(project_id: str, request: Optional[EnrichmentEnqueueRequest] = None):
+    """
+    为项目产品创建后台补全任务（规格总结 + 供应商查询）
+    任务保存在服务端，关闭页面或重启后端后继续执行
+    """
+    request = request or EnrichmentEnqueueRequest()
+    try:
+        products = await asyncio.to_thread(data_service.get_all_products, project_id)
+        if request.product_ids:
+            wanted = set(request.product_ids)
+            products = [p for p in products if p.id in wanted]
+        if not products:
+            raise HTTPException(status_code=404, detail="项目中没有需要补全的产品")
+        result = await asyncio.to_thread(enrichment_queue.enqueue_products, project_id, products, request.force)
+        progress = await asyncio.to_thread(enrichment_queue.get_progress, project_id)
+        return {**result, "progress": progress}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"创建补全任务失败: {str(e)}")
+
+@router.get("/projects/{project_id}/progress")
+async def get_project_progress(project_id: str):
+    """获取项目补全进度"""
+    try:
+        return await asyncio.to_thread(enrichment_queue.get_progress, project_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取补全进度失败: {str(e)}")
+
+@router.get("/projects/{project_id}/progress/stream")
+async def stream_project_progress(project_id: str, interval: float = 2.0):
+    """
+    以SSE推送项目补全进度，进度变化时推送一次，全部任务结束后推送done事件并关闭
+    """
+    interval = min(max(interval, 0.5), 30.0)
+
+    async def generate():
+        last_payload = None
+        while True:
+            progress = await asyncio.to_thread(enrichment_queue.get_progress, project_id)
+            payload = json.dumps(progress, ensure_ascii=False)
+            if payload != last_payload:
+                yield f"event: progress\ndata: {payload}\n\n"
+                last_payload = payload
+            if not progress["active"]:
+                yield f"event: done\ndata: {payload}\n\n"
+                break
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/projects/{project_id}/jobs")
+async def list_project_jobs(project_id: str, status: Optional[str] = None, limit: int = 200):
+    """获取项目补全任务列表"""
+    if status and status not in ALL_STATUSES:
+        raise HTTPException(status_code=400, detail=f"无效的任务状态: {status}")
+    try:
+        return await asyncio.to_thread(enrichment_queue.list_jobs, project_id, status, min(max(limit, 1), 1000))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取补全任务失败: {str(e)}")
+
+@router.post("/projects/{project_id}/cancel")
+async def cancel_project(project_id: str):
+    """取消项目的未完成补全任务"""
+    try:
+        cancelled = await asyncio.to_thread(enrichment_queue.cancel_project, project_id)
+        progress = await asyncio.to_thread(enrichment_queue.get_progress, project_id)
+        return {"cancelled": cancelled, "progress": progress}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"取消补全任务失败: {str(e)}")
+
+@router.get("/stats")
+async def get_queue_stats():
+    """补全任务队列统计"""
+    return await asyncio.to_thread(enrichment_queue.stats)
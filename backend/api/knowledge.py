@@ -1,7 +1,18 @@
-from fastapi import APIRouter, HTTPException
-from services.knowledge_service import KnowledgeService, refresh_image_link
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from services.knowledge_service import KnowledgeService, serialize_specs, serialize_suppliers
+from services.data_service import DataService
+from services.search_cache import search_cache
+from services.llm_cache import llm_cache
+from services.single_flight import knowledge_single_flight
+from services.llm_client import llm_clients
+from services.llm_router import llm_router
+from services.rate_limiter import limiter_stats
+from services.hedging import search_hedger
+from services.supplier_catalog import supplier_catalog
+from services.supplier_relevance import batched_relevance, supplier_relevance_batcher
 from models.schemas import (
-    KnowledgeSearchRequest, KnowledgeSearchResponse, 
+    KnowledgeSearchRequest, KnowledgeSearchResponse, KnowledgeBatchRequest,
     SpecSearchResponse, SupplierSearchResponse,
     QARequest, QAResponse,
     CertificatePersonnelRequest, CertificatePersonnelResponse,
@@ -9,79 +20,170 @@ from models.schemas import (
 )
 from pydantic import BaseModel, Field
 from typing import Optional
+from utils.config import Config
+from utils.deadline import Deadline, DeadlineExceeded, request_deadline
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import time
 from datetime import datetime
 
 router = APIRouter()
 knowledge_service = KnowledgeService()
+data_service = DataService()
 
 def log_with_time(message: str):
     """带时间戳的日志输出"""
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
     print(f"[{timestamp}] {message}")
 
-@router.post("/search", response_model=KnowledgeSearchResponse)
-async def search_knowledge(request: KnowledgeSearchRequest):
+# 截止时间到达后，服务层返回部分结果所需的额外等待时间（秒）
+_DEADLINE_GRACE = 3.0
+
+def _request_budget(http_request: Request) -> float:
+    """请求的时间预算：前端通过X-Request-Timeout告知的超时减去余量，没有请求头时使用默认值"""
+    budget = Config.KNOWLEDGE_REQUEST_TIMEOUT
+    header = http_request.headers.get("x-request-timeout")
+    if header:
+        try:
+            budget = min(float(header), Config.KNOWLEDGE_REQUEST_TIMEOUT_MAX) - Config.KNOWLEDGE_DEADLINE_MARGIN
+        except ValueError:
+            log_with_time(f"[API] 无效的X-Request-Timeout请求头: {header}")
+    return max(1.0, budget)
+
+async def _watch_disconnect(http_request: Request, deadline: Deadline):
+    """客户端断开时取消请求的截止时间，线程池中的检索和模型调用在下一个检查点停止"""
+    while not deadline.expired:
+        if await http_request.is_disconnected():
+            log_with_time(f"[API] 客户端已断开，停止处理: {http_request.url.path}")
+            deadline.cancel("客户端已断开")
+            return
+        await asyncio.sleep(Config.KNOWLEDGE_DISCONNECT_POLL_INTERVAL)
+
+@asynccontextmanager
+async def _request_scope(http_request: Request):
+    """为请求创建截止时间（随contextvars传递到服务层），并监视客户端断开"""
+    with request_deadline(_request_budget(http_request)) as deadline:
+        watcher = asyncio.create_task(_watch_disconnect(http_request, deadline))
+        try:
+            yield deadline
+        finally:
+            watcher.cancel()
+
+async def _summarize_specs_with_timeout(request: KnowledgeSearchRequest) -> dict:
     """
-    知识库查询：搜索产品规格和供应商信息
-    规格参数会调用AI进行总结，总结内容中包含引用标签，可以点击查看知识库源文件
-    规格参数和供应商信息顺序查询，分别处理和返回
+    组合查询中的规格流水线：搜索并总结规格参数
+    超时或失败时降级为只返回原始chunk，降级也失败则返回空结果
+    流水线的截止时间不超过请求的截止时间，截止时服务层返回已检索到的引用和已生成的部分总结
     """
-    start_time = time.time()
-    log_with_time(f"[API] ========== 开始查询知识库 ==========")
-    log_with_time(f"[API] 产品名称: {request.product_name}, 特征: {request.product_features}")
-    
-    try:
-        # 搜索并总结规格参数（调用AI总结）
-        spec_start_time = time.time()
-        log_with_time(f"[API] [顺序-规格] 开始搜索并总结规格参数...")
+    spec_start_time = time.time()
+    with request_deadline(Config.KNOWLEDGE_SPEC_TIMEOUT) as deadline:
+        log_with_time(f"[API] [并发-规格] 开始搜索并总结规格参数 (截止时间: {deadline.remaining():.0f}秒)...")
         try:
-            spec_result = knowledge_service.summarize_specs(
-                request.product_name,
-                request.product_features
+            spec_result = await asyncio.wait_for(
+                knowledge_service.summarize_specs_async(
+                    request.product_name,
+                    request.product_features
+                ),
+                timeout=deadline.remaining() + _DEADLINE_GRACE
             )
             spec_elapsed = time.time() - spec_start_time
-            log_with_time(f"[API] [顺序-规格] 规格总结完成 (耗时: {spec_elapsed:.2f}秒)，总结长度: {len(spec_result.get('summary', '') or '')} 字符，引用数量: {len(spec_result.get('references', []))}")
+            log_with_time(f"[API] [并发-规格] 规格总结完成 (耗时: {spec_elapsed:.2f}秒)，总结长度: {len(spec_result.get('summary', '') or '')} 字符，引用数量: {len(spec_result.get('references', []))}")
+            return spec_result
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            # 检索完成后的超时由服务层处理（返回已检索到的引用和部分总结），到这里说明规格检索本身未完成
+            spec_elapsed = time.time() - spec_start_time
+            log_with_time(f"[API] [并发-规格] 规格检索超时 (耗时: {spec_elapsed:.2f}秒)，返回空结果")
+            return {
+                "summary": "规格总结超时，请稍后重试。",
+                "references": []
+            }
         except Exception as e:
             spec_elapsed = time.time() - spec_start_time
-            log_with_time(f"[API] [顺序-规格] 规格总结失败 (耗时: {spec_elapsed:.2f}秒): {e}")
+            log_with_time(f"[API] [并发-规格] 规格总结失败 (耗时: {spec_elapsed:.2f}秒): {e}")
             import traceback
             traceback.print_exc()
-            # 如果总结失败，降级为只返回原始chunk
-            try:
-                specs = knowledge_service.search_specs(
+        
+        # 如果总结失败，降级为只返回原始chunk（使用剩余的时间）
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            log_with_time(f"[API] [并发-规格] 已到截止时间，不再降级检索")
+            return {
+                "summary": None,
+                "references": []
+            }
+        try:
+            specs = await asyncio.wait_for(
+                knowledge_service.search_specs_async(
                     request.product_name,
                     request.product_features
-                )
-                spec_result = {
-                    "summary": f"总结失败，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
-                    "references": specs
-                }
-                log_with_time(f"[API] [顺序-规格] 降级处理：返回原始chunk，数量: {len(specs)}")
-            except Exception as fallback_error:
-                log_with_time(f"[API] [顺序-规格] 降级处理也失败: {fallback_error}")
-                spec_result = {
-                    "summary": None,
-                    "references": []
-                }
-                log_with_time(f"[API] [顺序-规格] 搜索失败，返回空结果")
-        
-        # 顺序执行供应商搜索
-        supplier_start_time = time.time()
-        log_with_time(f"[API] [顺序-供应商] 开始搜索供应商...")
+                ),
+                timeout=remaining
+            )
+            log_with_time(f"[API] [并发-规格] 降级处理：返回原始chunk，数量: {len(specs)}")
+            return {
+                "summary": f"总结失败，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
+                "references": specs
+            }
+        except Exception as fallback_error:
+            log_with_time(f"[API] [并发-规格] 降级处理也失败: {fallback_error!r}")
+            log_with_time(f"[API] [并发-规格] 搜索失败，返回空结果")
+            return {
+                "summary": None,
+                "references": []
+            }
+
+async def _search_suppliers_with_timeout(request: KnowledgeSearchRequest) -> list:
+    """
+    组合查询中的供应商流水线：搜索供应商
+    超时或失败时返回空列表，不影响规格结果
+    """
+    supplier_start_time = time.time()
+    with request_deadline(Config.KNOWLEDGE_SUPPLIER_TIMEOUT) as deadline:
+        log_with_time(f"[API] [并发-供应商] 开始搜索供应商 (截止时间: {deadline.remaining():.0f}秒)...")
         try:
-            suppliers = knowledge_service.search_suppliers_from_docs(
-                request.product_name,
-                request.product_features
+            suppliers = await asyncio.wait_for(
+                knowledge_service.search_suppliers_from_docs_async(
+                    request.product_name,
+                    request.product_features
+                ),
+                timeout=deadline.remaining() + _DEADLINE_GRACE
             )
             supplier_elapsed = time.time() - supplier_start_time
-            log_with_time(f"[API] [顺序-供应商] 供应商搜索完成 (耗时: {supplier_elapsed:.2f}秒)，找到 {len(suppliers)} 个供应商")
+            log_with_time(f"[API] [并发-供应商] 供应商搜索完成 (耗时: {supplier_elapsed:.2f}秒)，找到 {len(suppliers)} 个供应商")
+            return suppliers
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            supplier_elapsed = time.time() - supplier_start_time
+            log_with_time(f"[API] [并发-供应商] 供应商搜索超时 (耗时: {supplier_elapsed:.2f}秒)，返回空结果")
+            return []
         except Exception as e:
             supplier_elapsed = time.time() - supplier_start_time
-            log_with_time(f"[API] [顺序-供应商] 供应商搜索失败 (耗时: {supplier_elapsed:.2f}秒): {e}")
+            log_with_time(f"[API] [并发-供应商] 供应商搜索失败 (耗时: {supplier_elapsed:.2f}秒): {e}")
             import traceback
             traceback.print_exc()
-            suppliers = []
+            return []
+
+@router.post("/search", response_model=KnowledgeSearchResponse)
+async def search_knowledge(request: KnowledgeSearchRequest, http_request: Request):
+    """
+    知识库查询：搜索产品规格和供应商信息
+    规格参数会调用AI进行总结，总结内容中包含引用标签，可以点击查看知识库源文件
+    规格参数和供应商信息并发查询，分别超时和降级，互不影响
+    请求的截止时间由前端的X-Request-Timeout决定，客户端断开后停止后续调用
+    """
+    start_time = time.time()
+    log_with_time(f"[API] ========== 开始查询知识库 ==========")
+    log_with_time(f"[API] 产品名称: {request.product_name}, 特征: {request.product_features}")
+    
+    try:
+        # 规格总结与供应商搜索并发执行，各自独立超时，互不影响
+        # 总耗时约为 max(规格, 供应商)，而不是两者之和
+        log_with_time(f"[API] [并发] 同时开始规格总结和供应商搜索...")
+        async with _request_scope(http_request):
+            spec_result, suppliers = await asyncio.gather(
+                _summarize_specs_with_timeout(request),
+                _search_suppliers_with_timeout(request)
+            )
         
         total_elapsed = time.time() - start_time
         log_with_time(f"[API] ========== 查询完成 (总耗时: {total_elapsed:.2f}秒) ==========")
@@ -187,7 +289,7 @@ async def search_knowledge(request: KnowledgeSearchRequest):
         raise HTTPException(status_code=500, detail=f"知识库查询失败: {str(e)}")
 
 @router.post("/search-specs", response_model=SpecSearchResponse)
-async def search_specs_only(request: KnowledgeSearchRequest):
+async def search_specs_only(request: KnowledgeSearchRequest, http_request: Request):
     """
     只搜索产品规格信息（独立API）
     规格参数会调用AI进行总结，总结内容中包含引用标签
@@ -201,10 +303,11 @@ async def search_specs_only(request: KnowledgeSearchRequest):
         spec_start_time = time.time()
         log_with_time(f"[API] [规格] 开始搜索并总结规格参数...")
         try:
-            spec_result = knowledge_service.summarize_specs(
-                request.product_name,
-                request.product_features
-            )
+            async with _request_scope(http_request):
+                spec_result = await knowledge_service.summarize_specs_async(
+                    request.product_name,
+                    request.product_features
+                )
             spec_elapsed = time.time() - spec_start_time
             log_with_time(f"[API] [规格] 规格总结完成 (耗时: {spec_elapsed:.2f}秒)，总结长度: {len(spec_result.get('summary', '') or '')} 字符，引用数量: {len(spec_result.get('references', []))}")
         except Exception as e:
@@ -214,7 +317,7 @@ async def search_specs_only(request: KnowledgeSearchRequest):
             traceback.print_exc()
             # 如果总结失败，降级为只返回原始chunk
             try:
-                specs = knowledge_service.search_specs(
+                specs = await knowledge_service.search_specs_async(
                     request.product_name,
                     request.product_features
                 )
@@ -283,8 +386,61 @@ async def search_specs_only(request: KnowledgeSearchRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"规格搜索失败: {str(e)}")
 
+def _sse_event(event: str, data) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@router.post("/search-specs/stream")
+async def search_specs_stream(request: KnowledgeSearchRequest, http_request: Request):
+    """
+    流式搜索并总结产品规格信息（Server-Sent Events）
+    事件顺序：
+    - references: 检索到的规格引用 {"specs": [...]}，检索完成后立即发送
+    - delta: 总结内容片段 {"text": "..."}
+    - error: 模型调用失败 {"message": "..."}
+    - done: 完整结果 {"spec_summary": "...", "specs": [...]}，用于保存
+    """
+    start_time = time.time()
+    log_with_time(f"[API] ========== 开始流式搜索规格 ==========")
+    log_with_time(f"[API] 产品名称: {request.product_name}, 特征: {request.product_features}")
+    budget = _request_budget(http_request)
+    
+    async def generate():
+        # 客户端断开时StreamingResponse会关闭生成器，finally中取消截止时间，线程中的调用随之停止
+        with request_deadline(budget) as deadline:
+            try:
+                async for event, payload in knowledge_service.summarize_specs_stream_async(
+                    request.product_name,
+                    request.product_features
+                ):
+                    if event == "references":
+                        log_with_time(f"[API] [流式规格] 引用已发送 (耗时: {time.time() - start_time:.2f}秒)，数量: {len(payload)}")
+                        yield _sse_event("references", {"specs": serialize_specs(payload)})
+                    elif event == "delta":
+                        yield _sse_event("delta", {"text": payload})
+                    elif event == "error":
+                        yield _sse_event("error", {"message": payload})
+                    elif event == "done":
+                        log_with_time(f"[API] ========== 流式规格完成 (总耗时: {time.time() - start_time:.2f}秒) ==========")
+                        yield _sse_event("done", {
+                            "spec_summary": payload.get("summary"),
+                            "specs": serialize_specs(payload.get("references", []))
+                        })
+            except Exception as e:
+                log_with_time(f"[API] [流式规格] 失败 (耗时: {time.time() - start_time:.2f}秒): {e}")
+                import traceback
+                traceback.print_exc()
+                yield _sse_event("error", {"message": f"搜索规格失败: {str(e)}"})
+                yield _sse_event("done", {"spec_summary": None, "specs": []})
+            finally:
+                deadline.cancel("响应已结束")
+    
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
 @router.post("/search-suppliers", response_model=SupplierSearchResponse)
-async def search_suppliers_only(request: KnowledgeSearchRequest):
+async def search_suppliers_only(request: KnowledgeSearchRequest, http_request: Request):
     """
     只搜索供应商信息（独立API）
     从供应商文档中搜索，并使用AI过滤不相关的供应商
@@ -298,10 +454,11 @@ async def search_suppliers_only(request: KnowledgeSearchRequest):
         supplier_start_time = time.time()
         log_with_time(f"[API] [供应商] 开始搜索供应商...")
         try:
-            suppliers = knowledge_service.search_suppliers_from_docs(
-                request.product_name,
-                request.product_features
-            )
+            async with _request_scope(http_request):
+                suppliers = await knowledge_service.search_suppliers_from_docs_async(
+                    request.product_name,
+                    request.product_features
+                )
             supplier_elapsed = time.time() - supplier_start_time
             log_with_time(f"[API] [供应商] 供应商搜索完成 (耗时: {supplier_elapsed:.2f}秒)，找到 {len(suppliers)} 个供应商")
         except Exception as e:
@@ -367,8 +524,119 @@ async def search_suppliers_only(request: KnowledgeSearchRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"供应商搜索失败: {str(e)}")
 
+def _resolve_batch_products(request: KnowledgeBatchRequest) -> list:
+    """
+    解析批量查询的产品列表
+    返回 [(product_id, project_id, product_name, product_features), ...]，按名称查询时product_id为None
+    """
+    items = []
+    if request.product_ids or (request.project_id and not request.product_names):
+        if request.project_id:
+            products = data_service.get_all_products(request.project_id)
+            if request.product_ids:
+                wanted = set(request.product_ids)
+                products = [p for p in products if p.id in wanted]
+        else:
+            products = [data_service.get_product(pid) for pid in request.product_ids]
+            products = [p for p in products if p]
+        for product in products:
+            items.append((product.id, product.project_id, product.project_name, product.project_features))
+    for name in request.product_names:
+        if name and name.strip():
+            items.append((None, None, name.strip(), None))
+    return items
+
+@router.post("/search-batch")
+async def search_knowledge_batch(request: KnowledgeBatchRequest):
+    """
+    批量知识库查询：服务端并发查询多个产品的规格和供应商
+    以NDJSON流式返回，每个产品完成后立即输出一行：
+    {"type": "product", "index", "product_id", "product_name", "specs", "spec_summary", "suppliers", "error", "elapsed"}
+    最后一行为汇总：{"type": "done", "total", "succeeded", "failed", "elapsed"}
+    按产品ID查询的结果会通过DataService保存到产品数据中
+    """
+    start_time = time.time()
+    items = await asyncio.to_thread(_resolve_batch_products, request)
+    if not items:
+        raise HTTPException(status_code=400, detail="没有需要查询的产品，请提供project_id、product_ids或product_names")
+    
+    concurrency = request.concurrency or Config.KNOWLEDGE_BATCH_CONCURRENCY
+    log_with_time(f"[API] ========== 开始批量查询 ========== 产品数量: {len(items)}，并发数: {concurrency}")
+    semaphore = asyncio.Semaphore(concurrency)
+    # 同一项目文件的读-改-写需要串行，避免并发保存互相覆盖
+    save_lock = asyncio.Lock()
+    
+    async def process(index: int, item: tuple) -> dict:
+        product_id, project_id, product_name, product_features = item
+        async with semaphore:
+            item_start = time.time()
+            product_request = KnowledgeSearchRequest(product_name=product_name, product_features=product_features)
+            result = {
+                "type": "product",
+                "index": index,
+                "product_id": product_id,
+                "product_name": product_name,
+                "specs": [],
+                "spec_summary": None,
+                "suppliers": [],
+                "error": None
+            }
+            try:
+                # 多个产品的供应商相关性判断合并为一次LLM调用
+                with batched_relevance():
+                    spec_result, suppliers = await asyncio.gather(
+                        _summarize_specs_with_timeout(product_request),
+                        _search_suppliers_with_timeout(product_request)
+                    )
+                result["specs"] = serialize_specs(spec_result.get("references", []))
+                result["spec_summary"] = spec_result.get("summary")
+                result["suppliers"] = serialize_suppliers(suppliers)
+                
+                if product_id:
+                    async with save_lock:
+                        await asyncio.to_thread(
+                            data_service.update_product_specs_and_suppliers,
+                            product_id, result["specs"], result["suppliers"], result["spec_summary"], project_id
+                        )
+            except Exception as e:
+                log_with_time(f"[API] [批量] 产品 {product_name} 查询失败: {e}")
+                import traceback
+                traceback.print_exc()
+                result["error"] = str(e)
+            result["elapsed"] = round(time.time() - item_start, 2)
+            log_with_time(f"[API] [批量] 产品 {index + 1}/{len(items)} 完成: {product_name} (耗时: {result['elapsed']:.2f}秒)")
+            return result
+    
+    async def generate():
+        tasks = [asyncio.create_task(process(i, item)) for i, item in enumerate(items)]
+        succeeded = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result["error"]:
+                    failed += 1
+                else:
+                    succeeded += 1
+                yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+            total_elapsed = time.time() - start_time
+            log_with_time(f"[API] ========== 批量查询完成 (总耗时: {total_elapsed:.2f}秒) 成功: {succeeded}，失败: {failed} ==========")
+            yield json.dumps({
+                "type": "done",
+                "total": len(items),
+                "succeeded": succeeded,
+                "failed": failed,
+                "elapsed": round(total_elapsed, 2)
+            }, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消尚未开始的产品
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.post("/qa", response_model=QAResponse)
-async def answer_question(request: QARequest):
+async def answer_question(request: QARequest, http_request: Request):
     """
     项目专家问答：通过问题搜索知识库，使用qwen模型总结答案
     """
@@ -377,7 +645,8 @@ async def answer_question(request: QARequest):
     log_with_time(f"[API] 问题: {request.question}")
     
     try:
-        result = knowledge_service.answer_question(request.question)
+        async with _request_scope(http_request):
+            result = await knowledge_service.answer_question_async(request.question)
         
         log_with_time(f"[API] 服务返回结果类型: {type(result)}")
         log_with_time(f"[API] 服务返回结果键: {list(result.keys()) if isinstance(result, dict) else 'N/A'}")
@@ -433,6 +702,52 @@ async def answer_question(request: QARequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"问答失败: {str(e)}")
 
+@router.post("/qa/stream")
+async def qa_stream(request: QARequest, http_request: Request):
+    """
+    流式项目专家问答（Server-Sent Events）
+    事件顺序：
+    - references: 检索到的参考chunk {"references": [...]}，检索完成后立即发送
+    - delta: 答案片段 {"text": "..."}，<reference>/<illustration>标签对不会被拆开
+    - error: 模型调用失败 {"message": "..."}
+    - done: 完整结果 {"answer": "...", "references": [...]}
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="问题不能为空")
+    
+    question = request.question.strip()
+    start_time = time.time()
+    log_with_time(f"[API] ========== 开始流式问答 ========== 问题: {question}")
+    budget = _request_budget(http_request)
+    
+    async def generate():
+        with request_deadline(budget) as deadline:
+            try:
+                async for event, payload in knowledge_service.answer_question_stream_async(question):
+                    if event == "references":
+                        log_with_time(f"[API] [流式问答] 引用已发送 (耗时: {time.time() - start_time:.2f}秒)，数量: {len(payload)}")
+                        yield _sse_event("references", {"references": serialize_specs(payload)})
+                    elif event == "delta":
+                        yield _sse_event("delta", {"text": payload})
+                    elif event == "error":
+                        yield _sse_event("error", {"message": payload})
+                    elif event == "done":
+                        log_with_time(f"[API] ========== 流式问答完成 (总耗时: {time.time() - start_time:.2f}秒) ==========")
+                        yield _sse_event("done", {
+                            "answer": payload.get("answer"),
+                            "references": serialize_specs(payload.get("references", []))
+                        })
+            except Exception as e:
+                log_with_time(f"[API] [流式问答] 失败 (耗时: {time.time() - start_time:.2f}秒): {e}")
+                import traceback
+                traceback.print_exc()
+                yield _sse_event("error", {"message": f"问答失败: {str(e)}"})
+                yield _sse_event("done", {"answer": f"抱歉，处理您的问题时出现错误：{str(e)}", "references": []})
+            finally:
+                deadline.cancel("响应已结束")
+    
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
 @router.post("/certificate-personnel", response_model=CertificatePersonnelResponse)
 async def search_certificate_personnel(request: CertificatePersonnelRequest):
     """
@@ -444,7 +759,7 @@ async def search_certificate_personnel(request: CertificatePersonnelRequest):
     log_with_time(f"[API] 查询需求: {request.query}")
     
     try:
-        result = knowledge_service.search_certificate_personnel_by_query(request.query)
+        result = await knowledge_service.search_certificate_personnel_by_query_async(request.query)
         
         total_elapsed = time.time() - start_time
         log_with_time(f"[API] ========== 证书人员查询完成 (总耗时: {total_elapsed:.2f}秒) ==========")
@@ -546,7 +861,7 @@ async def refresh_image_link_api(request: RefreshImageLinkRequest):
     
     try:
         # 调用服务刷新图片链接
-        new_image_url = refresh_image_link(knowledge_service, request.slice_id)
+        new_image_url = await knowledge_service.refresh_image_link_async(request.slice_id)
         
         if new_image_url:
             log_with_time(f"[API] 图片链接刷新成功: {new_image_url[:50]}...")
@@ -572,3 +887,75 @@ async def refresh_image_link_api(request: RefreshImageLinkRequest):
             success=False
         )
 
+
+class CacheInvalidateRequest(BaseModel):
+    """删除检索缓存条目请求"""
+    query: str = Field(..., description="知识库查询文本（会先规范化再匹配）")
+    limit: Optional[int] = Field(None, description="只删除该limit的条目，不填则删除该查询的所有条目")
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """知识库检索缓存统计：条目数、命中/未命中次数、命中率、淘汰数"""
+    return search_cache.stats()
+
+@router.post("/cache/invalidate")
+async def invalidate_cache_entry(request: CacheInvalidateRequest):
+    """删除指定查询的检索缓存条目（知识库文档更新后使用）"""
+    removed = search_cache.invalidate(request.query, request.limit)
+    log_with_time(f"[API] 删除检索缓存: query={request.query}, limit={request.limit}, 删除条目数={removed}")
+    return {"removed": removed}
+
+@router.delete("/cache")
+async def clear_cache():
+    """清空知识库检索缓存"""
+    removed = search_cache.clear()
+    log_with_time(f"[API] 清空检索缓存，删除条目数={removed}")
+    return {"removed": removed}
+
+@router.get("/llm-cache/stats")
+async def get_llm_cache_stats():
+    """LLM结果磁盘缓存统计：各任务条目数、占用大小、命中率"""
+    return llm_cache.stats()
+
+@router.delete("/llm-cache")
+async def clear_llm_cache(task: Optional[str] = None):
+    """清空LLM结果缓存，可通过task只清空指定任务（spec_summary/supplier_extract_batch/supplier_extract/supplier_filter）"""
+    removed = llm_cache.clear(task)
+    log_with_time(f"[API] 清空LLM缓存: task={task or '全部'}, 删除条目数={removed}")
+    return {"removed": removed}
+
+@router.get("/supplier-catalog/stats")
+async def get_supplier_catalog_stats():
+    """本地定商供应商目录统计（行数、各文档同步时间、查询耗时）"""
+    return await asyncio.to_thread(supplier_catalog.stats)
+
+@router.post("/supplier-catalog/sync")
+async def sync_supplier_catalog():
+    """从知识库重新同步两个定商文档到本地供应商目录"""
+    result = await knowledge_service._run_blocking(supplier_catalog.sync, knowledge_service)
+    if result.get("status") == "error":
+        raise HTTPException(status_code=500, detail=f"同步供应商目录失败: {result.get('error')}")
+    return result
+
+@router.get("/supplier-catalog/search")
+async def search_supplier_catalog(product_name: str, limit: int = 30):
+    """在本地供应商目录中按产品名称查找候选供应商（不调用LLM）"""
+    if not product_name.strip():
+        raise HTTPException(status_code=400, detail="产品名称不能为空")
+    rows = await asyncio.to_thread(supplier_catalog.search, product_name.strip(), min(max(limit, 1), 200))
+    for row in rows:
+        row.pop("fields_json", None)
+    return {"product_name": product_name, "candidates": rows}
+
+@router.get("/metrics")
+async def get_knowledge_metrics():
+    """知识库服务运行指标（请求合并、模型客户端、按任务的模型路由与延迟/token用量、外部服务限流、检索对冲等）"""
+    return {
+        "single_flight": knowledge_single_flight.stats(),
+        "llm_client": llm_clients.stats(),
+        "llm_router": llm_router.stats(),
+        "rate_limits": limiter_stats(),
+        "search_hedging": search_hedger.stats(),
+        "supplier_catalog": await asyncio.to_thread(supplier_catalog.stats),
+        "supplier_relevance_batch": supplier_relevance_batcher.stats()
+    }
@@ -6,7 +6,8 @@ from services.excel_parser import ExcelParser
 from services.data_service import DataService
 from services.knowledge_service import KnowledgeService
 from services.search_service import SearchService
-from models.schemas import Product
+from services.enrichment_queue import enrichment_queue
+from models.schemas import Product, ProductCreate
 
 router = APIRouter()
 excel_parser = ExcelParser()
@@ -17,10 +18,12 @@ search_service = SearchService()
 @router.post("/upload", response_model=List[Product])
 async def upload_excel(
     file: UploadFile = File(...),
-    project_id: str = Form(...)
+    project_id: str = Form(...),
+    auto_enrich: bool = Form(False)
 ):
     """
     上传Excel文件并解析
+    auto_enrich为True时自动为新产品创建后台补全任务（规格总结 + 供应商查询）
     """
     # 验证文件类型
     if not file.filename.endswith(('.xlsx', '.xls')):
@@ -36,13 +39,10 @@ async def upload_excel(
         # 解析Excel
         products_data = excel_parser.parse_excel(tmp_file_path)
         
-        # 处理每个产品：先创建产品基本信息，不查询知识库
+        # 先批量创建产品基本信息（规格和供应商为空数组），不查询知识库
         # 知识库查询将在前端异步进行
-        result_products = []
-        for product_data in products_data:
-            # 创建产品（只包含基本信息，不包含规格和供应商）
-            from models.schemas import ProductCreate
-            product_create = ProductCreate(
+        result_products = data_service.create_products_bulk([
+            ProductCreate(
                 project_id=project_id,
                 project_code=product_data.project_code,
                 project_name=product_data.project_name,
@@ -50,14 +50,11 @@ async def upload_excel(
                 unit=product_data.unit,
                 quantity=product_data.quantity
             )
-            # 创建产品时不传入specs和suppliers，让它们为空数组
-            product = data_service.create_product(
-                product_create,
-                specs=[],
-                suppliers=[]
-            )
-            
-            result_products.append(product)
+            for product_data in products_data
+        ])
+        
+        if auto_enrich and result_products:
+            enrichment_queue.enqueue_products(project_id, result_products)
         
         return result_products
     
@@ -0,0 +1,78 @@
+"""
+Excel上传写入产品的耗时对比：逐行 create_product 与 create_products_bulk
+在临时目录中分别测试JSON和SQLite存储，不影响 data/ 下的数据。
+
+用法（在backend目录下）：
+    python benchmarks/bench_product_insert.py
+    python benchmarks/bench_product_insert.py --rows 100 1000 10000 --per-row-max 1000
+
+逐行写入JSON存储的开销随行数平方增长，超过 --per-row-max 的行数不测JSON的逐行写入。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.schemas import ProductCreate  # noqa: E402
+from services.data_service import DataService  # noqa: E402
+from services.product_storage import JSONProductStorage, SQLiteProductStorage  # noqa: E402
+
+
+def make_rows(count: int):
+    return [
+        ProductCreate(
+            project_id="bench",
+            project_code=str(i + 1),
+            project_name=f"离心水泵{i}",
+            project_features="流量: 50m³/h；扬程: 32m；功率: 7.5kW；材质: 铸铁",
+            unit="台",
+            quantity=2,
+        )
+        for i in range(count)
+    ]
+
+
+def make_storage(backend: str, data_dir: str):
+    if backend == "json":
+        return JSONProductStorage(data_dir)
+    return SQLiteProductStorage(os.path.join(data_dir, "products.sqlite3"), data_dir)
+
+
+def run(backend: str, rows, bulk: bool) -> float:
+    with tempfile.TemporaryDirectory() as data_dir:
+        data_service = DataService(make_storage(backend, data_dir))
+        start = time.perf_counter()
+        if bulk:
+            data_service.create_products_bulk(rows)
+        else:
+            for row in rows:
+                data_service.create_product(row, specs=[], suppliers=[])
+        elapsed = time.perf_counter() - start
+        assert len(data_service.get_all_products("bench")) == len(rows)
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--backends", nargs="+", default=["json", "sqlite"], choices=["json", "sqlite"])
+    parser.add_argument("--per-row-max", type=int, default=1000, help="JSON存储逐行写入测试的最大行数")
+    args = parser.parse_args()
+
+    print(f"{'存储':<8}{'行数':>8}{'逐行(秒)':>12}{'批量(秒)':>12}{'加速':>10}")
+    for backend in args.backends:
+        for count in args.rows:
+            rows = make_rows(count)
+            bulk = run(backend, rows, bulk=True)
+            if backend != "json" or count <= args.per_row_max:
+                per_row = run(backend, rows, bulk=False)
+                print(f"{backend:<8}{count:>8}{per_row:>12.3f}{bulk:>12.3f}{per_row / bulk:>9.1f}x")
+            else:
+                print(f"{backend:<8}{count:>8}{'跳过':>12}{bulk:>12.3f}{'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
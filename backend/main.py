@@ -1,6 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api import upload, knowledge, search, data, project, mcp_helper, certificate
+from api import upload, knowledge, search, data, project, mcp_helper, certificate, enrichment
+from services.enrichment_queue import enrichment_queue
+from services.llm_client import llm_clients
+from services.supplier_catalog import supplier_catalog
+from services.knowledge_service import KnowledgeService
+from utils.config import Config
 
 app = FastAPI(title="采购清单智能分析系统", version="1.0.0")
 
@@ -21,6 +26,24 @@ app.include_router(search.router, prefix="/api/search", tags=["搜索"])
 app.include_router(data.router, prefix="/api/data", tags=["数据管理"])
 app.include_router(mcp_helper.router, prefix="/api", tags=["MCP工具"])
 app.include_router(certificate.router, prefix="/api/certificate", tags=["证书文件"])
+app.include_router(enrichment.router, prefix="/api/enrichment", tags=["后台补全"])
+
+@app.on_event("startup")
+async def start_enrichment_queue():
+    """启动后台补全任务工作线程（继续执行上次未完成的任务）"""
+    enrichment_queue.start()
+
+@app.on_event("startup")
+async def sync_supplier_catalog():
+    """本地定商供应商目录为空或过期时在后台同步"""
+    if Config.SUPPLIER_CATALOG_ENABLED:
+        supplier_catalog.sync_async_if_stale(KnowledgeService)
+
+@app.on_event("shutdown")
+async def stop_enrichment_queue():
+    enrichment_queue.stop()
+    # 关闭共享的Ark模型客户端连接池
+    await llm_clients.aclose()
 
 @app.get("/")
 async def root():
@@ -114,6 +114,18 @@ class SupplierSearchResponse(BaseModel):
     """供应商搜索响应"""
     suppliers: List[SupplierInfo] = Field(default_factory=list, description="供应商信息")
 
+class KnowledgeBatchRequest(BaseModel):
+    """批量知识库查询请求（按产品ID或产品名称）"""
+    project_id: Optional[str] = Field(None, description="项目ID；只填项目ID时查询该项目的全部产品")
+    product_ids: List[str] = Field(default_factory=list, description="产品ID列表，结果会保存到产品数据中")
+    product_names: List[str] = Field(default_factory=list, description="产品名称列表，仅返回结果不保存")
+    concurrency: Optional[int] = Field(None, ge=1, le=32, description="并发产品数，不填使用服务端默认值")
+
+class EnrichmentEnqueueRequest(BaseModel):
+    """项目后台补全任务入队请求"""
+    product_ids: List[str] = Field(default_factory=list, description="只补全这些产品；为空时补全项目全部产品")
+    force: bool = Field(False, description="是否重新查询已有规格/供应商结果的产品")
+
 class WebSearchRequest(BaseModel):
     product_name: str = Field(..., description="产品名称")
     limit: int = Field(default=5, description="返回结果数量限制")
@@ -0,0 +1,394 @@
+"""
+后台知识库补全任务队列
+500行以上的BOM无法在一次浏览器会话内查询完，刷新页面就会中断，后端重启后也不会继续。
+这里把每个产品的规格总结+供应商查询作为一个任务保存在SQLite中，由后台工作线程池执行，
+失败按指数退避重试，结果通过DataService写回产品数据；后端重启后未完成的任务会继续执行。
+"""
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from services.supplier_relevance import batched_relevance
+from utils.config import Config
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+ALL_STATUSES = (STATUS_PENDING, STATUS_RUNNING, STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+
+def log_with_time(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[{timestamp}] {message}")
+
+
+class EnrichmentQueue:
+    """SQLite持久化的产品补全任务队列 + 后台工作线程池"""
+
+    def __init__(self, db_path: str, workers: int, max_attempts: int,
+                 retry_base_delay: float, retry_max_delay: float, poll_interval: float):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # 知识库服务和数据服务在工作线程首次使用时再创建，避免导入本模块时就连接知识库
+        self._knowledge_service = None
+        self._data_service = None
+        self._services_lock = threading.Lock()
+        # 后台任务的供应商查询使用自己的线程池（每个工作线程一个），不占用交互式请求的阻塞调用线程池
+        self._supplier_executor: Optional[ThreadPoolExecutor] = None
+
+    # ------------------------------------------------------------------
+    # 数据库
+    # ------------------------------------------------------------------
+    def _get_conn(self) -> sqlite3.Connection:
+        """延迟打开数据库连接并建表（调用方需持有self._lock）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS enrichment_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    project_id TEXT NOT NULL,
+                    product_id TEXT NOT NULL,
+                    product_name TEXT NOT NULL,
+                    product_features TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    next_run_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_enrichment_jobs_status ON enrichment_jobs(status, next_run_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_enrichment_jobs_project ON enrichment_jobs(project_id, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_enrichment_jobs_product ON enrichment_jobs(product_id, status)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    # ------------------------------------------------------------------
+    # 入队 / 取消 / 进度
+    # ------------------------------------------------------------------
+    def enqueue_products(self, project_id: str, products: List[Any], force: bool = False) -> Dict[str, int]:
+        """
+        为产品创建补全任务
+
+        Args:
+            project_id: 项目ID
+            products: Product对象列表
+            force: 为False时跳过已有规格或供应商结果的产品
+
+        Returns:
+            {"enqueued": 新增任务数, "skipped": 跳过的产品数}
+        """
+        now = time.time()
+        enqueued = 0
+        skipped = 0
+        with self._lock:
+            conn = self._get_conn()
+            active = {
+                row["product_id"] for row in conn.execute(
+                    "SELECT product_id FROM enrichment_jobs WHERE project_id = ? AND status IN (?, ?)",
+                    (project_id, *ACTIVE_STATUSES)
+                )
+            }
+            for product in products:
+                already_enriched = bool(product.spec_summary or product.other_specs or product.suppliers)
+                if product.id in active or (already_enriched and not force):
+                    skipped += 1
+                    continue
+                conn.execute(
+                    """
+                    INSERT INTO enrichment_jobs
+                        (project_id, product_id, product_name, product_features, status,
+                         attempts, max_attempts, next_run_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?)
+                    """,
+                    (project_id, product.id, product.project_name, product.project_features,
+                     STATUS_PENDING, self.max_attempts, now, now, now)
+                )
+                active.add(product.id)
+                enqueued += 1
+            conn.commit()
+        if enqueued:
+            log_with_time(f"[补全队列] 项目 {project_id} 新增任务 {enqueued} 个，跳过 {skipped} 个")
+            self._wakeup.set()
+        return {"enqueued": enqueued, "skipped": skipped}
+
+    def cancel_project(self, project_id: str) -> int:
+        """
+        取消项目的未完成任务，返回取消的任务数
+        正在执行的任务会在本次查询结束后丢弃结果，不再写回产品数据
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            cursor = conn.execute(
+                """
+                UPDATE enrichment_jobs SET status = ?, updated_at = ?, finished_at = ?
+                WHERE project_id = ? AND status IN (?, ?)
+                """,
+                (STATUS_CANCELLED, now, now, project_id, *ACTIVE_STATUSES)
+            )
+            conn.commit()
+            cancelled = cursor.rowcount
+        if cancelled:
+            log_with_time(f"[补全队列] 项目 {project_id} 已取消 {cancelled} 个任务")
+        return cancelled
+
+    def get_progress(self, project_id: str) -> Dict[str, Any]:
+        """项目补全进度（各状态任务数）"""
+        with self._lock:
+            conn = self._get_conn()
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM enrichment_jobs WHERE project_id = ? GROUP BY status",
+                (project_id,)
+            ).fetchall()
+        counts = {status: 0 for status in ALL_STATUSES}
+        for row in rows:
+            counts[row["status"]] = row["count"]
+        total = sum(counts.values())
+        finished = counts[STATUS_SUCCEEDED] + counts[STATUS_FAILED] + counts[STATUS_CANCELLED]
+        return {
+            "project_id": project_id,
+            "total": total,
+            **counts,
+            "finished": finished,
+            "active": counts[STATUS_PENDING] + counts[STATUS_RUNNING] > 0,
+            "percent": round(finished * 100.0 / total, 1) if total else 100.0,
+        }
+
+    def list_jobs(self, project_id: str, status: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+        """项目任务列表（最新的在前）"""
+        sql = "SELECT * FROM enrichment_jobs WHERE project_id = ?"
+        params: List[Any] = [project_id]
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._get_conn().execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """队列整体统计"""
+        with self._lock:
+            rows = self._get_conn().execute(
+                "SELECT status, COUNT(*) AS count FROM enrichment_jobs GROUP BY status"
+            ).fetchall()
+        counts = {status: 0 for status in ALL_STATUSES}
+        for row in rows:
+            counts[row["status"]] = row["count"]
+        return {
+            "db_path": self.db_path,
+            "workers": self.workers,
+            "running_workers": sum(1 for t in self._threads if t.is_alive()),
+            "max_attempts": self.max_attempts,
+            "jobs": counts,
+        }
+
+    # ------------------------------------------------------------------
+    # 工作线程
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动工作线程；上次进程退出时仍在执行的任务重新放回队列"""
+        if any(t.is_alive() for t in self._threads):
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            cursor = conn.execute(
+                "UPDATE enrichment_jobs SET status = ?, next_run_at = ?, updated_at = ? WHERE status = ?",
+                (STATUS_PENDING, now, now, STATUS_RUNNING)
+            )
+            conn.commit()
+            if cursor.rowcount:
+                log_with_time(f"[补全队列] 恢复上次未完成的任务 {cursor.rowcount} 个")
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f"enrichment-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        log_with_time(f"[补全队列] 已启动 {self.workers} 个工作线程")
+
+    def stop(self, timeout: float = 5.0):
+        """停止工作线程（正在执行的任务下次启动时重新执行）"""
+        self._stop_event.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        if self._supplier_executor is not None:
+            self._supplier_executor.shutdown(wait=False)
+            self._supplier_executor = None
+
+    def _claim_job(self) -> Optional[Dict[str, Any]]:
+        """领取一个到期的待执行任务并标记为执行中"""
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            row = conn.execute(
+                """
+                SELECT * FROM enrichment_jobs
+                WHERE status = ? AND next_run_at <= ?
+                ORDER BY next_run_at, id LIMIT 1
+                """,
+                (STATUS_PENDING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """
+                UPDATE enrichment_jobs
+                SET status = ?, attempts = attempts + 1, started_at = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (STATUS_RUNNING, now, now, row["id"])
+            )
+            conn.commit()
+            job = dict(row)
+            job["attempts"] += 1
+            return job
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            job = self._claim_job()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run_job(job)
+
+    def _get_services(self):
+        with self._services_lock:
+            if self._knowledge_service is None:
+                from services.knowledge_service import KnowledgeService
+                from services.data_service import DataService
+                self._knowledge_service = KnowledgeService()
+                self._data_service = DataService()
+            if self._supplier_executor is None:
+                self._supplier_executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="enrichment-supplier"
+                )
+        return self._knowledge_service, self._data_service
+
+    def _is_cancelled(self, job_id: int) -> bool:
+        with self._lock:
+            row = self._get_conn().execute("SELECT status FROM enrichment_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or row["status"] == STATUS_CANCELLED
+
+    def _run_job(self, job: Dict[str, Any]):
+        """
+        执行单个补全任务：规格总结与供应商查询并发执行，结果写回产品数据
+        规格总结在工作线程中直接执行，供应商查询提交到队列自己的线程池，都不占用交互式请求的线程池
+        知识库或模型调用失败时抛出异常走重试，不把"总结失败"或空供应商列表写入产品
+        """
+        from services.knowledge_service import serialize_specs, serialize_suppliers
+
+        job_start = time.time()
+        product_name = job["product_name"]
+        log_with_time(f"[补全队列] 开始任务 #{job['id']} 产品: {product_name} (第{job['attempts']}次)")
+        try:
+            knowledge_service, data_service = self._get_services()
+            supplier_future = self._supplier_executor.submit(
+                self._search_suppliers_batched, knowledge_service, product_name, job["product_features"]
+            )
+            spec_result = knowledge_service.summarize_specs(product_name, job["product_features"], raise_errors=True)
+            suppliers = supplier_future.result()
+
+            if self._is_cancelled(job["id"]):
+                log_with_time(f"[补全队列] 任务 #{job['id']} 已取消，丢弃结果")
+                return
+
+            product = data_service.update_product_specs_and_suppliers(
+                job["product_id"],
+                serialize_specs(spec_result.get("references", [])),
+                serialize_suppliers(suppliers),
+                spec_result.get("summary"),
+                job["project_id"]
+            )
+            if product is None:
+                raise ValueError(f"产品不存在: {job['product_id']}")
+            self._finish_job(job, STATUS_SUCCEEDED)
+            log_with_time(f"[补全队列] 任务 #{job['id']} 完成 (耗时: {time.time() - job_start:.2f}秒)")
+        except Exception as e:
+            self._fail_job(job, str(e))
+
+    @staticmethod
+    def _search_suppliers_batched(knowledge_service, product_name: str, product_features: Optional[str]):
+        """供应商查询（与其他并发任务的相关性判断合并为一次LLM调用）"""
+        with batched_relevance():
+            return knowledge_service.search_suppliers_from_docs(product_name, product_features, raise_errors=True)
+
+    def _finish_job(self, job: Dict[str, Any], status: str, error: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                """
+                UPDATE enrichment_jobs SET status = ?, last_error = ?, updated_at = ?, finished_at = ?
+                WHERE id = ? AND status = ?
+                """,
+                (status, error, now, now, job["id"], STATUS_RUNNING)
+            )
+            conn.commit()
+
+    def _fail_job(self, job: Dict[str, Any], error: str):
+        """任务失败：未超过最大次数时按指数退避重新排队，否则标记为失败"""
+        if job["attempts"] >= job["max_attempts"]:
+            log_with_time(f"[补全队列] 任务 #{job['id']} 失败，已达最大重试次数: {error}")
+            self._finish_job(job, STATUS_FAILED, error)
+            return
+        delay = min(self.retry_base_delay * (2 ** (job["attempts"] - 1)), self.retry_max_delay)
+        now = time.time()
+        log_with_time(f"[补全队列] 任务 #{job['id']} 失败，{delay:.0f}秒后重试: {error}")
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                """
+                UPDATE enrichment_jobs SET status = ?, last_error = ?, next_run_at = ?, updated_at = ?
+                WHERE id = ? AND status = ?
+                """,
+                (STATUS_PENDING, error, now + delay, now, job["id"], STATUS_RUNNING)
+            )
+            conn.commit()
+
+
+# 进程内共享的补全任务队列（main.py启动时start）
+enrichment_queue = EnrichmentQueue(
+    db_path=Config.ENRICHMENT_QUEUE_PATH,
+    workers=Config.ENRICHMENT_WORKERS,
+    max_attempts=Config.ENRICHMENT_MAX_ATTEMPTS,
+    retry_base_delay=Config.ENRICHMENT_RETRY_BASE_DELAY,
+    retry_max_delay=Config.ENRICHMENT_RETRY_MAX_DELAY,
+    poll_interval=Config.ENRICHMENT_POLL_INTERVAL,
+)
@@ -0,0 +1,231 @@
+"""
+知识库检索对冲请求（hedged requests）
+TIMING_ANALYSIS_REPORT.md / KNOWLEDGE_SEARCH_TIMEOUT_ANALYSIS.md 中记录到 search_knowledge 偶尔耗时是中位数的数倍。
+这里按调用点（规格、供应商、问答、证书）记录检索耗时，学习各自的p95延迟：检索超过p95仍未返回时
+再发出一个相同的请求，哪个先成功返回就用哪个。对冲请求数受预算限制，不超过正常请求数的设定比例，
+样本不足时不对冲。慢的那个请求无法中断，结果会被丢弃（耗时仍会记录，用于更新延迟分布）。
+可以对冲时，正常请求在独立的线程池中执行，对冲请求使用另一个线程池，不会排在它要竞争的正常请求后面。
+两个线程池都不排队：正常请求线程池没有空闲线程时在调用方线程中直接执行（不对冲），对冲请求线程池没有空闲线程时
+不发出对冲请求，因此被丢弃的慢请求最多占满这两个线程池，不会无限堆积。对冲等待时间和耗时都从请求开始执行时计算。
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from utils.config import Config
+from utils.deadline import remaining_time
+
+
+def log_with_time(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[{timestamp}] {message}")
+
+
+class _SiteStats:
+    """某个调用点的检索耗时与对冲统计"""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.pool_busy = 0  # 线程池没有空闲线程而未对冲的次数
+
+    def percentile(self, ratio: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+class SearchHedger:
+    """按调用点学习延迟分布，对慢请求发出对冲请求（预算受限）"""
+
+    def __init__(self, sites: Dict[str, bool], budget: float, percentile: float, min_samples: int,
+                 min_delay: float, window: int, max_workers: int, primary_workers: int):
+        self.sites = sites
+        self.budget = budget
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self.max_workers = max_workers
+        self.primary_workers = primary_workers
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _SiteStats] = {}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._busy: Dict[str, int] = {"primary": 0, "hedge": 0}
+        self._calls = 0
+        self._hedges = 0
+
+    def _site(self, site: str) -> _SiteStats:
+        stats = self._stats.get(site)
+        if stats is None:
+            stats = self._stats[site] = _SiteStats(self.window)
+        return stats
+
+    def _get_executor(self, kind: str) -> ThreadPoolExecutor:
+        """正常请求（primary）和对冲请求（hedge）各用一个独立的线程池，都不占用阻塞调用线程池（调用方本身就在其中等待）"""
+        executor = self._executors.get(kind)
+        if executor is None:
+            with self._lock:
+                executor = self._executors.get(kind)
+                if executor is None:
+                    executor = self._executors[kind] = ThreadPoolExecutor(
+                        max_workers=self.primary_workers if kind == "primary" else self.max_workers,
+                        thread_name_prefix=f"knowledge-{kind}"
+                    )
+        return executor
+
+    def _pool_size(self, kind: str) -> int:
+        return self.primary_workers if kind == "primary" else self.max_workers
+
+    def _reserve(self, kind: str) -> bool:
+        """占用线程池中的一个空闲线程（提交的任务立即开始执行，不排队）；没有空闲线程时返回False"""
+        with self._lock:
+            if self._busy[kind] >= self._pool_size(kind):
+                return False
+            self._busy[kind] += 1
+            return True
+
+    def _release(self, kind: str):
+        with self._lock:
+            self._busy[kind] -= 1
+
+    def record(self, site: str, seconds: float):
+        with self._lock:
+            self._site(site).latencies.append(seconds)
+
+    def hedge_delay(self, site: str) -> Optional[float]:
+        """发出对冲请求前的等待时间（该调用点的p95），调用点未启用或样本不足时返回None"""
+        if not self.sites.get(site):
+            return None
+        with self._lock:
+            stats = self._site(site)
+            if len(stats.latencies) < self.min_samples:
+                return None
+            return max(self.min_delay, stats.percentile(self.percentile))
+
+    def _take_budget(self, site: str) -> bool:
+        """对冲请求数不超过正常请求数的budget比例"""
+        with self._lock:
+            if self._hedges + 1 > self._calls * self.budget:
+                self._site(site).budget_denied += 1
+                return False
+            self._hedges += 1
+            self._site(site).hedged += 1
+            return True
+
+    def call(self, site: Optional[str], func: Callable[[], Any]) -> Any:
+        """
+        执行一次检索（阻塞，在线程池中调用）
+        site为None时直接调用；否则记录耗时，正常请求开始执行后超过p95仍未返回、预算允许且对冲线程池有空闲线程时发出对冲请求
+        """
+        if not site:
+            return func()
+        with self._lock:
+            self._calls += 1
+            self._site(site).calls += 1
+        delay = self.hedge_delay(site)
+        primary_reserved = False
+        if delay is not None and remaining_time(delay + 1) > delay:
+            primary_reserved = self._reserve("primary")
+            if not primary_reserved:
+                with self._lock:
+                    self._site(site).pool_busy += 1
+        if not primary_reserved:
+            start = time.time()
+            result = func()
+            self.record(site, time.time() - start)
+            return result
+
+        started = threading.Event()
+        primary = self._submit("primary", site, func, started)
+        started.wait()  # 已占用空闲线程，任务立即开始执行
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        if not self._reserve("hedge"):
+            with self._lock:
+                self._site(site).pool_busy += 1
+            return primary.result()
+        if not self._take_budget(site):
+            self._release("hedge")
+            return primary.result()
+
+        log_with_time(f"[检索对冲] {site} 检索超过p95({delay:.2f}秒)未返回，发出对冲请求")
+        hedge = self._submit("hedge", site, func)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._site(site).hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _submit(self, kind: str, site: str, func: Callable[[], Any], started: Optional[threading.Event] = None):
+        """
+        把一次请求提交到已占用空闲线程的线程池（复制上下文，使请求截止时间和限流在线程中生效），
+        成功时记录从开始执行起的耗时，结束后（包括被丢弃的慢请求）释放线程
+        """
+        ctx = contextvars.copy_context()
+
+        def run():
+            try:
+                if started is not None:
+                    started.set()
+                start = time.time()
+                result = ctx.run(func)
+                self.record(site, time.time() - start)
+                return result
+            finally:
+                self._release(kind)
+
+        return self._get_executor(kind).submit(run)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sites": dict(self.sites),
+                "budget": self.budget,
+                "calls": self._calls,
+                "hedges": self._hedges,
+                "busy_threads": dict(self._busy),
+                "by_site": {
+                    site: {
+                        "calls": stats.calls,
+                        "hedged": stats.hedged,
+                        "hedge_wins": stats.hedge_wins,
+                        "budget_denied": stats.budget_denied,
+                        "pool_busy": stats.pool_busy,
+                        "samples": len(stats.latencies),
+                        "p50_seconds": round(stats.percentile(0.5), 3) if stats.latencies else None,
+                        "p95_seconds": round(stats.percentile(self.percentile), 3) if stats.latencies else None,
+                    }
+                    for site, stats in self._stats.items()
+                },
+            }
+
+
+# 进程内共享的检索对冲器
+search_hedger = SearchHedger(
+    sites=Config.KNOWLEDGE_HEDGE_SITES,
+    budget=Config.KNOWLEDGE_HEDGE_BUDGET,
+    percentile=Config.KNOWLEDGE_HEDGE_PERCENTILE,
+    min_samples=Config.KNOWLEDGE_HEDGE_MIN_SAMPLES,
+    min_delay=Config.KNOWLEDGE_HEDGE_MIN_DELAY,
+    window=Config.KNOWLEDGE_HEDGE_WINDOW,
+    max_workers=Config.KNOWLEDGE_HEDGE_MAX_WORKERS,
+    primary_workers=max(Config.KNOWLEDGE_MAX_WORKERS, Config.VIKING_CONCURRENCY_MAX),
+)
@@ -5,9 +5,29 @@ except ImportError:
     VikingKnowledgeBaseService = None
     print("Warning: volcengine.viking_knowledgebase not found, some features may be unavailable")
 from models.schemas import SpecSource, SupplierInfo
+from services.search_cache import search_cache
+from services.llm_cache import llm_cache
+from services.single_flight import knowledge_single_flight
+from services.llm_client import llm_clients
+from services.llm_router import llm_router
+from services.hedging import search_hedger
+from services.rate_limiter import RateLimitWaitTimeout, ark_limiter, backoff_delay, is_rate_limited, viking_limiter
+from services.supplier_catalog import supplier_catalog, term_match_score
+from services.supplier_fields import build_original_content, get_table_fields, map_table_fields
+from services.supplier_relevance import is_batched_relevance, supplier_relevance_batcher
+from utils.tag_stream import TagSafeChunker
+from utils.json_stream import JSONArrayStreamParser
+from utils.context_packer import budget_for, chunk_limit_for, estimate_tokens, pack_context
+from utils.deadline import DeadlineExceeded, check_deadline, clamp_timeout, current_deadline, deadline_expired, remaining_time, request_deadline
 from utils.config import Config
 import os
+import json
 import time
+import asyncio
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from openai import OpenAI
 
@@ -16,6 +36,92 @@ def log_with_time(message: str):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
     print(f"[{timestamp}] {message}")
 
+def strip_json_code_fence(text: str) -> str:
+    """去掉LLM回复中包裹JSON的markdown代码块标记"""
+    text = (text or "").strip()
+    if text.startswith("```json"):
+        text = text.replace("```json", "").replace("```", "").strip()
+    elif text.startswith("```"):
+        text = text.replace("```", "").strip()
+    return text
+
+def is_json_response(text: str) -> bool:
+    """判断LLM回复能否解析为JSON（用于决定是否写入LLM缓存）"""
+    try:
+        json.loads(strip_json_code_fence(text))
+        return True
+    except (json.JSONDecodeError, TypeError):
+        return False
+
+def _dump_model(item) -> dict:
+    """pydantic对象转字典，兼容v1/v2"""
+    return item.model_dump() if hasattr(item, 'model_dump') else item.dict()
+
+def serialize_specs(specs_raw) -> list:
+    """把规格结果统一转换为可JSON序列化的字典列表"""
+    specs = []
+    for spec in specs_raw or []:
+        if isinstance(spec, SpecSource):
+            specs.append(_dump_model(spec))
+        elif isinstance(spec, dict):
+            specs.append(_dump_model(SpecSource(
+                content=spec.get("content", ""),
+                slice_id=spec.get("slice_id", ""),
+                doc_id=spec.get("doc_id", ""),
+                doc_name=spec.get("doc_name"),
+                image_url=spec.get("image_url"),
+                chunk_type=spec.get("chunk_type"),
+                md_content=spec.get("md_content"),
+                html_content=spec.get("html_content"),
+                point_id=spec.get("point_id")
+            )))
+    return specs
+
+def serialize_suppliers(suppliers_raw) -> list:
+    """把供应商结果统一转换为可JSON序列化的字典列表"""
+    suppliers = []
+    for supplier in suppliers_raw or []:
+        if isinstance(supplier, SupplierInfo):
+            suppliers.append(_dump_model(supplier))
+        elif isinstance(supplier, dict):
+            suppliers.append(_dump_model(SupplierInfo(**{
+                "source": "knowledge_base",
+                **supplier
+            })))
+    return suppliers
+
+# 知识库/LLM阻塞调用共用的有界线程池（进程内共享，多个KnowledgeService实例共用）
+_blocking_executor: Optional[ThreadPoolExecutor] = None
+_blocking_executor_lock = threading.Lock()
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """获取知识库阻塞调用线程池，线程数即同时进行的远程调用上限"""
+    global _blocking_executor
+    if _blocking_executor is None:
+        with _blocking_executor_lock:
+            if _blocking_executor is None:
+                _blocking_executor = ThreadPoolExecutor(
+                    max_workers=Config.KNOWLEDGE_MAX_WORKERS,
+                    thread_name_prefix="knowledge-io"
+                )
+    return _blocking_executor
+
+
+# 供应商逐个提取回退使用的独立线程池（调用方本身运行在知识库线程池中，共用会互相等待）
+_supplier_fallback_executor: Optional[ThreadPoolExecutor] = None
+
+def get_supplier_fallback_executor() -> ThreadPoolExecutor:
+    """获取供应商逐个提取线程池，线程数即同时进行的逐个提取LLM调用上限"""
+    global _supplier_fallback_executor
+    if _supplier_fallback_executor is None:
+        with _blocking_executor_lock:
+            if _supplier_fallback_executor is None:
+                _supplier_fallback_executor = ThreadPoolExecutor(
+                    max_workers=Config.SUPPLIER_FALLBACK_WORKERS,
+                    thread_name_prefix="supplier-fallback"
+                )
+    return _supplier_fallback_executor
+
 def extract_chunk_info(point: Any) -> Dict[str, Any]:
     """
     从point对象中提取完整的chunk信息
@@ -31,7 +137,8 @@ def extract_chunk_info(point: Any) -> Dict[str, Any]:
         "chunk_type": None,
         "md_content": None,
         "html_content": None,
-        "point_id": None
+        "point_id": None,
+        "score": None  # 检索得分（越大越相关），用于组装提示词时排序
     }
     
     # 判断是对象还是字典
@@ -65,6 +172,7 @@ def extract_chunk_info(point: Any) -> Dict[str, Any]:
         # 提取ID
         chunk_info["slice_id"] = point.get('point_id', point.get('id', point.get('chunk_id', '')))
         chunk_info["point_id"] = point.get('point_id', point.get('id'))
+        chunk_info["score"] = point.get('score')
         
         # 提取chunk_type
         chunk_info["chunk_type"] = point.get('chunk_type')
@@ -117,6 +225,7 @@ def extract_chunk_info(point: Any) -> Dict[str, Any]:
         # 提取ID
         chunk_info["slice_id"] = getattr(point, 'point_id', None) or getattr(point, 'chunk_id', None) or ''
         chunk_info["point_id"] = getattr(point, 'point_id', None)
+        chunk_info["score"] = getattr(point, 'score', None)
         
         # 提取chunk_type
         chunk_info["chunk_type"] = getattr(point, 'chunk_type', None)
@@ -167,13 +276,7 @@ def refresh_image_link(knowledge_service: Any, slice_id: str) -> Optional[str]:
             "post_processing": post_processing,
         }
         
-        if knowledge_service.collection_name:
-            search_params["collection_name"] = knowledge_service.collection_name
-            response = knowledge_service.service.search_knowledge(**search_params)
-        else:
-            search_params["collection_name"] = "default"
-            search_params["resource_id"] = knowledge_service.collection_id
-            response = knowledge_service.service.search_knowledge(**search_params)
+        response = knowledge_service._search_knowledge(search_params, use_cache=False)
         
         # 解析响应，查找匹配的slice_id
         if response:
@@ -215,6 +318,7 @@ class KnowledgeService:
         # 增加超时设置，知识库API可能需要较长时间
         # connection_timeout: 连接超时（秒）
         # socket_timeout: 读取超时（秒），设置为120秒以支持AI重排序等耗时操作
+        # 处于请求截止时间内的调用会按剩余时间收紧（见_init_connection_pool）
         self.service = VikingKnowledgeBaseService(
             host=Config.VIKING_HOST,
             scheme="https",
@@ -223,6 +327,7 @@ class KnowledgeService:
         )
         self.service.set_ak(Config.VIKING_AK)
         self.service.set_sk(Config.VIKING_SK)
+        self._init_connection_pool()
         self.collection_id = Config.KNOWLEDGE_COLLECTION_ID
         self.group_doc_id = Config.GROUP_SUPPLIER_DOC_ID
         self.oilfield_doc_id = Config.OILFIELD_SUPPLIER_DOC_ID
@@ -255,19 +360,346 @@ class KnowledgeService:
             print(f"初始化集合名称失败: {e}")
             self.collection_name = None
     
-    def summarize_specs(self, product_name: str, product_features: str = None) -> Dict[str, Any]:
+    def _init_connection_pool(self):
+        """
+        为知识库SDK的requests会话挂载有界连接池
+        连接池大小与阻塞调用线程池一致，并发调用可以复用keep-alive连接；
+        SDK的超时在初始化时固定，这里在发送时按当前请求的剩余时间收紧超时，已截止的请求不再发出；
+        所有知识库请求都经过知识库限流器（令牌桶 + 自适应并发），429/503响应会降低并发上限
+        """
+        session = getattr(self.service, 'session', None)
+        if session is None:
+            return
+        try:
+            from requests.adapters import HTTPAdapter
+            
+            class _DeadlineHTTPAdapter(HTTPAdapter):
+                def send(self, request, **kwargs):
+                    check_deadline()
+                    with viking_limiter.slot() as permit:
+                        kwargs["timeout"] = clamp_timeout(kwargs.get("timeout"))
+                        response = super().send(request, **kwargs)
+                        if response.status_code in (429, 503):
+                            permit.mark_overload()
+                        return response
+            
+            adapter = _DeadlineHTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=Config.KNOWLEDGE_MAX_WORKERS,
+                pool_block=True  # 连接用尽时等待，而不是无限新建连接
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        except Exception as e:
+            print(f"初始化知识库连接池失败: {e}")
+    
+    def list_doc_points(self, doc_id: str, page_size: int = 100) -> List[Any]:
+        """
+        分页拉取文档的全部chunk（用于同步本地供应商目录）
+        优先直接调用ListPoints接口拿到原始JSON（包含table_chunk_fields），SDK版本不支持时使用list_points
+        """
+        base_params: Dict[str, Any] = {"doc_ids": [doc_id]}
+        if self.collection_name:
+            base_params["collection_name"] = self.collection_name
+        elif self.collection_id:
+            base_params["resource_id"] = self.collection_id
+        
+        points: List[Any] = []
+        offset = 0
+        while True:
+            params = {**base_params, "offset": offset, "limit": page_size}
+            if hasattr(self.service, "json_exception"):
+                raw = self.service.json_exception("ListPoints", {}, json.dumps(params))
+                data = json.loads(raw).get("data") or {}
+                page = data.get("point_list") or []
+            else:
+                page = self.service.list_points(**params) or []
+            points.extend(page)
+            log_with_time(f"[供应商目录] 文档 {doc_id} 已拉取 {len(points)} 个chunk")
+            if len(page) < page_size:
+                break
+            offset += page_size
+        return points
+    
+    def _search_knowledge(self, search_params: Dict[str, Any], use_cache: bool = True, site: Optional[str] = None) -> Any:
+        """
+        调用知识库检索API
+        根据collection_name/resource_id补全集合参数后调用search_knowledge
+        相同的检索参数会命中进程内的TTL+LRU缓存，不再重复调用远程API
+        
+        Args:
+            search_params: search_knowledge参数
+            use_cache: 是否使用检索缓存（刷新图片链接等需要最新结果的场景应关闭）
+            site: 调用点（spec/supplier/qa/certificate），用于记录检索耗时和对冲慢请求
+        """
+        if self.collection_name:
+            search_params["collection_name"] = self.collection_name
+        else:
+            search_params["collection_name"] = "default"  # 占位符，实际使用resource_id
+            search_params["resource_id"] = self.collection_id
+        
+        search = functools.partial(self.service.search_knowledge, **search_params)
+        if not (use_cache and Config.KNOWLEDGE_CACHE_ENABLED):
+            check_deadline()
+            return search_hedger.call(site, search)
+        
+        cache_key = search_cache.make_key(search_params)
+        hit, response = search_cache.get(cache_key)
+        if hit:
+            log_with_time(f"[知识库缓存] 命中: query={search_params.get('query', '')[:50]}, limit={search_params.get('limit')}")
+            return response
+        
+        check_deadline()
+        response = search_hedger.call(site, search)
+        search_cache.set(cache_key, response)
+        return response
+    
+    def _chat_completion(
+        self,
+        client: OpenAI,
+        messages: List[Dict[str, str]],
+        task: str = "default",
+        max_tokens: Optional[int] = None,
+        use_cache: bool = False,
+        cache_if=None
+    ) -> str:
+        """
+        按任务路由调用Ark模型并返回回复文本（模型、温度、max_tokens、超时见llm_router路由表）
+        use_cache为True时先查询LLM磁盘缓存（按任务设置有效期），未命中再调用模型；
+        cache_if用于判断回复能否写入缓存（例如JSON能否解析），避免缓存错误结果
+        """
+        route = llm_router.route(task)
+        max_tokens = max_tokens or route.max_tokens
+        use_cache = use_cache and Config.LLM_CACHE_ENABLED
+        if use_cache:
+            cache_key = llm_cache.make_key(route.model, messages, route.temperature, max_tokens)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                log_with_time(f"[LLM缓存] 命中: task={task}, 内容长度: {len(cached)} 字符")
+                return cached
+        
+        model = llm_router.select_model(route)
+        attempt = 0
+        while True:
+            call_start = time.time()
+            try:
+                with ark_limiter.slot():
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=route.temperature,
+                        max_tokens=max_tokens,
+                        timeout=self._llm_timeout(route)
+                    )
+            except RateLimitWaitTimeout:
+                raise
+            except Exception as e:
+                self._raise_if_deadline_exceeded(e)
+                llm_router.record(route, model, time.time() - call_start, error=e)
+                if llm_router.can_fallback(route, model, e):
+                    log_with_time(f"[模型路由] {task} 主模型 {model} 超时，改用备用模型 {route.fallback_model} 重试")
+                    model = route.fallback_model
+                    continue
+                if self._backoff_if_rate_limited(e, attempt, task):
+                    attempt += 1
+                    continue
+                raise
+            llm_router.record(route, model, time.time() - call_start, usage=getattr(response, "usage", None))
+            break
+        content = (response.choices[0].message.content or "").strip()
+        
+        if use_cache and content and (cache_if is None or cache_if(content)):
+            llm_cache.set(cache_key, task, model, content)
+        return content
+    
+    @staticmethod
+    def _llm_timeout(route):
+        """模型调用的超时：路由表中的超时与当前请求剩余时间取较小值（已截止时直接抛出DeadlineExceeded）"""
+        check_deadline()
+        return llm_clients.make_timeout(max(0.1, remaining_time(route.timeout)))
+    
+    @staticmethod
+    def _raise_if_deadline_exceeded(error: Exception):
+        """
+        调用失败时请求已截止（超时被收紧或客户端断开）：不是模型变慢，不计入路由统计、不切换备用模型重试
+        """
+        if deadline_expired():
+            raise DeadlineExceeded(f"请求已截止: {error}") from error
+    
+    @staticmethod
+    def _backoff_if_rate_limited(error: Exception, attempt: int, task: str) -> bool:
+        """
+        模型调用被限流（429）时按指数退避+随机抖动等待后重试（最多LLM_RATE_LIMIT_RETRIES次），
+        请求剩余时间不够等待时不再重试；返回是否应重试
+        """
+        if not is_rate_limited(error) or attempt >= Config.LLM_RATE_LIMIT_RETRIES:
+            return False
+        delay = backoff_delay(attempt)
+        if remaining_time(delay + 1) <= delay:
+            return False
+        log_with_time(f"[限流] {task} 模型调用被限流，{delay:.1f}秒后重试 (第{attempt + 1}次)")
+        time.sleep(delay)
+        return True
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        """
+        在有界线程池中执行阻塞调用，避免阻塞uvicorn事件循环
+        会复制当前上下文（contextvars），使请求级状态在线程中可见
+        """
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            get_blocking_executor(),
+            functools.partial(ctx.run, func, *args, **kwargs)
+        )
+    
+    async def _iterate_blocking(self, gen_func, *args):
+        """
+        在有界线程池中迭代阻塞生成器，逐项异步产出
+        调用方停止迭代（例如客户端断开）时通知线程关闭生成器
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop_event = threading.Event()
+        end = object()
+        
+        def _put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # 事件循环已关闭
+                stop_event.set()
+        
+        def _produce():
+            gen = gen_func(*args)
+            try:
+                for item in gen:
+                    if stop_event.is_set():
+                        break
+                    _put(item)
+                _put(end)
+            except Exception as e:
+                _put(end, e)
+            finally:
+                gen.close()
+        
+        producer = asyncio.ensure_future(self._run_blocking(_produce))
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is end:
+                    if error is not None:
+                        raise error
+                    break
+                yield item
+        finally:
+            stop_event.set()
+            if producer.done() and not producer.cancelled():
+                producer.exception()
+    
+    async def search_knowledge_async(self, search_params: Dict[str, Any]) -> Any:
+        """异步调用知识库检索API"""
+        return await self._run_blocking(self._search_knowledge, search_params)
+    
+    async def chat_completion_async(self, task: str = "default", **kwargs) -> Any:
+        """异步调用Ark模型（使用共享的异步客户端，不占用线程池），未指定的参数按任务路由表填充"""
+        route = llm_router.route(task)
+        model = kwargs.setdefault("model", llm_router.select_model(route))
+        kwargs.setdefault("temperature", route.temperature)
+        kwargs.setdefault("max_tokens", route.max_tokens)
+        kwargs.setdefault("timeout", self._llm_timeout(route))
+        call_start = time.time()
+        try:
+            async with ark_limiter.slot_async():
+                response = await llm_clients.get_async_client().chat.completions.create(**kwargs)
+        except Exception as e:
+            self._raise_if_deadline_exceeded(e)
+            llm_router.record(route, model, time.time() - call_start, error=e)
+            raise
+        if not kwargs.get("stream"):
+            llm_router.record(route, model, time.time() - call_start, usage=getattr(response, "usage", None))
+        return response
+    
+    async def _coalesced(self, operation: str, func, *args) -> Any:
+        """
+        以 (operation, *args) 为键合并相同的并发调用
+        同一产品的规格/供应商查询正在进行时，后来的调用直接等待同一个结果
+        """
+        key = (operation,) + tuple(args)
+        return await knowledge_single_flight.do(key, lambda: self._run_blocking(func, *args))
+    
+    async def summarize_specs_async(self, product_name: str, product_features: str = None) -> Dict[str, Any]:
+        """
+        summarize_specs的异步版本（检索和总结两步分别合并相同产品的并发调用）
+        总结未在调用方截止时间内完成时，返回已检索到的引用和共享任务已生成的部分总结
+        """
+        specs = await self.search_specs_async(product_name, None)
+        key = ("summarize_specs", product_name, product_features)
+        try:
+            return await knowledge_single_flight.do(
+                key, lambda: self._run_blocking(self._summarize_spec_results, product_name, product_features, specs)
+            )
+        except DeadlineExceeded:
+            log_with_time(f"[规格总结] 已到截止时间，返回已检索到的 {len(specs)} 条规格")
+            return {
+                "summary": f"规格总结超时，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
+                "references": specs
+            }
+    
+    def summarize_specs_stream_async(self, product_name: str, product_features: str = None):
+        """summarize_specs_stream的异步版本（异步生成器）"""
+        return self._iterate_blocking(self.summarize_specs_stream, product_name, product_features)
+    
+    async def search_specs_async(self, product_name: str, product_features: str = None) -> List[SpecSource]:
+        """search_specs的异步版本（相同产品的并发调用会被合并）"""
+        return await self._coalesced("search_specs", self.search_specs, product_name, product_features)
+    
+    async def search_suppliers_from_docs_async(self, product_name: str, product_features: str = None) -> List[SupplierInfo]:
+        """search_suppliers_from_docs的异步版本（相同产品的并发调用会被合并）"""
+        return await self._coalesced("search_suppliers_from_docs", self.search_suppliers_from_docs, product_name, product_features)
+    
+    async def answer_question_async(self, question: str) -> Dict[str, Any]:
+        """answer_question的异步版本"""
+        return await self._run_blocking(self.answer_question, question)
+    
+    def answer_question_stream_async(self, question: str):
+        """answer_question_stream的异步版本（异步生成器）"""
+        return self._iterate_blocking(self.answer_question_stream, question)
+    
+    async def search_certificate_personnel_async(
+        self,
+        project_time: str,
+        certificate_requirements: Dict[str, int],
+        free_status: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """search_certificate_personnel的异步版本"""
+        return await self._run_blocking(
+            self.search_certificate_personnel, project_time, certificate_requirements, free_status
+        )
+    
+    async def search_certificate_personnel_by_query_async(self, query: str) -> Dict[str, Any]:
+        """search_certificate_personnel_by_query的异步版本"""
+        return await self._run_blocking(self.search_certificate_personnel_by_query, query)
+    
+    async def refresh_image_link_async(self, slice_id: str) -> Optional[str]:
+        """refresh_image_link的异步版本"""
+        return await self._run_blocking(refresh_image_link, self, slice_id)
+    
+    def summarize_specs(self, product_name: str, product_features: str = None, raise_errors: bool = False) -> Dict[str, Any]:
         """
         搜索并总结产品规格信息
         
         Args:
             product_name: 产品名称
             product_features: 产品特征（可选）
+            raise_errors: 为True时检索或模型调用失败直接抛出异常，而不是返回"总结失败"的降级结果
             
         Returns:
             包含总结内容和引用列表的字典
         """
         start_time = time.time()
         log_with_time(f"[规格总结] 开始总结规格参数: {product_name}")
+        specs = None
         
         try:
             # 1. 先搜索规格相关的chunk（只使用product_name搜索，product_features是原始需求，稍后会合并）
@@ -276,85 +708,349 @@ class KnowledgeService:
             if product_features:
                 log_with_time(f"[规格总结] [1.1] 原始需求规格: {product_features[:100]}...")
             # 搜索时只使用product_name，product_features作为原始需求稍后合并
-            specs = self.search_specs(product_name, None)  # 不传入product_features，只使用product_name搜索
+            specs = self.search_specs(product_name, None, raise_errors=raise_errors)  # 不传入product_features，只使用product_name搜索
             search_elapsed = time.time() - search_start
             log_with_time(f"[规格总结] [1.1] 搜索完成 (耗时: {search_elapsed:.2f}秒)，找到 {len(specs)} 条规格")
             
-            if not specs:
-                # 即使知识库没有匹配，如果有原始规格，也应该返回原始规格
-                if product_features and product_features.strip():
-                    log_with_time(f"[规格总结] 未找到知识库规格，返回原始规格")
-                    # 格式化原始规格，使其更易读
-                    import re
-                    formatted_specs = product_features.strip()
-                    # 如果原始规格是多行的，保持格式；如果是单行，尝试格式化
-                    if '\n' not in formatted_specs:
-                        # 尝试将类似 "1.名称:xxx 2.规格:xxx" 的格式转换为列表
-                        formatted_specs = re.sub(r'(\d+)\.', r'\n\1.', formatted_specs)
-                        formatted_specs = formatted_specs.strip()
-                    
-                    return {
-                        "summary": f"## 原始规格参数\n\n{formatted_specs}",
-                        "references": []
-                    }
-                else:
-                    log_with_time(f"[规格总结] 未找到规格，返回空结果")
-                    return {
-                        "summary": "没有找到规格参数",
-                        "references": []
-                    }
+            result = self._summarize_spec_results(product_name, product_features, specs, raise_errors=raise_errors)
             
-            # 2. 使用Ark模型总结规格参数
-            api_key = Config.ARK_API_KEY
-            if not api_key:
-                log_with_time(f"[规格总结] 未配置ARK_API_KEY，返回原始chunk")
-                # 如果没有配置API key，返回原始chunk内容
-                summary = f"找到 {len(specs)} 条规格信息，请查看下方参考内容。"
+            total_elapsed = time.time() - start_time
+            log_with_time(f"[规格总结] 总结完成 (总耗时: {total_elapsed:.2f}秒)")
+            return result
+            
+        except Exception as e:
+            total_elapsed = time.time() - start_time
+            log_with_time(f"[规格总结] 规格总结失败 (总耗时: {total_elapsed:.2f}秒): {e}")
+            import traceback
+            traceback.print_exc()
+            if raise_errors:
+                raise
+            # 如果总结失败，返回原始chunk（已经检索到的直接使用，请求已截止时不再重新检索）
+            log_with_time(f"[规格总结] 降级处理：返回原始chunk")
+            if specs is None:
+                if deadline_expired():
+                    specs = []
+                else:
+                    specs = self.search_specs(product_name, None)  # 降级处理时也只使用product_name搜索
+            if isinstance(e, DeadlineExceeded):
                 return {
-                    "summary": summary,
+                    "summary": f"规格总结超时，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
                     "references": specs
                 }
-            
-            # 构建prompt
-            prompt_start = time.time()
-            log_with_time(f"[规格总结] [1.2] 开始构建prompt...")
-            client = OpenAI(
-                api_key=api_key,
-                base_url=Config.ARK_BASE_URL,
-                timeout=180.0,  # 设置180秒超时
-            )
-            
-            # 构建prompt，包含所有相关chunk
-            # 注意：search_specs已经限制返回4个chunk，使用全部chunk
-            context_parts = []
-            
-            # 首先添加原始需求规格（如果有），作为基础参考
+            return {
+                "summary": f"总结失败，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
+                "references": specs  # search_specs已经限制返回4个chunk
+            }
+    
+    def _summarize_spec_results(self, product_name: str, product_features: Optional[str], specs: List[SpecSource],
+                                raise_errors: bool = False) -> Dict[str, Any]:
+        """
+        用已检索到的规格chunk调用模型总结（raise_errors为False时不会抛出异常）
+        流式读取模型回复并在每个片段检查截止时间：请求截止或客户端断开时关闭与模型的连接，
+        返回已生成的部分总结；模型调用失败时返回原始chunk
+        """
+        # 没有检索到规格或未配置API key时不调用模型
+        fallback = self._spec_summary_without_llm(product_features, specs)
+        if fallback is not None:
+            return fallback
+        
+        messages = self._build_spec_summary_messages(product_name, product_features, specs)
+        route = llm_router.route("spec_summary")
+        cache_key = None
+        if Config.LLM_CACHE_ENABLED:
+            cache_key = llm_cache.make_key(route.model, messages, route.temperature, route.max_tokens)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                log_with_time(f"[LLM缓存] 命中: task=spec_summary, 内容长度: {len(cached)} 字符")
+                return {"summary": cached, "references": specs}
+        
+        ai_start = time.time()
+        log_with_time(f"[规格总结] [1.3] 开始调用AI模型总结 (超时设置: {remaining_time(route.timeout):.0f}秒)...")
+        parts = []
+        try:
+            for delta in self._stream_chat_completion(messages, task="spec_summary",
+                                                      log_prefix="[规格总结]", start_time=ai_start):
+                parts.append(delta)
+        except DeadlineExceeded as e:
+            if raise_errors:
+                raise
+            partial = "".join(parts).strip()
+            log_with_time(f"[规格总结] [1.3] 已到截止时间，停止模型调用 (耗时: {time.time() - ai_start:.2f}秒)，部分总结长度: {len(partial)} 字符: {e}")
+            if partial:
+                summary = f"{partial}\n\n（规格总结超时，以上为部分内容，请查看下方参考内容。）"
+            else:
+                summary = f"规格总结超时，找到 {len(specs)} 条规格信息，请查看下方参考内容。"
+            return {"summary": summary, "references": specs}
+        except Exception as e:
+            log_with_time(f"[规格总结] [1.3] AI调用失败 (耗时: {time.time() - ai_start:.2f}秒): {e}")
+            if raise_errors:
+                raise
+            return {
+                "summary": f"总结失败，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
+                "references": specs
+            }
+        
+        summary = "".join(parts).strip()
+        log_with_time(f"[规格总结] [1.3] AI调用完成 (耗时: {time.time() - ai_start:.2f}秒)，总结内容长度: {len(summary)} 字符")
+        if cache_key and summary:
+            llm_cache.set(cache_key, "spec_summary", route.model, summary)
+        return {"summary": summary, "references": specs}
+    
+    def _spec_summary_without_llm(self, product_features: Optional[str], specs: List[SpecSource]) -> Optional[Dict[str, Any]]:
+        """
+        不需要调用模型的规格总结结果：没有检索到规格，或未配置ARK_API_KEY
+        需要调用模型时返回None
+        """
+        if not specs:
+            # 即使知识库没有匹配，如果有原始规格，也应该返回原始规格
             if product_features and product_features.strip():
-                original_specs = product_features.strip()
-                context_parts.append(f"【原始需求规格】\n{original_specs}\n")
-                log_with_time(f"[规格总结] 添加原始需求规格，长度: {len(original_specs)} 字符")
-            
-            # 然后添加从知识库搜索到的规格信息
-            for i, spec in enumerate(specs):  # 使用全部chunk（最多4个）
-                slice_id = spec.slice_id
-                doc_name = spec.doc_name or '未知文档'
-                content = spec.content[:800]  # 限制每个chunk长度
-                image_url = spec.image_url or ''
+                log_with_time(f"[规格总结] 未找到知识库规格，返回原始规格")
+                # 格式化原始规格，使其更易读
+                import re
+                formatted_specs = product_features.strip()
+                # 如果原始规格是多行的，保持格式；如果是单行，尝试格式化
+                if '\n' not in formatted_specs:
+                    # 尝试将类似 "1.名称:xxx 2.规格:xxx" 的格式转换为列表
+                    formatted_specs = re.sub(r'(\d+)\.', r'\n\1.', formatted_specs)
+                    formatted_specs = formatted_specs.strip()
                 
-                # 构建参考内容，包含slice_id
-                chunk_text = f"【知识库参考资料 {i+1}】\npoint_id: {slice_id}\n文档名称：{doc_name}\n内容：{content}"
-                if image_url:
-                    chunk_text += f"\n图片链接：{image_url}"
-                context_parts.append(chunk_text)
-            
-            context_text = "\n\n".join(context_parts)
-            
-            # 构建用户问题，明确是关于产品规格参数
-            user_question = f"{product_name}的详细规格参数和技术要求有哪些？"
-            if product_features:
-                user_question += f"\n\n注意：原始需求中已提供了部分规格信息（{product_features[:50]}...），请结合知识库中的详细规格信息，对原始规格进行补充和完善。"
-            
-            prompt = f"""# 任务
+                return {
+                    "summary": f"## 原始规格参数\n\n{formatted_specs}",
+                    "references": []
+                }
+            else:
+                log_with_time(f"[规格总结] 未找到规格，返回空结果")
+                return {
+                    "summary": "没有找到规格参数",
+                    "references": []
+                }
+        
+        if not Config.ARK_API_KEY:
+            log_with_time(f"[规格总结] 未配置ARK_API_KEY，返回原始chunk")
+            # 如果没有配置API key，返回原始chunk内容
+            summary = f"找到 {len(specs)} 条规格信息，请查看下方参考内容。"
+            return {
+                "summary": summary,
+                "references": specs
+            }
+        
+        return None
+    
+    def summarize_specs_stream(self, product_name: str, product_features: str = None):
+        """
+        流式搜索并总结产品规格信息（生成器）
+        先产出检索到的引用，再逐段产出模型生成的总结，最后产出完整结果：
+            ("references", List[SpecSource])
+            ("delta", str)              # 零到多次
+            ("error", str)              # 模型调用失败时
+            ("done", {"summary": str, "references": List[SpecSource]})
+        """
+        start_time = time.time()
+        log_with_time(f"[规格总结-流式] 开始总结规格参数: {product_name}")
+        
+        specs = self.search_specs(product_name, None)  # 与summarize_specs一致，只使用product_name搜索
+        log_with_time(f"[规格总结-流式] 检索完成 (耗时: {time.time() - start_time:.2f}秒)，找到 {len(specs)} 条规格")
+        yield "references", specs
+        
+        fallback = self._spec_summary_without_llm(product_features, specs)
+        if fallback is not None:
+            yield "delta", fallback["summary"]
+            yield "done", fallback
+            return
+        
+        messages = self._build_spec_summary_messages(product_name, product_features, specs)
+        cache_key = None
+        if Config.LLM_CACHE_ENABLED:
+            route = llm_router.route("spec_summary")
+            cache_key = llm_cache.make_key(route.model, messages, route.temperature, route.max_tokens)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                log_with_time(f"[LLM缓存] 命中: task=spec_summary, 内容长度: {len(cached)} 字符")
+                yield "delta", cached
+                yield "done", {"summary": cached, "references": specs}
+                return
+        
+        parts = []
+        completed = False
+        try:
+            for delta in self._stream_chat_completion(messages, task="spec_summary",
+                                                      log_prefix="[规格总结-流式]", start_time=start_time):
+                parts.append(delta)
+                yield "delta", delta
+            completed = True
+        except Exception as e:
+            log_with_time(f"[规格总结-流式] AI调用失败 (耗时: {time.time() - start_time:.2f}秒): {e}")
+            yield "error", str(e)
+            if not parts:
+                yield "done", {
+                    "summary": f"总结失败，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
+                    "references": specs
+                }
+                return
+        
+        summary = "".join(parts).strip()
+        # 中途失败的不完整总结不写入缓存
+        if cache_key and summary and completed:
+            llm_cache.set(cache_key, "spec_summary", llm_router.route("spec_summary").model, summary)
+        log_with_time(f"[规格总结-流式] 总结完成 (总耗时: {time.time() - start_time:.2f}秒)，总结长度: {len(summary)} 字符")
+        yield "done", {"summary": summary, "references": specs}
+    
+    def _stream_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        task: str = "default",
+        max_tokens: Optional[int] = None,
+        log_prefix: str = "[流式]",
+        start_time: Optional[float] = None,
+        tag_safe: bool = True
+    ):
+        """
+        按任务路由流式调用Ark模型（生成器），逐段产出回复文本
+        tag_safe为True时<reference>/<illustration>标签对不会被拆到两个片段中；
+        调用方关闭生成器（例如客户端断开）时同时关闭与模型的连接
+        """
+        start_time = start_time or time.time()
+        route = llm_router.route(task)
+        client = llm_clients.get_client()
+        request = {
+            "messages": messages,
+            "temperature": route.temperature,
+            "max_tokens": max_tokens or route.max_tokens,
+            "stream": True
+        }
+        if Config.LLM_STREAM_USAGE:
+            request["stream_options"] = {"include_usage": True}
+        model = llm_router.select_model(route)
+        attempt = 0
+        while True:
+            # 限流许可一直持有到流读取结束（流式调用的并发按正在生成的回复计算）
+            ark_limiter.acquire()
+            call_start = time.time()
+            try:
+                stream = client.chat.completions.create(model=model, timeout=self._llm_timeout(route), **request)
+                break
+            except Exception as e:
+                ark_limiter.release(error=e)
+                self._raise_if_deadline_exceeded(e)
+                llm_router.record(route, model, time.time() - call_start, error=e)
+                if llm_router.can_fallback(route, model, e):
+                    log_with_time(f"{log_prefix} 主模型 {model} 超时，改用备用模型 {route.fallback_model} 重试")
+                    model = route.fallback_model
+                    continue
+                if self._backoff_if_rate_limited(e, attempt, task):
+                    attempt += 1
+                    continue
+                raise
+        
+        chunker = TagSafeChunker() if tag_safe else None
+        first_token_seconds = None
+        usage = None
+        stream_error = None
+        try:
+            for chunk in stream:
+                # 客户端断开或请求截止时停止读取，finally中关闭与模型的连接
+                check_deadline()
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if chunker is not None:
+                    delta = chunker.feed(delta)
+                if delta:
+                    if first_token_seconds is None:
+                        first_token_seconds = time.time() - call_start
+                        log_with_time(f"{log_prefix} 首个片段 (耗时: {time.time() - start_time:.2f}秒)")
+                    yield delta
+        except BaseException as e:
+            # 包括调用方提前关闭生成器（GeneratorExit）
+            stream_error = e
+            if isinstance(e, Exception):
+                self._raise_if_deadline_exceeded(e)
+                llm_router.record(route, model, time.time() - call_start, first_token_seconds, usage, error=e)
+            raise
+        finally:
+            stream.close()
+            ark_limiter.release(error=stream_error)
+        llm_router.record(route, model, time.time() - call_start, first_token_seconds, usage)
+        rest = chunker.flush() if chunker is not None else ""
+        if rest:
+            yield rest
+    
+    def _stream_json_items(
+        self,
+        messages: List[Dict[str, Any]],
+        parser: JSONArrayStreamParser,
+        task: str = "default",
+        max_tokens: Optional[int] = None,
+        use_cache: bool = False,
+        log_prefix: str = "[流式JSON]"
+    ):
+        """
+        按任务路由流式调用Ark模型并增量解析回复中的JSON数组（生成器），每个对象元素一闭合就产出
+        调用结束后可从parser读取已解析元素（parser.items）、数组是否完整（parser.complete）和原始回复（parser.text）；
+        只有数组完整闭合的回复才写入LLM缓存，命中缓存时一次性解析缓存内容
+        """
+        start_time = time.time()
+        route = llm_router.route(task)
+        max_tokens = max_tokens or route.max_tokens
+        cache_key = None
+        if use_cache and Config.LLM_CACHE_ENABLED:
+            cache_key = llm_cache.make_key(route.model, messages, route.temperature, max_tokens)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                log_with_time(f"[LLM缓存] 命中: task={task}, 内容长度: {len(cached)} 字符")
+                yield from parser.feed(cached)
+                return
+        
+        first_item = True
+        for delta in self._stream_chat_completion(messages, task=task, max_tokens=max_tokens,
+                                                  log_prefix=log_prefix, start_time=start_time, tag_safe=False):
+            for item in parser.feed(delta):
+                if first_item:
+                    first_item = False
+                    log_with_time(f"{log_prefix} 首个对象解析完成 (耗时: {time.time() - start_time:.2f}秒)")
+                yield item
+        
+        if cache_key and parser.complete:
+            llm_cache.set(cache_key, task, route.model, parser.text.strip())
+    
+    def _build_spec_summary_messages(self, product_name: str, product_features: Optional[str], specs: List[SpecSource]) -> List[Dict[str, str]]:
+        """构建规格总结的对话消息（summarize_specs和summarize_specs_stream共用）"""
+        # 构建prompt，包含所有相关chunk
+        # 注意：search_specs已经限制返回4个chunk，使用全部chunk
+        context_parts = []
+        
+        # 首先添加原始需求规格（如果有），作为基础参考
+        if product_features and product_features.strip():
+            original_specs = product_features.strip()
+            context_parts.append(f"【原始需求规格】\n{original_specs}\n")
+            log_with_time(f"[规格总结] 添加原始需求规格，长度: {len(original_specs)} 字符")
+        
+        # 然后添加从知识库搜索到的规格信息（按token预算整块装入，重复的chunk只保留一个）
+        budget = budget_for("spec_summary") - estimate_tokens(context_parts[0] if context_parts else "")
+        packed = pack_context(specs, [spec.content for spec in specs], budget,
+                              max_chunk_tokens=chunk_limit_for("spec_summary"))
+        log_with_time(f"[规格总结] 参考资料装箱: {packed.summary()}")
+        for i, (spec, content) in enumerate(zip(packed.items, packed.texts)):
+            slice_id = spec.slice_id
+            doc_name = spec.doc_name or '未知文档'
+            image_url = spec.image_url or ''
+            
+            # 构建参考内容，包含slice_id
+            chunk_text = f"【知识库参考资料 {i+1}】\npoint_id: {slice_id}\n文档名称：{doc_name}\n内容：{content}"
+            if image_url:
+                chunk_text += f"\n图片链接：{image_url}"
+            context_parts.append(chunk_text)
+        
+        context_text = "\n\n".join(context_parts)
+        
+        # 构建用户问题，明确是关于产品规格参数
+        user_question = f"{product_name}的详细规格参数和技术要求有哪些？"
+        if product_features:
+            user_question += f"\n\n注意：原始需求中已提供了部分规格信息（{product_features[:50]}...），请结合知识库中的详细规格信息，对原始规格进行补充和完善。"
+        
+        prompt = f"""# 任务
 你是一位专业的采购专家，你的任务是根据「参考资料」总结产品的详细规格参数和技术要求，这些信息在 <context></context> XML tags 之内。
 
 参考资料包含两部分：
@@ -392,58 +1088,12 @@ class KnowledgeService:
 
 # 用户问题
 {user_question}"""
-            prompt_elapsed = time.time() - prompt_start
-            log_with_time(f"[规格总结] [1.2] Prompt构建完成 (耗时: {prompt_elapsed:.2f}秒)，prompt长度: {len(prompt)} 字符")
-
-            # 调用Ark模型生成总结
-            ai_start = time.time()
-            log_with_time(f"[规格总结] [1.3] 开始调用AI模型总结 (超时设置: 180秒)...")
-            try:
-                response = client.chat.completions.create(
-                    model=Config.ARK_MODEL,
-                    messages=[
-                        {"role": "system", "content": "你是一位专业的采购专家，能够基于知识库内容准确总结产品规格参数。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=2000,
-                    timeout=180.0  # 设置180秒超时
-                )
-                ai_elapsed = time.time() - ai_start
-                log_with_time(f"[规格总结] [1.3] AI调用完成 (耗时: {ai_elapsed:.2f}秒)")
-                
-                summary = response.choices[0].message.content.strip()
-                log_with_time(f"[规格总结] [1.3] 总结内容长度: {len(summary)} 字符")
-                
-            except Exception as ai_error:
-                ai_elapsed = time.time() - ai_start
-                log_with_time(f"[规格总结] [1.3] AI调用失败 (耗时: {ai_elapsed:.2f}秒): {ai_error}")
-                raise
-            
-            total_elapsed = time.time() - start_time
-            log_with_time(f"[规格总结] 总结完成 (总耗时: {total_elapsed:.2f}秒)")
-            
-            # 返回总结和参考chunk
-            # 注意：search_specs已经限制返回4个chunk，无需再次截取
-            return {
-                "summary": summary,
-                "references": specs
-            }
-            
-        except Exception as e:
-            total_elapsed = time.time() - start_time
-            log_with_time(f"[规格总结] 规格总结失败 (总耗时: {total_elapsed:.2f}秒): {e}")
-            import traceback
-            traceback.print_exc()
-            # 如果总结失败，返回原始chunk
-            log_with_time(f"[规格总结] 降级处理：返回原始chunk")
-            specs = self.search_specs(product_name, None)  # 降级处理时也只使用product_name搜索
-            return {
-                "summary": f"总结失败，找到 {len(specs)} 条规格信息，请查看下方参考内容。",
-                "references": specs  # search_specs已经限制返回4个chunk
-            }
+        return [
+            {"role": "system", "content": "你是一位专业的采购专家，能够基于知识库内容准确总结产品规格参数。"},
+            {"role": "user", "content": prompt}
+        ]
     
-    def search_specs(self, product_name: str, product_features: str = None) -> List[SpecSource]:
+    def search_specs(self, product_name: str, product_features: str = None, raise_errors: bool = False) -> List[SpecSource]:
         """
         搜索产品规格信息（原始chunk，不总结）
         注意：会排除供应商文档的内容，只返回规格相关的chunk
@@ -451,6 +1101,7 @@ class KnowledgeService:
         Args:
             product_name: 产品名称
             product_features: 产品特征（可选）
+            raise_errors: 为True时知识库调用失败直接抛出异常，而不是返回空列表（后台补全任务据此重试）
             
         Returns:
             规格来源列表
@@ -501,18 +1152,8 @@ class KnowledgeService:
                 
                 # 调用知识库API
                 api_start = time.time()
-                if self.collection_name:
-                    search_params["collection_name"] = self.collection_name
-                    log_with_time(f"[知识库搜索-规格] 使用 collection_name: {self.collection_name}")
-                    log_with_time(f"[知识库搜索-规格] 开始调用知识库API...")
-                    response = self.service.search_knowledge(**search_params)
-                else:
-                    # 使用resource_id参数
-                    search_params["collection_name"] = "default"  # 占位符，实际使用resource_id
-                    search_params["resource_id"] = self.collection_id
-                    log_with_time(f"[知识库搜索-规格] 使用 resource_id: {self.collection_id}")
-                    log_with_time(f"[知识库搜索-规格] 开始调用知识库API...")
-                    response = self.service.search_knowledge(**search_params)
+                log_with_time(f"[知识库搜索-规格] 开始调用知识库API...")
+                response = self._search_knowledge(search_params, site="spec")
                 
                 api_elapsed = time.time() - api_start
                 log_with_time(f"[知识库搜索-规格] API调用完成 (耗时: {api_elapsed:.2f}秒)")
@@ -766,16 +1407,22 @@ class KnowledgeService:
                     print(f"[知识库搜索] search_collection 也失败: {e2}")
                     import traceback
                     traceback.print_exc()
+                    if raise_errors:
+                        raise
             except Exception as e:
                 print(f"[知识库搜索] API调用异常: {e}")
                 import traceback
                 traceback.print_exc()
+                if raise_errors:
+                    raise
             
         except Exception as e:
             total_elapsed = time.time() - start_time
             log_with_time(f"[知识库搜索-规格] 知识库规格搜索失败 (总耗时: {total_elapsed:.2f}秒): {e}")
             import traceback
             traceback.print_exc()
+            if raise_errors:
+                raise
         
         total_elapsed = time.time() - start_time
         log_with_time(f"[知识库搜索-规格] 最终返回 {len(specs)} 条规格 (总耗时: {total_elapsed:.2f}秒)")
@@ -785,7 +1432,7 @@ class KnowledgeService:
         # 注意：知识库API已经限制返回4个chunk，无需再次截取
         return specs
     
-    def search_suppliers_from_docs(self, product_name: str, product_features: str = None) -> List[SupplierInfo]:
+    def search_suppliers_from_docs(self, product_name: str, product_features: str = None, raise_errors: bool = False) -> List[SupplierInfo]:
         """
         从指定文档中搜索供应商信息
         只从供应商文档中搜索，并使用AI过滤不相关的供应商
@@ -794,6 +1441,7 @@ class KnowledgeService:
         Args:
             product_name: 产品名称
             product_features: 产品特征/规格描述（可选）
+            raise_errors: 为True时知识库检索失败直接抛出异常，而不是返回空列表（后台补全任务据此重试）
             
         Returns:
             供应商信息列表（已过滤）
@@ -802,6 +1450,14 @@ class KnowledgeService:
         log_with_time(f"[供应商搜索] 开始搜索供应商: {product_name}")
         suppliers = []
         
+        # 优先在本地定商目录中查找，目录未同步或没有候选时再检索知识库
+        try:
+            catalog_suppliers = self._search_suppliers_from_catalog(product_name, product_features)
+            if catalog_suppliers is not None:
+                return catalog_suppliers
+        except Exception as e:
+            log_with_time(f"[供应商搜索] 本地目录查询失败，改为检索知识库: {e}")
+        
         # 优化：一次调用知识库API，返回更多结果，然后过滤两个文档
         # 这样可以减少一次知识库API调用
         try:
@@ -843,13 +1499,7 @@ class KnowledgeService:
             }
             
             api_start = time.time()
-            if self.collection_name:
-                search_params["collection_name"] = self.collection_name
-                response = self.service.search_knowledge(**search_params)
-            else:
-                search_params["collection_name"] = "default"
-                search_params["resource_id"] = self.collection_id
-                response = self.service.search_knowledge(**search_params)
+            response = self._search_knowledge(search_params, site="supplier")
             api_elapsed = time.time() - api_start
             log_with_time(f"[供应商搜索] 知识库API调用完成 (耗时: {api_elapsed:.2f}秒)")
             
@@ -944,12 +1594,231 @@ class KnowledgeService:
             log_with_time(f"[供应商搜索] 搜索失败 (总耗时: {total_elapsed:.2f}秒): {e}")
             import traceback
             traceback.print_exc()
+            if raise_errors:
+                raise
         
         total_elapsed = time.time() - start_time
         log_with_time(f"[供应商搜索] 搜索完成 (总耗时: {total_elapsed:.2f}秒)，共找到 {len(suppliers)} 个供应商")
         
         return suppliers
     
+    def _search_suppliers_from_catalog(self, product_name: str, product_features: str = None) -> Optional[List[SupplierInfo]]:
+        """
+        在本地定商目录中查找供应商（毫秒级），可选再用LLM只对候选集做相关性判断
+        目录未同步或没有候选时返回None，由调用方走知识库检索
+        """
+        if not Config.SUPPLIER_CATALOG_ENABLED or not supplier_catalog.is_ready():
+            return None
+        start_time = time.time()
+        rows = supplier_catalog.search(
+            product_name,
+            limit=Config.SUPPLIER_CATALOG_CANDIDATES,
+            exclude_expired=Config.SUPPLIER_CATALOG_EXCLUDE_EXPIRED
+        )
+        if not rows:
+            return None
+        
+        candidates = []
+        for row in rows:
+            candidates.append(SupplierInfo(
+                name=row["supplier_name"],
+                source="knowledge_base",
+                doc_id=row["doc_id"],
+                doc_name=row["doc_name"],
+                slice_id=row["point_id"],
+                content=row["content"],
+                product_name=row.get("product_name"),
+                supplier_type=row.get("supplier_type"),
+                sub_category_name=row.get("sub_category_name"),
+                sub_category_code=row.get("sub_category_code"),
+                valid_from=row.get("valid_from"),
+                valid_to=row.get("valid_to"),
+                contact_person=row.get("contact_person"),
+                # 未做LLM判断时按匹配分标记：产品名称全部命中视为强相关
+                relevance="强相关" if row["score"] >= 0.999 else "可能相关"
+            ))
+        
+        if Config.SUPPLIER_CATALOG_LLM_RELEVANCE and Config.ARK_API_KEY:
+            candidates = self._rank_candidates(candidates, product_name, product_features)
+        suppliers = self._select_relevant_suppliers(candidates)
+        log_with_time(f"[供应商搜索] 本地目录命中 {len(rows)} 个候选，返回 {len(suppliers)} 个供应商 (耗时: {time.time() - start_time:.2f}秒)")
+        return suppliers
+    
+    def _select_relevant_suppliers(self, suppliers: List[SupplierInfo]) -> List[SupplierInfo]:
+        """优先返回强相关的供应商，没有强相关时返回top 5可能相关的（与批量提取规则一致）"""
+        strong_relevant = [s for s in suppliers if s.relevance == "强相关"]
+        if strong_relevant:
+            return strong_relevant
+        return [s for s in suppliers if s.relevance == "可能相关"][:5]
+    
+    def _rank_candidates(self, suppliers: List[SupplierInfo], product_name: str, product_features: str = None) -> List[SupplierInfo]:
+        """LLM相关性判断入口：批量场景下与其他产品合并为一次调用，否则单独调用"""
+        if suppliers and is_batched_relevance():
+            return supplier_relevance_batcher.rank(
+                self._rank_suppliers_for_products,
+                (suppliers, product_name, product_features),
+                # 等不到合并结果时：还有时间就单独判断，否则使用匹配分标记的结果
+                fallback=lambda: suppliers if deadline_expired() else self._rank_suppliers_by_ai(suppliers, product_name, product_features)
+            )
+        return self._rank_suppliers_by_ai(suppliers, product_name, product_features)
+    
+    def _rank_suppliers_for_products(self, requests: List[tuple]) -> List[List[SupplierInfo]]:
+        """
+        一次LLM调用判断多个产品的候选供应商相关性
+        requests为 [(候选供应商列表, 产品名称, 产品特征), ...]，按相同顺序返回各产品带relevance标记的供应商；
+        同一供应商行只在提示词中出现一次（S编号），产品通过候选编号引用；
+        某个产品没有出现在回复中（输出被截断或调用失败）时原样返回其候选
+        """
+        if len(requests) == 1:
+            suppliers, product_name, product_features = requests[0]
+            return [self._rank_suppliers_by_ai(suppliers, product_name, product_features)]
+        
+        start_time = time.time()
+        supplier_ids = {}
+        supplier_lines = []
+        product_lines = []
+        product_candidates = []
+        for p_index, (suppliers, product_name, product_features) in enumerate(requests, 1):
+            candidate_ids = {}
+            for supplier in suppliers:
+                key = (supplier.name, supplier.sub_category_name, supplier.product_name, supplier.supplier_type)
+                if key not in supplier_ids:
+                    supplier_ids[key] = len(supplier_ids) + 1
+                    parts = [f"S{supplier_ids[key]}: {supplier.name}"]
+                    if supplier.sub_category_name:
+                        parts.append(supplier.sub_category_name)
+                    if supplier.product_name:
+                        parts.append(supplier.product_name)
+                    supplier_lines.append(" | ".join(parts))
+                candidate_ids.setdefault(supplier_ids[key], []).append(supplier)
+            product_candidates.append(candidate_ids)
+            product_query = product_name or ""
+            if product_features:
+                product_query += f" {product_features[:100]}"
+            product_lines.append(f"P{p_index}: {product_query} | 候选: {','.join(f'S{i}' for i in candidate_ids)}")
+        
+        prompt = f"""请判断每个产品与其候选供应商的相关性。
+
+供应商（编号: 名称 | 物资类别 | 产品）：
+{chr(10).join(supplier_lines)}
+
+产品及其候选供应商：
+{chr(10).join(product_lines)}
+
+相关性标准：
+- "强相关"：产品名称判断属于供应商的物资类别
+- "可能相关"：产品名称判断不属于供应商的物资类别，但存在一定关联性
+- 完全不相关的供应商不返回；每个产品只能从自己的候选中选择
+
+返回格式（JSON数组，每个产品一项，p为产品编号，strong/possible为供应商编号数字）：
+[{{"p": 1, "strong": [1, 2], "possible": [5]}}, {{"p": 2, "strong": [], "possible": []}}]
+
+只返回JSON数组，不要其他文字说明。"""
+        
+        results: List[Optional[List[SupplierInfo]]] = [None] * len(requests)
+        parser = JSONArrayStreamParser()
+        try:
+            for item in self._stream_json_items(
+                [
+                    {"role": "system", "content": "你是一个专业的采购助手，能够准确判断供应商与产品的相关性。"},
+                    {"role": "user", "content": prompt}
+                ],
+                parser,
+                task="supplier_rank_batch",
+                max_tokens=200 + 80 * len(requests),
+                use_cache=True,
+                log_prefix="[供应商相关性-批量]"
+            ):
+                p_index = item.get("p")
+                if not isinstance(p_index, int) or not 1 <= p_index <= len(requests):
+                    continue
+                candidate_ids = product_candidates[p_index - 1]
+                ranked = []
+                for field, relevance in (("strong", "强相关"), ("possible", "可能相关")):
+                    for supplier_id in item.get(field) or []:
+                        if isinstance(supplier_id, str):
+                            digits = supplier_id.strip().lstrip("Ss")
+                            supplier_id = int(digits) if digits.isdigit() else None
+                        for supplier in candidate_ids.get(supplier_id, []):
+                            ranked.append(supplier.model_copy(update={"relevance": relevance}))
+                results[p_index - 1] = ranked
+        except Exception as e:
+            log_with_time(f"[供应商相关性-批量] LLM判断失败 (耗时: {time.time() - start_time:.2f}秒)，未完成的产品按匹配分返回: {e}")
+        
+        missing = sum(1 for result in results if result is None)
+        log_with_time(
+            f"[供应商相关性-批量] {len(requests)} 个产品、{len(supplier_lines)} 个供应商判断完成 "
+            f"(耗时: {time.time() - start_time:.2f}秒)，{missing} 个产品未返回结果"
+        )
+        return [result if result is not None else requests[i][0] for i, result in enumerate(results)]
+    
+    def _rank_suppliers_by_ai(self, suppliers: List[SupplierInfo], product_name: str, product_features: str = None) -> List[SupplierInfo]:
+        """
+        只让LLM判断候选供应商与产品的相关性（供应商字段已在本地解析好，不需要LLM提取）
+        返回带relevance标记的供应商列表（不相关的被移除）；调用失败时原样返回
+        """
+        if not suppliers:
+            return suppliers
+        start_time = time.time()
+        try:
+            lines = []
+            for i, supplier in enumerate(suppliers, 1):
+                parts = [f"{i}. {supplier.name}"]
+                if supplier.sub_category_name:
+                    parts.append(f"物资类别: {supplier.sub_category_name}")
+                if supplier.product_name:
+                    parts.append(f"产品: {supplier.product_name}")
+                if supplier.supplier_type:
+                    parts.append(f"类型: {supplier.supplier_type}")
+                lines.append(" | ".join(parts))
+            
+            product_query = product_name or ""
+            if product_features:
+                product_query += f" {product_features[:200]}"
+            
+            prompt = f"""请判断以下候选供应商与产品"{product_query}"的相关性。
+
+候选供应商：
+{chr(10).join(lines)}
+
+相关性标准：
+- "强相关"：产品名称判断属于供应商的物资类别
+- "可能相关"：产品名称判断不属于供应商的物资类别，但存在一定关联性
+- 完全不相关的供应商不返回
+
+返回格式（JSON数组，index为候选供应商序号）：
+[{{"index": 1, "relevance": "强相关"}}, {{"index": 3, "relevance": "可能相关"}}]
+
+如果都不相关，返回空数组：[]。只返回JSON数组，不要其他文字说明。"""
+            
+            result_text = self._chat_completion(
+                llm_clients.get_client(),
+                messages=[
+                    {"role": "system", "content": "你是一个专业的采购助手，能够准确判断供应商与产品的相关性。"},
+                    {"role": "user", "content": prompt}
+                ],
+                task="supplier_rank",
+                use_cache=True,
+                cache_if=is_json_response
+            )
+            results = json.loads(strip_json_code_fence(result_text))
+            if not isinstance(results, list):
+                raise ValueError("返回格式不是JSON数组")
+            
+            ranked = []
+            for item in results:
+                if not isinstance(item, dict):
+                    continue
+                index = item.get("index")
+                if isinstance(index, int) and 1 <= index <= len(suppliers):
+                    supplier = suppliers[index - 1]
+                    ranked.append(supplier.model_copy(update={"relevance": item.get("relevance") or "可能相关"}))
+            log_with_time(f"[供应商相关性] LLM判断完成 (耗时: {time.time() - start_time:.2f}秒)，{len(suppliers)} 个候选中 {len(ranked)} 个相关")
+            return ranked
+        except Exception as e:
+            log_with_time(f"[供应商相关性] LLM判断失败 (耗时: {time.time() - start_time:.2f}秒)，按匹配分返回: {e}")
+            return suppliers
+    
     def _search_suppliers_in_doc(self, product_name: str, product_features: str = None, doc_id: str = None, doc_name: str = None) -> List[SupplierInfo]:
         """
         在指定文档中搜索供应商
@@ -1002,15 +1871,8 @@ class KnowledgeService:
                 }
                 
                 api_start = time.time()
-                if self.collection_name:
-                    search_params["collection_name"] = self.collection_name
-                    log_with_time(f"[供应商搜索-{doc_name}] 开始调用知识库API...")
-                    response = self.service.search_knowledge(**search_params)
-                else:
-                    search_params["collection_name"] = "default"
-                    search_params["resource_id"] = self.collection_id
-                    log_with_time(f"[供应商搜索-{doc_name}] 开始调用知识库API...")
-                    response = self.service.search_knowledge(**search_params)
+                log_with_time(f"[供应商搜索-{doc_name}] 开始调用知识库API...")
+                response = self._search_knowledge(search_params, site="supplier")
                 api_elapsed = time.time() - api_start
                 log_with_time(f"[供应商搜索-{doc_name}] API调用完成 (耗时: {api_elapsed:.2f}秒)")
             except AttributeError:
@@ -1105,6 +1967,94 @@ class KnowledgeService:
         return suppliers
     
     def _extract_suppliers_batch(self, points_with_info: List[tuple], product_name: str = None, product_features: str = None) -> List[SupplierInfo]:
+        """
+        批量从多个structured类型的points中提取供应商信息
+        定商表格按列名直接解析供应商字段，LLM只对解析结果判断相关性（提示词很短）；
+        列名无法识别的points仍交给LLM批量提取
+        
+        Args:
+            points_with_info: [(point, slice_id, doc_id, doc_name), ...] 元组列表
+            product_name: 产品名称（用于判断相关性）
+            product_features: 产品特征（用于判断相关性）
+            
+        Returns:
+            供应商信息列表（已过滤，只返回相关的供应商）
+        """
+        if not points_with_info or not Config.SUPPLIER_FIELD_MAPPING_ENABLED:
+            return self._extract_suppliers_batch_llm(points_with_info, product_name, product_features)
+        
+        parse_start = time.time()
+        parsed, unparsed = self._parse_suppliers_from_fields(points_with_info)
+        log_with_time(
+            f"[供应商批量提取] 按列名解析完成 (耗时: {(time.time() - parse_start) * 1000:.1f}毫秒)，"
+            f"解析出 {len(parsed)} 个供应商，{len(unparsed)} 个chunk需要LLM提取"
+        )
+        if not parsed:
+            return self._extract_suppliers_batch_llm(points_with_info, product_name, product_features)
+        
+        if product_name and Config.ARK_API_KEY:
+            # 先按字面匹配度预标记，LLM判断失败时按预标记结果返回
+            candidates = self._rank_suppliers_by_terms(parsed, product_name, drop_unmatched=False)
+            candidates = self._rank_candidates(candidates, product_name, product_features)
+        else:
+            candidates = self._rank_suppliers_by_terms(parsed, product_name)
+        if unparsed:
+            candidates.extend(self._extract_suppliers_batch_llm(unparsed, product_name, product_features))
+        if not product_name:
+            return candidates
+        return self._select_relevant_suppliers(candidates)
+    
+    def _parse_suppliers_from_fields(self, points_with_info: List[tuple]) -> tuple:
+        """
+        按列名映射解析structured points中的供应商字段（不调用LLM）
+        返回 (供应商列表, 无法解析的points)，同一chunk中的同名供应商只保留一个
+        """
+        suppliers = []
+        unparsed = []
+        seen = set()
+        for point, slice_id, doc_id, doc_name in points_with_info:
+            table_fields = get_table_fields(point)
+            mapped = map_table_fields(table_fields) if table_fields else {}
+            supplier_name = mapped.get("supplier_name")
+            if not supplier_name:
+                unparsed.append((point, slice_id, doc_id, doc_name))
+                continue
+            key = (supplier_name, slice_id)
+            if key in seen:
+                continue
+            seen.add(key)
+            content = point.get('content', '') if isinstance(point, dict) else getattr(point, 'content', '')
+            suppliers.append(SupplierInfo(
+                name=supplier_name,
+                source="knowledge_base",
+                doc_id=doc_id,
+                doc_name=doc_name,
+                slice_id=slice_id,
+                content=build_original_content(table_fields, content or ''),  # 查看原文时显示所有字段
+                product_name=mapped.get("product_name"),
+                supplier_type=mapped.get("supplier_type"),
+                sub_category_name=mapped.get("sub_category_name"),
+                sub_category_code=mapped.get("sub_category_code"),
+                valid_from=mapped.get("valid_from"),
+                valid_to=mapped.get("valid_to"),
+                contact_person=mapped.get("contact_person")
+            ))
+        return suppliers, unparsed
+    
+    def _rank_suppliers_by_terms(self, suppliers: List[SupplierInfo], product_name: str = None, drop_unmatched: bool = True) -> List[SupplierInfo]:
+        """按产品名称与物资类别/产品名称的字面匹配度标记相关性（drop_unmatched为False时不匹配的标记为可能相关）"""
+        if not product_name:
+            return suppliers
+        ranked = []
+        for supplier in suppliers:
+            score = term_match_score(product_name, [supplier.sub_category_name, supplier.product_name])
+            if score >= 0.999:
+                ranked.append(supplier.model_copy(update={"relevance": "强相关"}))
+            elif score >= Config.SUPPLIER_CATALOG_MIN_SCORE or not drop_unmatched:
+                ranked.append(supplier.model_copy(update={"relevance": "可能相关"}))
+        return ranked
+    
+    def _extract_suppliers_batch_llm(self, points_with_info: List[tuple], product_name: str = None, product_features: str = None) -> List[SupplierInfo]:
         """
         批量从多个structured类型的points中提取供应商信息
         一次性调用LLM，大幅减少调用次数
@@ -1139,27 +2089,23 @@ class KnowledgeService:
                         suppliers.append(supplier)
                 return suppliers
             
-            client = OpenAI(
-                api_key=api_key,
-                base_url=Config.ARK_BASE_URL,
-                timeout=180.0,  # 设置180秒超时
-            )
-            
-            # 构建所有表格数据的文本
+            # 构建所有表格数据的文本（每个表格整块装入，超出token预算的表格整体跳过，不再从中间截断）
             MAX_FIELD_LENGTH = 200  # 每个字段值最多200字符
-            MAX_TABLE_LENGTH = 500  # 每个表格最多500字符
-            MAX_TOTAL_LENGTH = 8000  # 总长度最多8000字符（支持更多表格）
             
-            tables_data = []
+            table_indexes = []
+            table_texts = []
+            table_scores = []
             for idx, (point, slice_id, doc_id, doc_name) in enumerate(points_with_info):
                 # 获取表格字段和内容（兼容dict和对象）
                 if isinstance(point, dict):
                     table_fields = point.get('table_chunk_fields', [])
                     content = point.get('content', '')
+                    score = point.get('score')
                 else:
                     # Point对象
                     table_fields = getattr(point, 'table_chunk_fields', [])
                     content = getattr(point, 'content', '')
+                    score = getattr(point, 'score', None)
                     # 如果table_chunk_fields是对象列表，转换为字典列表
                     if table_fields and not isinstance(table_fields[0] if table_fields else None, dict):
                         table_fields = [{'field_value': str(field)} for field in table_fields]
@@ -1167,8 +2113,8 @@ class KnowledgeService:
                 if not table_fields and not content:
                     continue
                 
-                # 构建单个表格数据文本
-                table_data_text = ""
+                # 构建单个表格数据文本：表格字段一行，内容另起一行（超出单表上限时先舍弃内容行）
+                lines = []
                 if table_fields:
                     field_values = []
                     for field in table_fields:
@@ -1178,37 +2124,29 @@ class KnowledgeService:
                             if len(field_value) > MAX_FIELD_LENGTH:
                                 field_value = field_value[:MAX_FIELD_LENGTH] + "..."
                             field_values.append(field_value)
-                    table_data_text = " | ".join(field_values)
-                    
-                    # 限制单个表格长度
-                    if len(table_data_text) > MAX_TABLE_LENGTH:
-                        table_data_text = table_data_text[:MAX_TABLE_LENGTH] + "..."
-                
+                    if field_values:
+                        lines.append(" | ".join(field_values))
                 if content:
-                    content_limited = content[:MAX_FIELD_LENGTH] if len(content) > MAX_FIELD_LENGTH else content
-                    if table_data_text:
-                        combined = f"{table_data_text}\n内容: {content_limited}"
-                        if len(combined) > MAX_TABLE_LENGTH:
-                            combined = table_data_text  # 只保留表格数据
-                        table_data_text = combined
-                    else:
-                        table_data_text = content_limited[:MAX_TABLE_LENGTH]
+                    lines.append(f"内容: {content}" if lines else content)
                 
-                if table_data_text:
-                    tables_data.append(f"表格{idx+1}:\n{table_data_text}")
+                if lines:
+                    table_indexes.append(idx)
+                    table_texts.append("\n".join(lines))
+                    table_scores.append(score)
             
-            if not tables_data:
+            if not table_texts:
                 log_with_time(f"[供应商批量提取] 没有有效的表格数据")
                 return suppliers
             
+            packed = pack_context(table_indexes, table_texts, budget_for("supplier_extract"),
+                                  scores=table_scores, max_chunk_tokens=chunk_limit_for("supplier_extract"))
+            log_with_time(f"[供应商批量提取] 表格数据装箱: {packed.summary()}")
+            # 表格编号保持为points_with_info中的位置（table_index），按原顺序排列
+            tables_data = [f"表格{idx+1}:\n{text}" for idx, text in sorted(zip(packed.items, packed.texts))]
+            
             # 合并所有表格数据
             all_tables_text = "\n\n".join(tables_data)
             
-            # 如果总长度超过限制，截断
-            if len(all_tables_text) > MAX_TOTAL_LENGTH:
-                all_tables_text = all_tables_text[:MAX_TOTAL_LENGTH] + "..."
-                log_with_time(f"[供应商批量提取] 表格数据总长度超过限制，已截断")
-            
             # 构建产品查询信息（用于判断相关性）
             product_query = product_name or ""
             if product_features:
@@ -1289,207 +2227,90 @@ class KnowledgeService:
             
             log_with_time(f"[供应商批量提取] 开始调用LLM，表格数量: {len(tables_data)}，总长度: {len(all_tables_text)} 字符")
             
-            # 调用AI批量解析
+            # 调用AI批量解析（流式输出，每个供应商对象一闭合就解析，输出被截断时保留已解析的部分）
             max_retries = 2
             retry_delay = 2
+            messages = [
+                {"role": "system", "content": "你是一个专业的数据提取助手，能够准确从多个表格数据中批量提取供应商信息，并判断供应商与产品的相关性。"},
+                {"role": "user", "content": prompt}
+            ]
             
             for attempt in range(max_retries + 1):
+                llm_start = time.time()
+                parser = JSONArrayStreamParser()
+                strong_relevant = []
+                possible_relevant = []
+                error = None
                 try:
-                    llm_start = time.time()
-                    response = client.chat.completions.create(
-                        model=Config.ARK_MODEL,
-                        messages=[
-                            {"role": "system", "content": "你是一个专业的数据提取助手，能够准确从多个表格数据中批量提取供应商信息，并判断供应商与产品的相关性。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.1,
-                        max_tokens=2000,  # 增加token数量以支持多个供应商
-                        timeout=180.0  # 设置180秒超时
-                    )
-                    llm_elapsed = time.time() - llm_start
-                    
-                    result_text = response.choices[0].message.content.strip()
-                    
-                    # 解析JSON结果
-                    import json
-                    try:
-                        # 尝试提取JSON部分
-                        if result_text.startswith("```json"):
-                            result_text = result_text.replace("```json", "").replace("```", "").strip()
-                        elif result_text.startswith("```"):
-                            result_text = result_text.replace("```", "").strip()
-                        
-                        # 解析JSON数组
-                        results = json.loads(result_text)
-                        
-                        if not isinstance(results, list):
-                            results = [results] if results else []
-                        
-                        log_with_time(f"[供应商批量提取] LLM调用完成 (耗时: {llm_elapsed:.2f}秒)，返回 {len(results)} 个供应商")
-                        
-                        # 分离强相关和可能相关的供应商
-                        strong_relevant = []
-                        possible_relevant = []
-                        
-                        # 转换为SupplierInfo对象
-                        for result in results:
-                            if not result.get("supplier_name"):
-                                continue
-                            
-                            # 获取对应的slice_id、doc_id和doc_name，以及原始内容
-                            table_index = result.get("table_index", 1) - 1  # 转换为0-based索引
-                            if 0 <= table_index < len(points_with_info):
-                                point, slice_id, doc_id, doc_name = points_with_info[table_index]
-                                
-                                # 使用extract_chunk_info获取完整的point信息
-                                chunk_info = extract_chunk_info(point)
-                                
-                                # 获取原始内容用于查看原文（完整数据，不截断）
-                                if isinstance(point, dict):
-                                    table_fields = point.get('table_chunk_fields', [])
-                                    content = point.get('content', '') or chunk_info.get('content', '')
-                                else:
-                                    table_fields = getattr(point, 'table_chunk_fields', [])
-                                    content = getattr(point, 'content', '') or chunk_info.get('content', '')
-                                
-                                # 构建完整的原始内容（包含字段名和字段值）
-                                original_content_parts = []
-                                
-                                # 优先使用table_fields（如果有）
-                                if table_fields:
-                                    for field in table_fields:
-                                        if isinstance(field, dict):
-                                            field_name = field.get('field_name', '')
-                                            field_value = field.get('field_value', '')
-                                            if field_name and field_value:
-                                                original_content_parts.append(f"{field_name}: {field_value}")
-                                            elif field_value:
-                                                original_content_parts.append(str(field_value))
-                                        else:
-                                            field_str = str(field).strip()
-                                            if field_str:
-                                                original_content_parts.append(field_str)
-                                
-                                # 添加content内容
-                                if content:
-                                    original_content_parts.append(content)
-                                
-                                # 如果仍然为空，尝试从chunk_info获取
-                                if not original_content_parts:
-                                    if chunk_info.get('content'):
-                                        original_content_parts.append(chunk_info['content'])
-                                    if chunk_info.get('md_content'):
-                                        original_content_parts.append(f"Markdown:\n{chunk_info['md_content']}")
-                                    if chunk_info.get('html_content'):
-                                        original_content_parts.append(f"HTML:\n{chunk_info['html_content']}")
-                                
-                                original_content = "\n".join(original_content_parts) if original_content_parts else ""
-                                
-                                # 如果仍然为空，尝试序列化整个point对象（作为最后手段）
-                                if not original_content:
-                                    try:
-                                        import json
-                                        if isinstance(point, dict):
-                                            original_content = json.dumps(point, ensure_ascii=False, indent=2)
-                                        else:
-                                            # 尝试将对象转换为字典
-                                            point_dict = {}
-                                            if hasattr(point, '__dict__'):
-                                                point_dict = point.__dict__
-                                            elif hasattr(point, '__slots__'):
-                                                point_dict = {slot: getattr(point, slot, None) for slot in point.__slots__}
-                                            if point_dict:
-                                                original_content = json.dumps(point_dict, ensure_ascii=False, indent=2, default=str)
-                                            else:
-                                                original_content = str(point)
-                                    except Exception as e:
-                                        log_with_time(f"[供应商批量提取] 序列化point失败: {e}")
-                                        original_content = f"无法提取原始内容，point类型: {type(point)}"
-                            else:
-                                slice_id = ""
-                                doc_id = ""
-                                doc_name = ""
-                                original_content = ""
-                            
-                            # 获取相关性标记
-                            relevance = result.get("relevance", "可能相关")
-                            
-                            # 记录原始内容长度，用于调试
-                            content_len = len(original_content) if original_content else 0
-                            log_with_time(f"[供应商批量提取] 供应商 {result['supplier_name']}, content长度: {content_len}, slice_id: {slice_id[:20] if slice_id else 'N/A'}...")
-                            
-                            supplier = SupplierInfo(
-                                name=result["supplier_name"],
-                                source="knowledge_base",
-                                doc_id=doc_id,
-                                doc_name=doc_name,
-                                description=None,  # 不再使用description字段
-                                slice_id=slice_id,
-                                content=original_content,  # 保存完整的原始内容，用于查看原文
-                                supplier_type=result.get("supplier_type"),
-                                sub_category_name=result.get("sub_category_name"),
-                                valid_from=result.get("valid_from"),
-                                valid_to=result.get("valid_to"),
-                                contact_person=result.get("contact_person"),
-                                relevance=relevance  # 添加相关性标记
-                            )
-                            
-                            # 根据相关性分类
-                            if relevance == "强相关":
-                                strong_relevant.append(supplier)
-                            else:
-                                possible_relevant.append(supplier)
-                        
-                        # 返回逻辑：优先返回强相关的，如果没有则返回top 5可能相关的
-                        if strong_relevant:
-                            suppliers = strong_relevant
-                            log_with_time(f"[供应商批量提取] 找到 {len(strong_relevant)} 个强相关供应商")
-                        else:
-                            suppliers = possible_relevant[:5]  # 返回top 5可能相关的
-                            log_with_time(f"[供应商批量提取] 未找到强相关供应商，返回 {len(suppliers)} 个可能相关的供应商")
-                        
-                        total_elapsed = time.time() - start_time
-                        log_with_time(f"[供应商批量提取] 批量提取完成 (总耗时: {total_elapsed:.2f}秒)，成功提取 {len(suppliers)} 个供应商")
-                        return suppliers
-                        
-                    except json.JSONDecodeError as e:
-                        log_with_time(f"[供应商批量提取] AI返回的JSON解析失败: {e}, 返回内容: {result_text[:500]}")
-                        if attempt < max_retries:
-                            log_with_time(f"[供应商批量提取] 第{attempt + 1}次尝试失败，{retry_delay}秒后重试...")
-                            time.sleep(retry_delay)
+                    for result in self._stream_json_items(
+                        messages,
+                        parser,
+                        task="supplier_extract_batch",
+                        use_cache=True,
+                        log_prefix="[供应商批量提取]"
+                    ):
+                        supplier = self._build_batch_supplier(result, points_with_info)
+                        if supplier is None:
                             continue
-                        # 如果JSON解析失败，回退到逐个提取
-                        log_with_time(f"[供应商批量提取] JSON解析失败，回退到逐个提取方法")
-                        break
-                    
+                        # 根据相关性分类
+                        if supplier.relevance == "强相关":
+                            strong_relevant.append(supplier)
+                        else:
+                            possible_relevant.append(supplier)
                 except Exception as e:
-                    error_msg = str(e)
-                    log_with_time(f"[供应商批量提取] 第{attempt + 1}次尝试失败: {error_msg}")
+                    error = e
+                llm_elapsed = time.time() - llm_start
+                
+                if parser.complete or parser.items:
+                    if not parser.complete:
+                        log_with_time(f"[供应商批量提取] LLM输出不完整 ({error or '数组未闭合'})，保留已解析的 {len(parser.items)} 个供应商")
+                    log_with_time(f"[供应商批量提取] LLM调用完成 (耗时: {llm_elapsed:.2f}秒)，返回 {len(parser.items)} 个供应商")
                     
-                    # 如果是超时错误且还有重试机会，则重试
-                    if ("timeout" in error_msg.lower() or "timed out" in error_msg.lower()) and attempt < max_retries:
-                        log_with_time(f"[供应商批量提取] {retry_delay}秒后重试...")
-                        time.sleep(retry_delay)
-                        continue
+                    # 返回逻辑：优先返回强相关的，如果没有则返回top 5可能相关的
+                    if strong_relevant:
+                        suppliers = strong_relevant
+                        log_with_time(f"[供应商批量提取] 找到 {len(strong_relevant)} 个强相关供应商")
                     else:
-                        # 其他错误，回退到逐个提取
-                        log_with_time(f"[供应商批量提取] LLM调用失败，回退到逐个提取方法")
-                        break
+                        suppliers = possible_relevant[:5]  # 返回top 5可能相关的
+                        log_with_time(f"[供应商批量提取] 未找到强相关供应商，返回 {len(suppliers)} 个可能相关的供应商")
+                    
+                    total_elapsed = time.time() - start_time
+                    log_with_time(f"[供应商批量提取] 批量提取完成 (总耗时: {total_elapsed:.2f}秒)，成功提取 {len(suppliers)} 个供应商")
+                    return suppliers
+                
+                if isinstance(error, DeadlineExceeded) or deadline_expired():
+                    # 请求已截止（或客户端已断开），不再重试，也不回退到逐个提取
+                    log_with_time(f"[供应商批量提取] 请求已截止，停止提取 (总耗时: {time.time() - start_time:.2f}秒)")
+                    return suppliers
+                
+                if error is None:
+                    log_with_time(f"[供应商批量提取] AI返回内容中没有JSON数组: {parser.text[:500]}")
+                    if attempt < max_retries:
+                        delay = backoff_delay(attempt, base=retry_delay)
+                        log_with_time(f"[供应商批量提取] 第{attempt + 1}次尝试失败，{delay:.1f}秒后重试...")
+                        time.sleep(delay)
+                        continue
+                    # 如果JSON解析失败，回退到逐个提取
+                    log_with_time(f"[供应商批量提取] JSON解析失败，回退到逐个提取方法")
+                    break
+                
+                error_msg = str(error)
+                log_with_time(f"[供应商批量提取] 第{attempt + 1}次尝试失败: {error_msg}")
+                
+                # 如果是超时错误且还有重试机会，则重试
+                if ("timeout" in error_msg.lower() or "timed out" in error_msg.lower()) and attempt < max_retries:
+                    delay = backoff_delay(attempt, base=retry_delay)
+                    log_with_time(f"[供应商批量提取] {delay:.1f}秒后重试...")
+                    time.sleep(delay)
+                    continue
+                else:
+                    # 其他错误，回退到逐个提取
+                    log_with_time(f"[供应商批量提取] LLM调用失败，回退到逐个提取方法")
+                    break
             
-            # 如果批量提取失败，回退到逐个提取
+            # 如果批量提取失败，回退到逐个提取（有界并发 + 共享截止时间）
             log_with_time(f"[供应商批量提取] 批量提取失败，使用逐个提取方法作为备选")
-            for point, slice_id, doc_id, doc_name in points_with_info:
-                try:
-                    supplier = self._extract_supplier_from_structured(
-                        point, doc_id, doc_name, slice_id,
-                        product_name=product_name,
-                        product_features=product_features
-                    )
-                    if supplier:
-                        suppliers.append(supplier)
-                except Exception as e:
-                    log_with_time(f"[供应商批量提取] 逐个提取失败: {e}")
-                    continue
+            suppliers = self._extract_suppliers_concurrently(points_with_info, product_name, product_features)
             
             total_elapsed = time.time() - start_time
             log_with_time(f"[供应商批量提取] 完成 (总耗时: {total_elapsed:.2f}秒)，找到 {len(suppliers)} 个供应商")
@@ -1502,7 +2323,168 @@ class KnowledgeService:
             traceback.print_exc()
             return suppliers
     
-    def _extract_supplier_from_structured(self, point: dict, doc_id: str, doc_name: str, slice_id: str = '', product_name: str = None, product_features: str = None) -> Optional[SupplierInfo]:
+    def _build_batch_supplier(self, result: Dict[str, Any], points_with_info: List[tuple]) -> Optional[SupplierInfo]:
+        """把批量提取返回的一个供应商对象转换为SupplierInfo（table_index对应points_with_info中的位置）"""
+        if not result.get("supplier_name"):
+            return None
+
+        # 获取对应的slice_id、doc_id和doc_name，以及原始内容
+        table_index = result.get("table_index", 1) - 1  # 转换为0-based索引
+        if 0 <= table_index < len(points_with_info):
+            point, slice_id, doc_id, doc_name = points_with_info[table_index]
+
+            # 使用extract_chunk_info获取完整的point信息
+            chunk_info = extract_chunk_info(point)
+
+            # 获取原始内容用于查看原文（完整数据，不截断）
+            if isinstance(point, dict):
+                table_fields = point.get('table_chunk_fields', [])
+                content = point.get('content', '') or chunk_info.get('content', '')
+            else:
+                table_fields = getattr(point, 'table_chunk_fields', [])
+                content = getattr(point, 'content', '') or chunk_info.get('content', '')
+
+            # 构建完整的原始内容（包含字段名和字段值）
+            original_content_parts = []
+
+            # 优先使用table_fields（如果有）
+            if table_fields:
+                for field in table_fields:
+                    if isinstance(field, dict):
+                        field_name = field.get('field_name', '')
+                        field_value = field.get('field_value', '')
+                        if field_name and field_value:
+                            original_content_parts.append(f"{field_name}: {field_value}")
+                        elif field_value:
+                            original_content_parts.append(str(field_value))
+                    else:
+                        field_str = str(field).strip()
+                        if field_str:
+                            original_content_parts.append(field_str)
+
+            # 添加content内容
+            if content:
+                original_content_parts.append(content)
+
+            # 如果仍然为空，尝试从chunk_info获取
+            if not original_content_parts:
+                if chunk_info.get('content'):
+                    original_content_parts.append(chunk_info['content'])
+                if chunk_info.get('md_content'):
+                    original_content_parts.append(f"Markdown:\n{chunk_info['md_content']}")
+                if chunk_info.get('html_content'):
+                    original_content_parts.append(f"HTML:\n{chunk_info['html_content']}")
+
+            original_content = "\n".join(original_content_parts) if original_content_parts else ""
+
+            # 如果仍然为空，尝试序列化整个point对象（作为最后手段）
+            if not original_content:
+                try:
+                    import json
+                    if isinstance(point, dict):
+                        original_content = json.dumps(point, ensure_ascii=False, indent=2)
+                    else:
+                        # 尝试将对象转换为字典
+                        point_dict = {}
+                        if hasattr(point, '__dict__'):
+                            point_dict = point.__dict__
+                        elif hasattr(point, '__slots__'):
+                            point_dict = {slot: getattr(point, slot, None) for slot in point.__slots__}
+                        if point_dict:
+                            original_content = json.dumps(point_dict, ensure_ascii=False, indent=2, default=str)
+                        else:
+                            original_content = str(point)
+                except Exception as e:
+                    log_with_time(f"[供应商批量提取] 序列化point失败: {e}")
+                    original_content = f"无法提取原始内容，point类型: {type(point)}"
+        else:
+            slice_id = ""
+            doc_id = ""
+            doc_name = ""
+            original_content = ""
+
+        # 获取相关性标记
+        relevance = result.get("relevance", "可能相关")
+
+        # 记录原始内容长度，用于调试
+        content_len = len(original_content) if original_content else 0
+        log_with_time(f"[供应商批量提取] 供应商 {result['supplier_name']}, content长度: {content_len}, slice_id: {slice_id[:20] if slice_id else 'N/A'}...")
+
+        supplier = SupplierInfo(
+            name=result["supplier_name"],
+            source="knowledge_base",
+            doc_id=doc_id,
+            doc_name=doc_name,
+            description=None,  # 不再使用description字段
+            slice_id=slice_id,
+            content=original_content,  # 保存完整的原始内容，用于查看原文
+            supplier_type=result.get("supplier_type"),
+            sub_category_name=result.get("sub_category_name"),
+            valid_from=result.get("valid_from"),
+            valid_to=result.get("valid_to"),
+            contact_person=result.get("contact_person"),
+            relevance=relevance  # 添加相关性标记
+        )
+        return supplier
+    
+    def _extract_suppliers_concurrently(self, points_with_info: List[tuple], product_name: str = None, product_features: str = None) -> List[SupplierInfo]:
+        """
+        逐个提取的并发版本：每个point一次LLM调用，最多 SUPPLIER_FALLBACK_WORKERS 个同时进行，
+        所有point共享 SUPPLIER_FALLBACK_TIMEOUT 秒（不超过请求剩余时间）的截止时间，返回截止前完成的结果（保持原顺序）
+        每个point在该截止时间的上下文中执行，模型调用的超时不超过剩余的共享预算，截止后未完成的调用不会继续占用线程
+        """
+        start_time = time.time()
+        deadline = start_time + Config.SUPPLIER_FALLBACK_TIMEOUT
+        parent_deadline = current_deadline()
+        if parent_deadline is not None:
+            deadline = min(deadline, parent_deadline.expires_at)
+        executor = get_supplier_fallback_executor()
+        
+        def _extract_one(point, slice_id, doc_id, doc_name):
+            point_start = time.time()
+            try:
+                with request_deadline(max(0.0, deadline - time.time())):
+                    supplier = self._extract_supplier_from_structured(
+                        point, doc_id, doc_name, slice_id,
+                        product_name=product_name,
+                        product_features=product_features,
+                        deadline=deadline
+                    )
+                return supplier, time.time() - point_start, None
+            except Exception as e:
+                return None, time.time() - point_start, e
+        
+        futures = []
+        for point, slice_id, doc_id, doc_name in points_with_info:
+            ctx = contextvars.copy_context()
+            futures.append(executor.submit(ctx.run, _extract_one, point, slice_id, doc_id, doc_name))
+        done, not_done = wait(futures, timeout=max(0.0, deadline - time.time()))
+        for future in not_done:
+            future.cancel()  # 未开始的直接取消；已开始的结果丢弃
+        
+        suppliers = []
+        timings = []
+        for index, future in enumerate(futures, 1):
+            if future not in done:
+                timings.append(f"#{index} 超时")
+                continue
+            supplier, elapsed, error = future.result()
+            if error is not None:
+                timings.append(f"#{index} 失败 {elapsed:.2f}s")
+                log_with_time(f"[供应商逐个提取] 第{index}个chunk提取失败: {error}")
+            elif supplier:
+                timings.append(f"#{index} {elapsed:.2f}s")
+                suppliers.append(supplier)
+            else:
+                timings.append(f"#{index} 无 {elapsed:.2f}s")
+        
+        log_with_time(
+            f"[供应商逐个提取] 完成 (耗时: {time.time() - start_time:.2f}秒)，{len(points_with_info)} 个chunk，"
+            f"{len(done)} 个按时完成，提取到 {len(suppliers)} 个供应商；各chunk耗时: {', '.join(timings)}"
+        )
+        return suppliers
+    
+    def _extract_supplier_from_structured(self, point: dict, doc_id: str, doc_name: str, slice_id: str = '', product_name: str = None, product_features: str = None, deadline: Optional[float] = None) -> Optional[SupplierInfo]:
         """
         从structured类型的数据中提取供应商信息，并同时判断是否与产品相关
         使用AI来解析表格格式，避免编码解析错位问题
@@ -1515,6 +2497,7 @@ class KnowledgeService:
             slice_id: 切片ID
             product_name: 产品名称（用于判断相关性）
             product_features: 产品特征（用于判断相关性）
+            deadline: 截止时间（time.time()），超过后不再重试
         """
         try:
             # 获取表格字段和内容
@@ -1531,11 +2514,7 @@ class KnowledgeService:
                 slice_id = point.get('point_id', point.get('id', point.get('chunk_id', '')))
                 return self._extract_supplier_from_structured_legacy(point, doc_id, doc_name, slice_id)
             
-            client = OpenAI(
-                api_key=api_key,
-                base_url=Config.ARK_BASE_URL,
-                timeout=180.0,  # 设置180秒超时
-            )
+            client = llm_clients.get_client()
             
             # 构建表格数据文本，限制长度
             MAX_FIELD_LENGTH = 200  # 每个字段值最多200字符
@@ -1645,27 +2624,21 @@ class KnowledgeService:
             
             for attempt in range(max_retries + 1):
                 try:
-                    response = client.chat.completions.create(
-                        model=Config.ARK_MODEL,
+                    result_text = self._chat_completion(
+                        client,
                         messages=[
                             {"role": "system", "content": "你是一个专业的数据提取助手，能够准确从表格数据中提取供应商信息，并判断供应商与产品的相关性。"},
                             {"role": "user", "content": prompt}
                         ],
-                        temperature=0.1,
-                        max_tokens=500,
-                        timeout=180.0  # 设置180秒超时
+                        task="supplier_extract",
+                        use_cache=True,
+                        cache_if=is_json_response
                     )
                     
-                    result_text = response.choices[0].message.content.strip()
-                    
                     # 解析JSON结果
-                    import json
                     try:
                         # 尝试提取JSON部分
-                        if result_text.startswith("```json"):
-                            result_text = result_text.replace("```json", "").replace("```", "").strip()
-                        elif result_text.startswith("```"):
-                            result_text = result_text.replace("```", "").strip()
+                        result_text = strip_json_code_fence(result_text)
                         
                         if result_text.lower() == "null":
                             return None
@@ -1698,10 +2671,10 @@ class KnowledgeService:
                         )
                     except json.JSONDecodeError as e:
                         print(f"[供应商提取] AI返回的JSON解析失败: {e}, 返回内容: {result_text}")
-                        if attempt < max_retries:
-                            print(f"[供应商提取] 第{attempt + 1}次尝试失败，{retry_delay}秒后重试...")
-                            import time
-                            time.sleep(retry_delay)
+                        delay = backoff_delay(attempt, base=retry_delay)
+                        if attempt < max_retries and (deadline is None or time.time() + delay < deadline):
+                            print(f"[供应商提取] 第{attempt + 1}次尝试失败，{delay:.1f}秒后重试...")
+                            time.sleep(delay)
                             continue
                         return None
                     
@@ -1710,10 +2683,11 @@ class KnowledgeService:
                     print(f"[供应商提取] 第{attempt + 1}次尝试失败: {error_msg}")
                     
                     # 如果是超时错误且还有重试机会，则重试
-                    if ("timeout" in error_msg.lower() or "timed out" in error_msg.lower()) and attempt < max_retries:
-                        print(f"[供应商提取] {retry_delay}秒后重试...")
-                        import time
-                        time.sleep(retry_delay)
+                    delay = backoff_delay(attempt, base=retry_delay)
+                    if ("timeout" in error_msg.lower() or "timed out" in error_msg.lower()) and attempt < max_retries \
+                            and (deadline is None or time.time() + delay < deadline):
+                        print(f"[供应商提取] {delay:.1f}秒后重试...")
+                        time.sleep(delay)
                         continue
                     else:
                         # 其他错误或重试次数用完，直接返回None
@@ -1802,11 +2776,7 @@ class KnowledgeService:
                 log_with_time(f"[供应商过滤] 未配置ARK_API_KEY，跳过AI过滤")
                 return suppliers
             
-            client = OpenAI(
-                api_key=api_key,
-                base_url=Config.ARK_BASE_URL,
-                timeout=180.0,  # 设置180秒超时
-            )
+            client = llm_clients.get_client()
             
             # 构建供应商信息文本
             prompt_start = time.time()
@@ -1854,31 +2824,25 @@ class KnowledgeService:
             # 调用AI过滤
             ai_start = time.time()
             log_with_time(f"[供应商过滤] 开始调用AI模型过滤 (超时设置: 180秒)...")
-            response = client.chat.completions.create(
-                model=Config.ARK_MODEL,
+            result_text = self._chat_completion(
+                client,
                 messages=[
                     {"role": "system", "content": "你是一个专业的采购助手，能够准确判断供应商与产品的相关性。"},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.1,
-                max_tokens=200,
-                timeout=180.0  # 设置180秒超时
+                task="supplier_filter",
+                use_cache=True,
+                cache_if=is_json_response
             )
             ai_elapsed = time.time() - ai_start
             log_with_time(f"[供应商过滤] AI调用完成 (耗时: {ai_elapsed:.2f}秒)")
-            
-            result_text = response.choices[0].message.content.strip()
             log_with_time(f"[供应商过滤] AI返回内容: {result_text[:200]}...")
             
             # 解析结果
-            import json
             parse_start = time.time()
             try:
                 # 尝试提取JSON部分
-                if result_text.startswith("```json"):
-                    result_text = result_text.replace("```json", "").replace("```", "").strip()
-                elif result_text.startswith("```"):
-                    result_text = result_text.replace("```", "").strip()
+                result_text = strip_json_code_fence(result_text)
                 
                 relevant_indices = json.loads(result_text)
                 
@@ -1943,97 +2907,282 @@ class KnowledgeService:
             包含答案和参考chunk的字典
         """
         try:
-            # 1. 从知识库搜索相关内容（获取更多结果用于总结）
-            # 构建post_processing参数（根据SDK官方示例）
-            post_processing = {
-                "rerank_switch": Config.KNOWLEDGE_RERANK_SWITCH,
-                "rerank_model": Config.KNOWLEDGE_RERANK_MODEL,
-                "rerank_only_chunk": False,
-                "chunk_group": True,
-                "get_attachment_link": True,  # 获取图片链接
-            }
+            chunks = self._search_qa_chunks(question)
             
-            if Config.KNOWLEDGE_RETRIEVE_COUNT:
-                post_processing["retrieve_count"] = Config.KNOWLEDGE_RETRIEVE_COUNT
+            if not chunks:
+                return {
+                    "answer": "抱歉，在知识库中未找到相关信息。",
+                    "references": []
+                }
             
-            search_params = {
-                "query": question,
-                "limit": 5,  # 知识库问答只返回top5
-                "dense_weight": Config.KNOWLEDGE_DENSE_WEIGHT,
-                "post_processing": post_processing,
-            }
+            # 3. 使用Ark模型总结答案
+            api_key = Config.ARK_API_KEY
+            if not api_key:
+                # 如果没有配置API key，直接返回chunk内容
+                # 注意：知识库API已经限制返回5个chunk，无需再次截取
+                answer = f"找到 {len(chunks)} 条相关信息，请查看下方参考内容。"
+                return {
+                    "answer": answer,
+                    "references": chunks
+                }
             
-            if self.collection_name:
-                search_params["collection_name"] = self.collection_name
-                response = self.service.search_knowledge(**search_params)
-            else:
-                search_params["collection_name"] = "default"
-                search_params["resource_id"] = self.collection_id
-                response = self.service.search_knowledge(**search_params)
+            client = llm_clients.get_client()
             
-            # 2. 解析搜索结果，获取所有chunk（使用与search_specs相同的解析逻辑）
-            chunks = []
-            print(f"[问答] 搜索结果类型: {type(response)}")
+            messages = self._build_qa_messages(question, chunks)
+
+            # 调用Ark模型生成答案
+            answer = self._chat_completion(client, messages, task="qa")
             
-            if response:
-                # 如果响应是列表
-                if isinstance(response, list):
-                    print(f"[问答] 响应是列表，长度: {len(response)}")
-                    for point in response:
+            # 返回答案和参考chunk
+            # 注意：知识库API已经限制返回5个chunk，无需再次截取
+            return {
+                "answer": answer,
+                "references": chunks
+            }
+            
+        except Exception as e:
+            print(f"[问答] 问答功能失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return {
+                "answer": f"抱歉，处理您的问题时出现错误：{str(e)}",
+                "references": []
+            }
+    
+    def answer_question_stream(self, question: str):
+        """
+        流式项目专家问答（生成器）
+        先产出检索到的参考chunk，再逐段产出答案（标签对保持完整），最后产出完整结果：
+            ("references", List[dict])
+            ("delta", str)              # 零到多次
+            ("error", str)              # 模型调用失败时
+            ("done", {"answer": str, "references": List[dict]})
+        """
+        start_time = time.time()
+        try:
+            chunks = self._search_qa_chunks(question)
+        except Exception as e:
+            print(f"[问答-流式] 检索失败: {e}")
+            answer = f"抱歉，处理您的问题时出现错误：{str(e)}"
+            yield "error", str(e)
+            yield "delta", answer
+            yield "done", {"answer": answer, "references": []}
+            return
+        log_with_time(f"[问答-流式] 检索完成 (耗时: {time.time() - start_time:.2f}秒)，找到 {len(chunks)} 个chunk")
+        yield "references", chunks
+        
+        if not chunks:
+            answer = "抱歉，在知识库中未找到相关信息。"
+            yield "delta", answer
+            yield "done", {"answer": answer, "references": []}
+            return
+        if not Config.ARK_API_KEY:
+            answer = f"找到 {len(chunks)} 条相关信息，请查看下方参考内容。"
+            yield "delta", answer
+            yield "done", {"answer": answer, "references": chunks}
+            return
+        
+        messages = self._build_qa_messages(question, chunks)
+        parts = []
+        try:
+            for delta in self._stream_chat_completion(messages, task="qa",
+                                                      log_prefix="[问答-流式]", start_time=start_time):
+                parts.append(delta)
+                yield "delta", delta
+        except Exception as e:
+            print(f"[问答-流式] 问答功能失败: {e}")
+            yield "error", str(e)
+            if not parts:
+                answer = f"抱歉，处理您的问题时出现错误：{str(e)}"
+                yield "delta", answer
+                yield "done", {"answer": answer, "references": chunks}
+                return
+        
+        answer = "".join(parts).strip()
+        log_with_time(f"[问答-流式] 回答完成 (总耗时: {time.time() - start_time:.2f}秒)，答案长度: {len(answer)} 字符")
+        yield "done", {"answer": answer, "references": chunks}
+    
+    def _search_qa_chunks(self, question: str) -> List[Dict[str, Any]]:
+        """项目专家问答：检索知识库并解析为chunk字典列表（answer_question和answer_question_stream共用）"""
+        # 1. 从知识库搜索相关内容（获取更多结果用于总结）
+        # 构建post_processing参数（根据SDK官方示例）
+        post_processing = {
+            "rerank_switch": Config.KNOWLEDGE_RERANK_SWITCH,
+            "rerank_model": Config.KNOWLEDGE_RERANK_MODEL,
+            "rerank_only_chunk": False,
+            "chunk_group": True,
+            "get_attachment_link": True,  # 获取图片链接
+        }
+        
+        if Config.KNOWLEDGE_RETRIEVE_COUNT:
+            post_processing["retrieve_count"] = Config.KNOWLEDGE_RETRIEVE_COUNT
+        
+        search_params = {
+            "query": question,
+            "limit": 5,  # 知识库问答只返回top5
+            "dense_weight": Config.KNOWLEDGE_DENSE_WEIGHT,
+            "post_processing": post_processing,
+        }
+        
+        response = self._search_knowledge(search_params, site="qa")
+        
+        # 2. 解析搜索结果，获取所有chunk（使用与search_specs相同的解析逻辑）
+        chunks = []
+        print(f"[问答] 搜索结果类型: {type(response)}")
+        
+        if response:
+            # 如果响应是列表
+            if isinstance(response, list):
+                print(f"[问答] 响应是列表，长度: {len(response)}")
+                for point in response:
+                    # 处理Point对象
+                    if hasattr(point, 'content'):
+                        doc_name = None
+                        if hasattr(point, 'doc_info') and point.doc_info:
+                            if hasattr(point.doc_info, 'doc_name'):
+                                doc_name = point.doc_info.doc_name
+                            elif hasattr(point.doc_info, 'name'):
+                                doc_name = point.doc_info.name
+                            elif isinstance(point.doc_info, dict):
+                                doc_name = point.doc_info.get('doc_name', point.doc_info.get('name', ''))
+                        
+                        # 提取图片链接 - 尝试多种可能的字段名
+                        image_url = None
+                        chunk_type = None
+                        
+                        # 打印所有可用属性以便调试
+                        point_attrs = [attr for attr in dir(point) if not attr.startswith('_')]
+                        print(f"[问答调试] Point对象属性: {point_attrs}")
+                        
+                        # 尝试多种可能的字段名
+                        if hasattr(point, 'chunk_attachment') and point.chunk_attachment:
+                            print(f"[问答调试] 找到 chunk_attachment: {point.chunk_attachment}")
+                            if isinstance(point.chunk_attachment, list) and len(point.chunk_attachment) > 0:
+                                attachment = point.chunk_attachment[0]
+                                print(f"[问答调试] attachment: {attachment}, 类型: {type(attachment)}")
+                                if isinstance(attachment, dict):
+                                    image_url = attachment.get('link', '')
+                                    print(f"[问答调试] 从字典提取 image_url: {image_url}")
+                                elif hasattr(attachment, 'link'):
+                                    image_url = attachment.link
+                                    print(f"[问答调试] 从对象提取 image_url: {image_url}")
+                        
+                        # 尝试其他可能的字段名
+                        if not image_url:
+                            for attr_name in ['attachment_link', 'image_link', 'attachment', 'attachments']:
+                                if hasattr(point, attr_name):
+                                    attr_value = getattr(point, attr_name)
+                                    print(f"[问答调试] 找到 {attr_name}: {attr_value}")
+                                    if isinstance(attr_value, str) and attr_value:
+                                        image_url = attr_value
+                                        break
+                                    elif isinstance(attr_value, list) and len(attr_value) > 0:
+                                        if isinstance(attr_value[0], dict):
+                                            image_url = attr_value[0].get('link', '')
+                                        elif hasattr(attr_value[0], 'link'):
+                                            image_url = attr_value[0].link
+                                        if image_url:
+                                            break
+                        
+                        if hasattr(point, 'chunk_type'):
+                            chunk_type = point.chunk_type
+                        
+                        # 处理内容编码问题
+                        content = point.content or ''
+                        if isinstance(content, bytes):
+                            try:
+                                content = content.decode('utf-8')
+                            except:
+                                try:
+                                    content = content.decode('gbk')
+                                except:
+                                    content = content.decode('utf-8', errors='ignore')
+                        
+                        chunk = {
+                            "content": content,
+                            "slice_id": point.point_id or point.chunk_id or '',
+                            "doc_id": point.doc_id or '',
+                            "doc_name": doc_name,
+                            "image_url": image_url,
+                            "chunk_type": chunk_type
+                        }
+                        print(f"[问答调试] 创建的 chunk: image_url={image_url}, chunk_type={chunk_type}, content长度={len(content)}")
+                        if chunk["content"] or chunk["image_url"]:
+                            chunks.append(chunk)
+                    elif isinstance(point, dict):
+                        chunk = self._parse_search_result_item(point)
+                        if chunk:
+                            chunks.append(chunk)
+            # 如果响应是字典
+            elif isinstance(response, dict):
+                print(f"[问答] 响应是字典，键: {list(response.keys())}")
+                # 尝试多种可能的键名，包括result_list
+                points = response.get('result_list', response.get('points', response.get('data', response.get('chunks', response.get('results', [])))))
+                if isinstance(points, list):
+                    print(f"[问答] points是列表，包含 {len(points)} 个项目")
+                    for point in points:
                         # 处理Point对象
                         if hasattr(point, 'content'):
                             doc_name = None
                             if hasattr(point, 'doc_info') and point.doc_info:
-                                if hasattr(point.doc_info, 'doc_name'):
-                                    doc_name = point.doc_info.doc_name
-                                elif hasattr(point.doc_info, 'name'):
-                                    doc_name = point.doc_info.name
-                                elif isinstance(point.doc_info, dict):
+                                if isinstance(point.doc_info, dict):
                                     doc_name = point.doc_info.get('doc_name', point.doc_info.get('name', ''))
+                                elif hasattr(point.doc_info, 'doc_name'):
+                                    doc_name = point.doc_info.doc_name
                             
-                            # 提取图片链接 - 尝试多种可能的字段名
+                            # 提取图片链接
                             image_url = None
                             chunk_type = None
-                            
-                            # 打印所有可用属性以便调试
-                            point_attrs = [attr for attr in dir(point) if not attr.startswith('_')]
-                            print(f"[问答调试] Point对象属性: {point_attrs}")
-                            
-                            # 尝试多种可能的字段名
                             if hasattr(point, 'chunk_attachment') and point.chunk_attachment:
-                                print(f"[问答调试] 找到 chunk_attachment: {point.chunk_attachment}")
                                 if isinstance(point.chunk_attachment, list) and len(point.chunk_attachment) > 0:
                                     attachment = point.chunk_attachment[0]
-                                    print(f"[问答调试] attachment: {attachment}, 类型: {type(attachment)}")
                                     if isinstance(attachment, dict):
                                         image_url = attachment.get('link', '')
-                                        print(f"[问答调试] 从字典提取 image_url: {image_url}")
                                     elif hasattr(attachment, 'link'):
                                         image_url = attachment.link
-                                        print(f"[问答调试] 从对象提取 image_url: {image_url}")
-                            
-                            # 尝试其他可能的字段名
-                            if not image_url:
-                                for attr_name in ['attachment_link', 'image_link', 'attachment', 'attachments']:
-                                    if hasattr(point, attr_name):
-                                        attr_value = getattr(point, attr_name)
-                                        print(f"[问答调试] 找到 {attr_name}: {attr_value}")
-                                        if isinstance(attr_value, str) and attr_value:
-                                            image_url = attr_value
-                                            break
-                                        elif isinstance(attr_value, list) and len(attr_value) > 0:
-                                            if isinstance(attr_value[0], dict):
-                                                image_url = attr_value[0].get('link', '')
-                                            elif hasattr(attr_value[0], 'link'):
-                                                image_url = attr_value[0].link
-                                            if image_url:
-                                                break
                             
                             if hasattr(point, 'chunk_type'):
                                 chunk_type = point.chunk_type
                             
+                            # 使用辅助函数提取完整chunk信息
+                            chunk_info = extract_chunk_info(point)
+                            if not chunk_info["doc_name"]:
+                                chunk_info["doc_name"] = doc_name
+                            
+                            chunk = {
+                                "content": chunk_info["content"],
+                                "slice_id": chunk_info["slice_id"],
+                                "doc_id": chunk_info["doc_id"],
+                                "doc_name": chunk_info["doc_name"],
+                                "image_url": chunk_info["image_url"],
+                                "chunk_type": chunk_info["chunk_type"],
+                                "md_content": chunk_info["md_content"],
+                                "html_content": chunk_info["html_content"],
+                                "point_id": chunk_info["point_id"]
+                            }
+                            if chunk["content"] or chunk["image_url"]:
+                                chunks.append(chunk)
+                        elif isinstance(point, dict):
+                            # 提取文档信息
+                            doc_info = point.get('doc_info', {})
+                            if isinstance(doc_info, dict):
+                                doc_name = doc_info.get('doc_name', doc_info.get('name', ''))
+                                doc_id = doc_info.get('doc_id', point.get('doc_id', ''))
+                            else:
+                                doc_name = point.get('doc_name', point.get('document_name', ''))
+                                doc_id = point.get('doc_id', point.get('document_id', ''))
+                            
+                            # 提取图片链接
+                            image_url = None
+                            chunk_type = point.get('chunk_type')
+                            chunk_attachment = point.get('chunk_attachment', [])
+                            if isinstance(chunk_attachment, list) and len(chunk_attachment) > 0:
+                                attachment = chunk_attachment[0]
+                                if isinstance(attachment, dict):
+                                    image_url = attachment.get('link', '')
+                            
                             # 处理内容编码问题
-                            content = point.content or ''
+                            content = point.get('content', point.get('text', point.get('chunk', '')))
                             if isinstance(content, bytes):
                                 try:
                                     content = content.decode('utf-8')
@@ -2043,169 +3192,58 @@ class KnowledgeService:
                                     except:
                                         content = content.decode('utf-8', errors='ignore')
                             
+                            # 使用辅助函数提取完整chunk信息
+                            chunk_info = extract_chunk_info(point)
+                            if not chunk_info["doc_name"]:
+                                chunk_info["doc_name"] = doc_name
+                            
                             chunk = {
-                                "content": content,
-                                "slice_id": point.point_id or point.chunk_id or '',
-                                "doc_id": point.doc_id or '',
-                                "doc_name": doc_name,
-                                "image_url": image_url,
-                                "chunk_type": chunk_type
+                                "content": chunk_info["content"],
+                                "slice_id": chunk_info["slice_id"],
+                                "doc_id": chunk_info["doc_id"],
+                                "doc_name": chunk_info["doc_name"],
+                                "image_url": chunk_info["image_url"],
+                                "chunk_type": chunk_info["chunk_type"],
+                                "md_content": chunk_info["md_content"],
+                                "html_content": chunk_info["html_content"],
+                                "point_id": chunk_info["point_id"]
                             }
-                            print(f"[问答调试] 创建的 chunk: image_url={image_url}, chunk_type={chunk_type}, content长度={len(content)}")
+                            print(f"[问答调试] 创建的 chunk (字典): doc_name={chunk_info['doc_name']}, image_url={chunk_info['image_url']}, chunk_type={chunk_info['chunk_type']}, content长度={len(chunk_info['content'])}")
                             if chunk["content"] or chunk["image_url"]:
                                 chunks.append(chunk)
-                        elif isinstance(point, dict):
-                            chunk = self._parse_search_result_item(point)
-                            if chunk:
-                                chunks.append(chunk)
-                # 如果响应是字典
-                elif isinstance(response, dict):
-                    print(f"[问答] 响应是字典，键: {list(response.keys())}")
-                    # 尝试多种可能的键名，包括result_list
-                    points = response.get('result_list', response.get('points', response.get('data', response.get('chunks', response.get('results', [])))))
-                    if isinstance(points, list):
-                        print(f"[问答] points是列表，包含 {len(points)} 个项目")
-                        for point in points:
-                            # 处理Point对象
-                            if hasattr(point, 'content'):
-                                doc_name = None
-                                if hasattr(point, 'doc_info') and point.doc_info:
-                                    if isinstance(point.doc_info, dict):
-                                        doc_name = point.doc_info.get('doc_name', point.doc_info.get('name', ''))
-                                    elif hasattr(point.doc_info, 'doc_name'):
-                                        doc_name = point.doc_info.doc_name
-                                
-                                # 提取图片链接
-                                image_url = None
-                                chunk_type = None
-                                if hasattr(point, 'chunk_attachment') and point.chunk_attachment:
-                                    if isinstance(point.chunk_attachment, list) and len(point.chunk_attachment) > 0:
-                                        attachment = point.chunk_attachment[0]
-                                        if isinstance(attachment, dict):
-                                            image_url = attachment.get('link', '')
-                                        elif hasattr(attachment, 'link'):
-                                            image_url = attachment.link
-                                
-                                if hasattr(point, 'chunk_type'):
-                                    chunk_type = point.chunk_type
-                                
-                                # 使用辅助函数提取完整chunk信息
-                                chunk_info = extract_chunk_info(point)
-                                if not chunk_info["doc_name"]:
-                                    chunk_info["doc_name"] = doc_name
-                                
-                                chunk = {
-                                    "content": chunk_info["content"],
-                                    "slice_id": chunk_info["slice_id"],
-                                    "doc_id": chunk_info["doc_id"],
-                                    "doc_name": chunk_info["doc_name"],
-                                    "image_url": chunk_info["image_url"],
-                                    "chunk_type": chunk_info["chunk_type"],
-                                    "md_content": chunk_info["md_content"],
-                                    "html_content": chunk_info["html_content"],
-                                    "point_id": chunk_info["point_id"]
-                                }
-                                if chunk["content"] or chunk["image_url"]:
-                                    chunks.append(chunk)
-                            elif isinstance(point, dict):
-                                # 提取文档信息
-                                doc_info = point.get('doc_info', {})
-                                if isinstance(doc_info, dict):
-                                    doc_name = doc_info.get('doc_name', doc_info.get('name', ''))
-                                    doc_id = doc_info.get('doc_id', point.get('doc_id', ''))
-                                else:
-                                    doc_name = point.get('doc_name', point.get('document_name', ''))
-                                    doc_id = point.get('doc_id', point.get('document_id', ''))
-                                
-                                # 提取图片链接
-                                image_url = None
-                                chunk_type = point.get('chunk_type')
-                                chunk_attachment = point.get('chunk_attachment', [])
-                                if isinstance(chunk_attachment, list) and len(chunk_attachment) > 0:
-                                    attachment = chunk_attachment[0]
-                                    if isinstance(attachment, dict):
-                                        image_url = attachment.get('link', '')
-                                
-                                # 处理内容编码问题
-                                content = point.get('content', point.get('text', point.get('chunk', '')))
-                                if isinstance(content, bytes):
-                                    try:
-                                        content = content.decode('utf-8')
-                                    except:
-                                        try:
-                                            content = content.decode('gbk')
-                                        except:
-                                            content = content.decode('utf-8', errors='ignore')
-                                
-                                # 使用辅助函数提取完整chunk信息
-                                chunk_info = extract_chunk_info(point)
-                                if not chunk_info["doc_name"]:
-                                    chunk_info["doc_name"] = doc_name
-                                
-                                chunk = {
-                                    "content": chunk_info["content"],
-                                    "slice_id": chunk_info["slice_id"],
-                                    "doc_id": chunk_info["doc_id"],
-                                    "doc_name": chunk_info["doc_name"],
-                                    "image_url": chunk_info["image_url"],
-                                    "chunk_type": chunk_info["chunk_type"],
-                                    "md_content": chunk_info["md_content"],
-                                    "html_content": chunk_info["html_content"],
-                                    "point_id": chunk_info["point_id"]
-                                }
-                                print(f"[问答调试] 创建的 chunk (字典): doc_name={chunk_info['doc_name']}, image_url={chunk_info['image_url']}, chunk_type={chunk_info['chunk_type']}, content长度={len(chunk_info['content'])}")
-                                if chunk["content"] or chunk["image_url"]:
-                                    chunks.append(chunk)
-            
-            print(f"[问答] 解析后得到 {len(chunks)} 个chunk")
-            
-            if not chunks:
-                return {
-                    "answer": "抱歉，在知识库中未找到相关信息。",
-                    "references": []
-                }
-            
-            # 3. 使用Ark模型总结答案
-            api_key = Config.ARK_API_KEY
-            if not api_key:
-                # 如果没有配置API key，直接返回chunk内容
-                # 注意：知识库API已经限制返回5个chunk，无需再次截取
-                answer = f"找到 {len(chunks)} 条相关信息，请查看下方参考内容。"
-                return {
-                    "answer": answer,
-                    "references": chunks
-                }
-            
-            client = OpenAI(
-                api_key=api_key,
-                base_url=Config.ARK_BASE_URL,
-                timeout=180.0,  # 设置180秒超时
-            )
-            
-            # 构建prompt，包含所有相关chunk（包含point_id）
-            # 注意：知识库API已经限制返回5个chunk，使用全部chunk
-            context_parts = []
-            for i, chunk in enumerate(chunks):  # 使用全部chunk（最多5个）
-                point_id = chunk.get('slice_id', chunk.get('point_id', ''))
-                doc_name = chunk.get('doc_name', '未知文档')
-                content = chunk.get('content', '')[:800]  # 限制每个chunk长度
-                image_url = chunk.get('image_url', '')
-                
-                # 构建参考内容，包含point_id
-                chunk_text = f"point_id: {point_id}\n内容：{content}"
-                if image_url:
-                    chunk_text += f"\n图片链接：{image_url}"
-                context_parts.append(chunk_text)
-            
-            context_text = "\n".join(context_parts)
-            
-            # 构建用户问题，明确是关于采购设备规格要求
-            user_question = question
-            if "规格" not in question and "要求" not in question:
-                # 如果问题中没有明确提到规格或要求，补充说明
-                user_question = f"{question}相关的规格要求有哪些"
-            
-            prompt = f"""# 任务
+        
+        print(f"[问答] 解析后得到 {len(chunks)} 个chunk")
+        return chunks
+    
+    def _build_qa_messages(self, question: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """构建项目专家问答的对话消息"""
+        # 构建prompt，包含所有相关chunk（包含point_id）
+        # 注意：知识库API已经限制返回5个chunk，使用全部chunk
+        context_parts = []
+        packed = pack_context(chunks, [chunk.get('content', '') for chunk in chunks], budget_for("qa"),
+                              scores=[chunk.get('score') for chunk in chunks],
+                              max_chunk_tokens=chunk_limit_for("qa"))
+        log_with_time(f"[问答] 参考资料装箱: {packed.summary()}")
+        for i, (chunk, content) in enumerate(zip(packed.items, packed.texts)):
+            point_id = chunk.get('slice_id', chunk.get('point_id', ''))
+            doc_name = chunk.get('doc_name', '未知文档')
+            image_url = chunk.get('image_url', '')
+            
+            # 构建参考内容，包含point_id
+            chunk_text = f"point_id: {point_id}\n内容：{content}"
+            if image_url:
+                chunk_text += f"\n图片链接：{image_url}"
+            context_parts.append(chunk_text)
+        
+        context_text = "\n".join(context_parts)
+        
+        # 构建用户问题，明确是关于采购设备规格要求
+        user_question = question
+        if "规格" not in question and "要求" not in question:
+            # 如果问题中没有明确提到规格或要求，补充说明
+            user_question = f"{question}相关的规格要求有哪些"
+        
+        prompt = f"""# 任务
 你是一位在线客服，你的首要任务是通过巧妙的话术回复用户的问题，你需要根据「参考资料」来回答接下来的「用户问题」，这些信息在 <context></context> XML tags 之内，你需要根据参考资料给出准确，简洁的回答。
 
 你的回答要满足以下要求：
@@ -2237,36 +3275,10 @@ class KnowledgeService:
 
 # 用户问题
 {user_question}"""
-
-            # 调用Ark模型生成答案
-            response = client.chat.completions.create(
-                model=Config.ARK_MODEL,
-                messages=[
-                    {"role": "system", "content": "你是一位专业的在线客服，能够基于知识库内容准确回答用户问题。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000,
-                timeout=180.0  # 设置180秒超时
-            )
-            
-            answer = response.choices[0].message.content.strip()
-            
-            # 返回答案和参考chunk
-            # 注意：知识库API已经限制返回5个chunk，无需再次截取
-            return {
-                "answer": answer,
-                "references": chunks
-            }
-            
-        except Exception as e:
-            print(f"[问答] 问答功能失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return {
-                "answer": f"抱歉，处理您的问题时出现错误：{str(e)}",
-                "references": []
-            }
+        return [
+            {"role": "system", "content": "你是一位专业的在线客服，能够基于知识库内容准确回答用户问题。"},
+            {"role": "user", "content": prompt}
+        ]
     
     def _parse_search_result_item(self, item: Any) -> Optional[Dict[str, Any]]:
         """解析搜索结果项，提取chunk信息"""
@@ -2366,6 +3378,68 @@ class KnowledgeService:
             traceback.print_exc()
         return None
     
+    def _extract_personnel_from_stream(self, prompt: str, chunks: List[Dict[str, Any]], certificate_doc_id: str, fuzzy_slice_match: bool = False) -> List[Any]:
+        """
+        流式调用模型提取符合条件的人员（回复格式为 {"personnel_list": [...]}）
+        每个人员对象一闭合就转换为PersonnelInfo；输出被截断或调用中途失败时返回已解析的人员
+        fuzzy_slice_match为True时slice_id支持完整格式/短格式的后缀匹配
+        """
+        from models.schemas import PersonnelInfo
+        
+        ai_start = time.time()
+        log_with_time(f"[证书人员查询] [步骤2] 开始流式调用AI模型分析人员信息...")
+        parser = JSONArrayStreamParser(array_key="personnel_list")
+        personnel_list = []
+        try:
+            for person_data in self._stream_json_items(
+                [
+                    {"role": "system", "content": "你是一位专业的人力资源专家，能够准确提取和格式化人员信息。"},
+                    {"role": "user", "content": prompt}
+                ],
+                parser,
+                task="certificate",
+                log_prefix="[证书人员查询] [步骤3]"
+            ):
+                # 找到对应的chunk以获取完整内容
+                slice_id = person_data.get("slice_id", "")
+                chunk_content = ""
+                for chunk in chunks:
+                    chunk_slice_id = chunk.get("slice_id", "")
+                    if chunk_slice_id == slice_id or (
+                        fuzzy_slice_match and slice_id and chunk_slice_id
+                        and (chunk_slice_id.endswith(slice_id) or slice_id.endswith(chunk_slice_id))
+                    ):
+                        chunk_content = chunk.get("content", "")
+                        break
+                
+                personnel_list.append(PersonnelInfo(
+                    name=person_data.get("name", ""),
+                    department=person_data.get("department", ""),
+                    category=person_data.get("category", ""),
+                    certificate_name=person_data.get("certificate_name", ""),
+                    certificate_number=person_data.get("certificate_number", ""),
+                    issue_date=person_data.get("issue_date", ""),
+                    expiry_date=person_data.get("expiry_date", ""),
+                    free_status=person_data.get("free_status", ""),
+                    content=chunk_content or person_data.get("name", ""),
+                    slice_id=slice_id,
+                    doc_id=certificate_doc_id
+                ))
+        except Exception as ai_error:
+            log_with_time(f"[证书人员查询] [步骤2] AI调用失败 (耗时: {time.time() - ai_start:.2f}秒): {ai_error}，保留已解析的 {len(personnel_list)} 个人员")
+            if not personnel_list:
+                import traceback
+                traceback.print_exc()
+            return personnel_list
+        
+        ai_elapsed = time.time() - ai_start
+        if not parser.complete:
+            log_with_time(f"[证书人员查询] [步骤3] AI返回的JSON不完整，保留已解析的 {len(personnel_list)} 个人员，AI返回内容: {parser.text[:500]}")
+        if parser.errors:
+            log_with_time(f"[证书人员查询] [步骤3] {parser.errors} 个人员对象JSON解析失败，已跳过")
+        log_with_time(f"[证书人员查询] [步骤2] AI调用完成 (耗时: {ai_elapsed:.2f}秒)，响应长度: {len(parser.text)} 字符，找到 {len(personnel_list)} 个人员")
+        return personnel_list
+    
     def search_certificate_personnel(
         self, 
         project_time: str,
@@ -2446,13 +3520,7 @@ class KnowledgeService:
             
             search_start = time.time()
             log_with_time(f"[证书人员查询] [步骤1] 开始搜索知识库...")
-            if self.collection_name:
-                search_params["collection_name"] = self.collection_name
-                response = self.service.search_knowledge(**search_params)
-            else:
-                search_params["collection_name"] = "default"
-                search_params["resource_id"] = self.collection_id
-                response = self.service.search_knowledge(**search_params)
+            response = self._search_knowledge(search_params, site="certificate")
             search_elapsed = time.time() - search_start
             log_with_time(f"[证书人员查询] [步骤1] 搜索完成 (耗时: {search_elapsed:.2f}秒)")
             
@@ -2620,13 +3688,7 @@ class KnowledgeService:
             if not chunks:
                 log_with_time(f"[证书人员查询] [步骤1] 未找到指定文档的chunk，尝试搜索所有文档...")
                 # 重新搜索，不限制文档ID
-                if self.collection_name:
-                    search_params["collection_name"] = self.collection_name
-                    response_all = self.service.search_knowledge(**search_params)
-                else:
-                    search_params["collection_name"] = "default"
-                    search_params["resource_id"] = self.collection_id
-                    response_all = self.service.search_knowledge(**search_params)
+                response_all = self._search_knowledge(search_params, site="certificate")
                 
                 # 解析所有结果，但只保留来自指定文档的
                 found_doc_ids = set()
@@ -2783,17 +3845,14 @@ class KnowledgeService:
             prompt_start = time.time()
             log_with_time(f"[证书人员查询] [步骤2] 开始构建AI prompt...")
             
-            client = OpenAI(
-                api_key=api_key,
-                base_url=Config.ARK_BASE_URL,
-                timeout=180.0,  # 设置180秒超时
-            )
-            
             # 构建上下文内容
             context_parts = []
-            for i, chunk in enumerate(chunks[:30]):  # 最多使用30个chunk
+            packed = pack_context(chunks, [chunk.get("content", "") for chunk in chunks], budget_for("certificate"),
+                                  scores=[chunk.get("score") for chunk in chunks],
+                                  max_chunk_tokens=chunk_limit_for("certificate"))
+            log_with_time(f"[证书人员查询] [步骤2] 参考资料装箱: {packed.summary()}")
+            for chunk, content in zip(packed.items, packed.texts):
                 slice_id = chunk.get("slice_id", "")
-                content = chunk.get("content", "")[:1500]  # 增加chunk长度限制以包含更多信息
                 chunk_text = f"point_id: {slice_id}\n内容：{content}"
                 context_parts.append(chunk_text)
             
@@ -2916,93 +3975,10 @@ class KnowledgeService:
             prompt_elapsed = time.time() - prompt_start
             log_with_time(f"[证书人员查询] [步骤2] Prompt构建完成 (耗时: {prompt_elapsed:.2f}秒)，prompt长度: {len(prompt)} 字符")
             
-            # 调用AI模型
-            ai_start = time.time()
-            log_with_time(f"[证书人员查询] [步骤2] 开始调用AI模型分析人员信息 (超时设置: 120秒)...")
-            try:
-                response = client.chat.completions.create(
-                    model=Config.ARK_MODEL,
-                    messages=[
-                        {"role": "system", "content": "你是一位专业的人力资源专家，能够准确提取和格式化人员信息。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.1,  # 降低温度以提高准确性
-                    max_tokens=4000,  # 增加token限制以支持更多人员
-                    timeout=180.0  # 设置180秒超时
-                )
-                ai_elapsed = time.time() - ai_start
-                log_with_time(f"[证书人员查询] [步骤2] AI调用完成 (耗时: {ai_elapsed:.2f}秒)")
-                
-                ai_response = response.choices[0].message.content.strip()
-                log_with_time(f"[证书人员查询] [步骤2] AI响应长度: {len(ai_response)} 字符")
-                
-                # 5. 解析AI返回的JSON
-                import json
-                import re
-                
-                # 尝试提取JSON（可能包含markdown代码块）
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', ai_response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
-                else:
-                    # 尝试直接查找JSON对象
-                    json_match = re.search(r'\{.*"personnel_list".*\}', ai_response, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(0)
-                    else:
-                        json_str = ai_response
-                
-                # 解析JSON
-                parse_start = time.time()
-                log_with_time(f"[证书人员查询] [步骤3] 开始解析AI返回的JSON...")
-                try:
-                    result_data = json.loads(json_str)
-                    personnel_list_data = result_data.get("personnel_list", [])
-                    
-                    # 转换为PersonnelInfo对象
-                    from models.schemas import PersonnelInfo
-                    personnel_list = []
-                    for person_data in personnel_list_data:
-                        # 找到对应的chunk以获取完整内容
-                        slice_id = person_data.get("slice_id", "")
-                        chunk_content = ""
-                        for chunk in chunks:
-                            if chunk.get("slice_id") == slice_id:
-                                chunk_content = chunk.get("content", "")
-                                break
-                        
-                        personnel_info = PersonnelInfo(
-                            name=person_data.get("name", ""),
-                            department=person_data.get("department", ""),
-                            category=person_data.get("category", ""),
-                            certificate_name=person_data.get("certificate_name", ""),
-                            certificate_number=person_data.get("certificate_number", ""),
-                            issue_date=person_data.get("issue_date", ""),
-                            expiry_date=person_data.get("expiry_date", ""),
-                            free_status=person_data.get("free_status", ""),
-                            content=chunk_content or person_data.get("name", ""),
-                            slice_id=slice_id,
-                            doc_id=certificate_doc_id
-                        )
-                        personnel_list.append(personnel_info)
-                    
-                    parse_elapsed = time.time() - parse_start
-                    log_with_time(f"[证书人员查询] [步骤3] JSON解析完成 (耗时: {parse_elapsed:.2f}秒)，找到 {len(personnel_list)} 个人员")
-                    
-                except json.JSONDecodeError as json_error:
-                    parse_elapsed = time.time() - parse_start
-                    log_with_time(f"[证书人员查询] [步骤3] JSON解析失败 (耗时: {parse_elapsed:.2f}秒): {json_error}")
-                    log_with_time(f"[证书人员查询] AI返回内容: {ai_response[:500]}")
-                    # 如果解析失败，返回空列表
-                    personnel_list = []
-                
-            except Exception as ai_error:
-                ai_elapsed = time.time() - ai_start
-                log_with_time(f"[证书人员查询] [步骤2] AI调用失败 (耗时: {ai_elapsed:.2f}秒): {ai_error}")
-                import traceback
-                traceback.print_exc()
-                # 如果AI调用失败，返回空列表
-                personnel_list = []
+            # 调用AI模型（流式输出，每个人员对象一闭合就解析，输出被截断时保留已解析的人员）
+            personnel_list = self._extract_personnel_from_stream(
+                prompt, chunks, certificate_doc_id, fuzzy_slice_match=False
+            )
             
             total_elapsed = time.time() - start_time
             log_with_time(f"[证书人员查询] 查询完成 (总耗时: {total_elapsed:.2f}秒)，找到 {len(personnel_list)} 个匹配人员")
@@ -3064,13 +4040,7 @@ class KnowledgeService:
             
             search_start = time.time()
             log_with_time(f"[证书人员查询] [步骤1] 开始搜索知识库...")
-            if self.collection_name:
-                search_params["collection_name"] = self.collection_name
-                response = self.service.search_knowledge(**search_params)
-            else:
-                search_params["collection_name"] = "default"
-                search_params["resource_id"] = self.collection_id
-                response = self.service.search_knowledge(**search_params)
+            response = self._search_knowledge(search_params, site="certificate")
             search_elapsed = time.time() - search_start
             log_with_time(f"[证书人员查询] [步骤1] 搜索完成 (耗时: {search_elapsed:.2f}秒)")
             
@@ -3253,17 +4223,14 @@ class KnowledgeService:
             prompt_start = time.time()
             log_with_time(f"[证书人员查询] [步骤2] 开始构建AI prompt...")
             
-            client = OpenAI(
-                api_key=api_key,
-                base_url=Config.ARK_BASE_URL,
-                timeout=180.0,
-            )
-            
             # 构建上下文内容
             context_parts = []
-            for i, chunk in enumerate(chunks[:30]):
+            packed = pack_context(chunks, [chunk.get("content", "") for chunk in chunks], budget_for("certificate"),
+                                  scores=[chunk.get("score") for chunk in chunks],
+                                  max_chunk_tokens=chunk_limit_for("certificate"))
+            log_with_time(f"[证书人员查询] [步骤2] 参考资料装箱: {packed.summary()}")
+            for chunk, content in zip(packed.items, packed.texts):
                 slice_id = chunk.get("slice_id", "")
-                content = chunk.get("content", "")[:1500]
                 chunk_text = f"point_id: {slice_id}\n内容：{content}"
                 context_parts.append(chunk_text)
             
@@ -3367,100 +4334,10 @@ class KnowledgeService:
             prompt_elapsed = time.time() - prompt_start
             log_with_time(f"[证书人员查询] [步骤2] Prompt构建完成 (耗时: {prompt_elapsed:.2f}秒)，prompt长度: {len(prompt)} 字符")
             
-            # 调用AI模型
-            ai_start = time.time()
-            log_with_time(f"[证书人员查询] [步骤2] 开始调用AI模型分析人员信息 (超时设置: 120秒)...")
-            try:
-                response = client.chat.completions.create(
-                    model=Config.ARK_MODEL,
-                    messages=[
-                        {"role": "system", "content": "你是一位专业的人力资源专家，能够准确提取和格式化人员信息。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.1,
-                    max_tokens=4000,
-                    timeout=180.0
-                )
-                ai_elapsed = time.time() - ai_start
-                log_with_time(f"[证书人员查询] [步骤2] AI调用完成 (耗时: {ai_elapsed:.2f}秒)")
-                
-                ai_response = response.choices[0].message.content.strip()
-                log_with_time(f"[证书人员查询] [步骤2] AI响应长度: {len(ai_response)} 字符")
-                log_with_time(f"[证书人员查询] [步骤2] AI响应前500字符: {ai_response[:500]}")
-                
-                # 解析AI返回的JSON
-                import json
-                import re
-                
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', ai_response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
-                    log_with_time(f"[证书人员查询] [步骤3] 从markdown代码块中提取JSON")
-                else:
-                    json_match = re.search(r'\{.*"personnel_list".*\}', ai_response, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(0)
-                        log_with_time(f"[证书人员查询] [步骤3] 从文本中提取JSON（包含personnel_list）")
-                    else:
-                        json_str = ai_response
-                        log_with_time(f"[证书人员查询] [步骤3] 使用完整AI响应作为JSON")
-                
-                log_with_time(f"[证书人员查询] [步骤3] 提取的JSON字符串长度: {len(json_str)} 字符")
-                log_with_time(f"[证书人员查询] [步骤3] 提取的JSON前500字符: {json_str[:500]}")
-                
-                parse_start = time.time()
-                log_with_time(f"[证书人员查询] [步骤3] 开始解析AI返回的JSON...")
-                try:
-                    result_data = json.loads(json_str)
-                    log_with_time(f"[证书人员查询] [步骤3] JSON解析成功，result_data类型: {type(result_data)}")
-                    log_with_time(f"[证书人员查询] [步骤3] result_data的keys: {list(result_data.keys()) if isinstance(result_data, dict) else 'N/A'}")
-                    personnel_list_data = result_data.get("personnel_list", [])
-                    log_with_time(f"[证书人员查询] [步骤3] personnel_list_data类型: {type(personnel_list_data)}, 长度: {len(personnel_list_data) if isinstance(personnel_list_data, list) else 'N/A'}")
-                    
-                    from models.schemas import PersonnelInfo
-                    personnel_list = []
-                    for person_data in personnel_list_data:
-                        slice_id = person_data.get("slice_id", "")
-                        # slice_id可能是完整格式（如_sys_auto_gen_doc_id-17526703582802695253-13）或短格式（如17526703582802695253-13）
-                        # 需要匹配两种格式
-                        chunk_content = ""
-                        for chunk in chunks:
-                            chunk_slice_id = chunk.get("slice_id", "")
-                            # 精确匹配或后缀匹配（slice_id可能是完整格式的一部分）
-                            if chunk_slice_id == slice_id or chunk_slice_id.endswith(slice_id) or slice_id.endswith(chunk_slice_id):
-                                chunk_content = chunk.get("content", "")
-                                break
-                        
-                        personnel_info = PersonnelInfo(
-                            name=person_data.get("name", ""),
-                            department=person_data.get("department", ""),
-                            category=person_data.get("category", ""),
-                            certificate_name=person_data.get("certificate_name", ""),
-                            certificate_number=person_data.get("certificate_number", ""),
-                            issue_date=person_data.get("issue_date", ""),
-                            expiry_date=person_data.get("expiry_date", ""),
-                            free_status=person_data.get("free_status", ""),
-                            content=chunk_content or person_data.get("name", ""),
-                            slice_id=slice_id,
-                            doc_id=certificate_doc_id
-                        )
-                        personnel_list.append(personnel_info)
-                    
-                    parse_elapsed = time.time() - parse_start
-                    log_with_time(f"[证书人员查询] [步骤3] JSON解析完成 (耗时: {parse_elapsed:.2f}秒)，找到 {len(personnel_list)} 个人员")
-                    
-                except json.JSONDecodeError as json_error:
-                    parse_elapsed = time.time() - parse_start
-                    log_with_time(f"[证书人员查询] [步骤3] JSON解析失败 (耗时: {parse_elapsed:.2f}秒): {json_error}")
-                    log_with_time(f"[证书人员查询] AI返回内容: {ai_response[:500]}")
-                    personnel_list = []
-                
-            except Exception as ai_error:
-                ai_elapsed = time.time() - ai_start
-                log_with_time(f"[证书人员查询] [步骤2] AI调用失败 (耗时: {ai_elapsed:.2f}秒): {ai_error}")
-                import traceback
-                traceback.print_exc()
-                personnel_list = []
+            # 调用AI模型（流式输出，每个人员对象一闭合就解析，输出被截断时保留已解析的人员）
+            personnel_list = self._extract_personnel_from_stream(
+                prompt, chunks, certificate_doc_id, fuzzy_slice_match=True
+            )
             
             total_elapsed = time.time() - start_time
             log_with_time(f"[证书人员查询] 查询完成 (总耗时: {total_elapsed:.2f}秒)，找到 {len(personnel_list)} 个匹配人员")
@@ -0,0 +1,185 @@
+"""
+LLM结果磁盘缓存
+规格总结、供应商提取、供应商过滤等Ark模型调用单次耗时5-60秒，
+结果保存在SQLite中，重复查询或后端重启后可以直接返回缓存内容。
+缓存键为 (model, messages, temperature, max_tokens) 的哈希值。
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.config import Config
+
+# 签名图片链接的查询参数每次检索都会变化，不参与缓存键计算
+_URL_QUERY_PATTERN = re.compile(r"(https?://[^\s?\"'<>]+)\?[^\s\"'<>]*")
+
+
+class LLMResultCache:
+    """LLM结果缓存（SQLite持久化，按总大小LRU淘汰，按任务设置TTL）"""
+
+    def __init__(self, db_path: str, max_bytes: int, task_ttls: Dict[str, float], default_ttl: float):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.task_ttls = task_ttls
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """延迟打开数据库连接并建表"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    task TEXT NOT NULL,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache(expires_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int) -> str:
+        """根据模型、prompt、temperature、max_tokens生成缓存键"""
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        payload = _URL_QUERY_PATTERN.sub(r"\1", payload)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，未命中或已过期返回None"""
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._get_conn()
+                row = conn.execute(
+                    "SELECT response, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                response, expires_at = row
+                if expires_at < now:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return response
+            except sqlite3.Error as e:
+                print(f"[LLM缓存] 读取缓存失败: {e}")
+                self.misses += 1
+                return None
+
+    def set(self, key: str, task: str, model: str, response: str):
+        """写入缓存，超过总大小限制时按最近访问时间淘汰"""
+        now = time.time()
+        ttl = self.task_ttls.get(task, self.default_ttl)
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            try:
+                conn = self._get_conn()
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO llm_cache
+                        (key, task, model, response, size, created_at, expires_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (key, task, model, response, size, now, now + ttl, now),
+                )
+                self._evict(conn, now)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"[LLM缓存] 写入缓存失败: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """删除过期条目；总大小仍超限时按LRU淘汰到上限的90%"""
+        conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self, task: Optional[str] = None) -> int:
+        """清空缓存（可只清空指定任务），返回删除的条目数"""
+        with self._lock:
+            conn = self._get_conn()
+            if task:
+                cursor = conn.execute("DELETE FROM llm_cache WHERE task = ?", (task,))
+            else:
+                cursor = conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            try:
+                conn = self._get_conn()
+                rows = conn.execute(
+                    "SELECT task, COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache GROUP BY task"
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"[LLM缓存] 读取统计失败: {e}")
+                rows = []
+            total = self.hits + self.misses
+            return {
+                "enabled": Config.LLM_CACHE_ENABLED,
+                "db_path": self.db_path,
+                "entries": sum(row[1] for row in rows),
+                "size_bytes": sum(row[2] for row in rows),
+                "max_bytes": self.max_bytes,
+                "tasks": {row[0]: {"entries": row[1], "size_bytes": row[2]} for row in rows},
+                "task_ttls": self.task_ttls,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+# 进程内共享的LLM结果缓存
+llm_cache = LLMResultCache(
+    db_path=Config.LLM_CACHE_PATH,
+    max_bytes=Config.LLM_CACHE_MAX_BYTES,
+    task_ttls=Config.LLM_CACHE_TASK_TTLS,
+    default_ttl=Config.LLM_CACHE_DEFAULT_TTL,
+)
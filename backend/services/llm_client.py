@@ -0,0 +1,113 @@
+"""
+Ark模型客户端
+之前每次调用都新建 OpenAI(api_key=..., base_url=..., timeout=180.0)，连接池和TLS会话随之丢弃，
+每次调用都要重新握手。这里在进程内共享一个带连接池的同步客户端和一个异步客户端，
+并按任务类型（规格总结、供应商提取、问答等）提供超时配置。
+SDK自身的自动重试已关闭，限流重试见rate_limiter和KnowledgeService._backoff_if_rate_limited。
+"""
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from utils.config import Config
+
+
+class LLMClientManager:
+    """共享的Ark模型客户端（同步 + 异步，keep-alive连接池）"""
+
+    def __init__(self, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float,
+                 connect_timeout: float, timeout_profiles: Dict[str, float]):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.timeout_profiles = timeout_profiles
+        self._lock = threading.Lock()
+        self._client: Optional[OpenAI] = None
+        self._async_client: Optional[AsyncOpenAI] = None
+        self.clients_created = 0
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout_for(self, task: str) -> httpx.Timeout:
+        """获取任务类型对应的超时设置（连接超时单独限制）"""
+        return self.make_timeout(self.timeout_profiles.get(task, self.timeout_profiles.get("default", 180.0)))
+
+    def make_timeout(self, seconds: float) -> httpx.Timeout:
+        """按总超时秒数构建超时设置（连接超时单独限制）"""
+        return httpx.Timeout(seconds, connect=min(self.connect_timeout, seconds))
+
+    def get_client(self) -> OpenAI:
+        """获取共享的同步客户端（线程安全，可在线程池中并发使用）"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAI(
+                        api_key=Config.ARK_API_KEY,
+                        base_url=Config.ARK_BASE_URL,
+                        timeout=self.timeout_for("default"),
+                        max_retries=0,  # 重试由调用方经限流器进行，SDK内部重试会绕过限流形成重试风暴
+                        http_client=httpx.Client(limits=self._limits(), timeout=self.timeout_for("default")),
+                    )
+                    self.clients_created += 1
+        return self._client
+
+    def get_async_client(self) -> AsyncOpenAI:
+        """获取共享的异步客户端（在uvicorn事件循环中使用）"""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = AsyncOpenAI(
+                        api_key=Config.ARK_API_KEY,
+                        base_url=Config.ARK_BASE_URL,
+                        timeout=self.timeout_for("default"),
+                        max_retries=0,  # 重试由调用方经限流器进行，SDK内部重试会绕过限流形成重试风暴
+                        http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout_for("default")),
+                    )
+                    self.clients_created += 1
+        return self._async_client
+
+    def close(self):
+        """关闭同步客户端（异步客户端需在事件循环中调用aclose）"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self):
+        """关闭全部客户端"""
+        self.close()
+        with self._lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """客户端配置与状态"""
+        return {
+            "sync_client": self._client is not None,
+            "async_client": self._async_client is not None,
+            "clients_created": self.clients_created,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "connect_timeout": self.connect_timeout,
+            "timeout_profiles": dict(self.timeout_profiles),
+        }
+
+
+# 进程内共享的Ark模型客户端
+llm_clients = LLMClientManager(
+    max_connections=Config.LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY,
+    connect_timeout=Config.LLM_CONNECT_TIMEOUT,
+    timeout_profiles=Config.LLM_TIMEOUT_PROFILES,
+)
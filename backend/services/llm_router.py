@@ -0,0 +1,203 @@
+"""
+按任务路由Ark模型
+表格JSON提取、相关性判断、带引用的规格总结、证书人员筛选对模型的要求差别很大，之前全部使用同一个ARK_MODEL。
+这里维护任务 -> (模型, 温度, max_tokens, 超时, 延迟SLO) 的路由表，并按任务/模型统计调用次数、延迟和token用量，
+便于把简单任务路由到更快的模型。主模型最近的p90延迟超过SLO（或调用超时）时，在冷却期内改用备用模型。
+"""
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import Config
+
+
+def log_with_time(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[{timestamp}] {message}")
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """判断异常是否为超时（openai/httpx的超时异常类型较多，按名称和消息判断）"""
+    text = f"{type(error).__name__} {error}".lower()
+    return "timeout" in text or "timed out" in text
+
+
+class LLMRoute:
+    """单个任务的路由配置"""
+
+    def __init__(self, task: str, model: str, fallback_model: Optional[str], temperature: float,
+                 max_tokens: int, timeout: float, slo: float):
+        self.task = task
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model and fallback_model != model else None
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.slo = slo
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "fallback_model": self.fallback_model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "timeout": self.timeout,
+            "slo": self.slo,
+        }
+
+
+class _UsageStats:
+    """某个任务+模型的调用统计"""
+
+    def __init__(self, window: int):
+        self.calls = 0
+        self.errors = 0
+        self.slo_breaches = 0
+        self.total_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=window)
+        self.first_token_latencies = deque(maxlen=window)
+        self.slo_window = deque(maxlen=window)  # 判断是否超出SLO的样本，降级后清空
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "slo_breaches": self.slo_breaches,
+            "avg_seconds": round(self.total_seconds / self.calls, 3) if self.calls else None,
+            "p50_seconds": _percentile(self.latencies, 0.5),
+            "p90_seconds": _percentile(self.latencies, 0.9),
+            "p50_first_token_seconds": _percentile(self.first_token_latencies, 0.5),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+def _percentile(values, ratio: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * ratio))], 3)
+
+
+class LLMRouter:
+    """任务 -> 模型路由表，带延迟SLO降级和用量统计"""
+
+    def __init__(self, routes: Dict[str, Dict[str, Any]], overrides: str, default_model: str,
+                 fallback_model: str, window: int, cooldown: float):
+        self.default_model = default_model
+        self.fallback_model = fallback_model
+        self.window = window
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._routes: Dict[str, LLMRoute] = {}
+        self._stats: Dict[Tuple[str, str], _UsageStats] = {}
+        self._degraded_until: Dict[str, float] = {}
+        merged = {task: dict(config) for task, config in routes.items()}
+        for task, config in self._parse_overrides(overrides).items():
+            merged.setdefault(task, dict(merged.get("default", {}))).update(config)
+        for task, config in merged.items():
+            self._routes[task] = self._build_route(task, config)
+
+    @staticmethod
+    def _parse_overrides(raw: str) -> Dict[str, Dict[str, Any]]:
+        if not raw:
+            return {}
+        try:
+            overrides = json.loads(raw)
+        except json.JSONDecodeError as e:
+            log_with_time(f"[模型路由] LLM_ROUTES 不是有效的JSON，已忽略: {e}")
+            return {}
+        return {task: config for task, config in overrides.items() if isinstance(config, dict)}
+
+    def _build_route(self, task: str, config: Dict[str, Any]) -> LLMRoute:
+        return LLMRoute(
+            task=task,
+            model=config.get("model") or self.default_model,
+            fallback_model=config.get("fallback_model") or self.fallback_model,
+            temperature=float(config.get("temperature", 0.3)),
+            max_tokens=int(config.get("max_tokens", 2000)),
+            timeout=float(config.get("timeout", 180.0)),
+            slo=float(config.get("slo", 0) or 0),
+        )
+
+    def route(self, task: str) -> LLMRoute:
+        """获取任务的路由配置（未配置的任务使用default）"""
+        return self._routes.get(task) or self._routes["default"]
+
+    def select_model(self, route: LLMRoute) -> str:
+        """选择本次调用的模型：主模型处于降级冷却期时使用备用模型"""
+        if route.fallback_model and self._degraded_until.get(route.task, 0) > time.time():
+            return route.fallback_model
+        return route.model
+
+    def record(self, route: LLMRoute, model: str, seconds: float, first_token_seconds: Optional[float] = None,
+               usage: Any = None, error: Optional[BaseException] = None):
+        """记录一次调用；主模型延迟超过SLO（p90）或超时后进入降级冷却期"""
+        breached = False
+        with self._lock:
+            stats = self._stats.get((route.task, model))
+            if stats is None:
+                stats = self._stats[(route.task, model)] = _UsageStats(self.window)
+            stats.calls += 1
+            stats.total_seconds += seconds
+            if error is not None:
+                stats.errors += 1
+            else:
+                stats.latencies.append(seconds)
+                stats.slo_window.append(seconds)
+                if first_token_seconds is not None:
+                    stats.first_token_latencies.append(first_token_seconds)
+            if usage is not None:
+                stats.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                stats.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+            if route.slo and (seconds > route.slo or (error is not None and is_timeout_error(error))):
+                stats.slo_breaches += 1
+            if model == route.model and route.fallback_model and route.slo:
+                timed_out = error is not None and is_timeout_error(error)
+                p90 = _percentile(stats.slo_window, 0.9)
+                if timed_out or (len(stats.slo_window) >= 5 and p90 is not None and p90 > route.slo):
+                    if self._degraded_until.get(route.task, 0) <= time.time():
+                        breached = True
+                    self._degraded_until[route.task] = time.time() + self.cooldown
+                    # 冷却期结束后重新按新的样本判断主模型
+                    stats.slo_window.clear()
+        if breached:
+            log_with_time(
+                f"[模型路由] 任务 {route.task} 的主模型 {route.model} 超出延迟SLO({route.slo}秒)，"
+                f"{self.cooldown:.0f}秒内改用 {route.fallback_model}"
+            )
+
+    def can_fallback(self, route: LLMRoute, model: str, error: BaseException) -> bool:
+        """主模型调用超时且配置了备用模型时，可以立即用备用模型重试一次"""
+        return model == route.model and route.fallback_model is not None and is_timeout_error(error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            usage: Dict[str, Dict[str, Any]] = {}
+            for (task, model), stats in self._stats.items():
+                usage.setdefault(task, {})[model] = stats.to_dict()
+            now = time.time()
+            return {
+                "routes": {task: route.to_dict() for task, route in self._routes.items()},
+                "degraded": {
+                    task: round(until - now, 1) for task, until in self._degraded_until.items() if until > now
+                },
+                "usage": usage,
+            }
+
+
+# 进程内共享的模型路由表
+llm_router = LLMRouter(
+    routes=Config.LLM_ROUTES,
+    overrides=Config.LLM_ROUTES_OVERRIDE,
+    default_model=Config.ARK_MODEL,
+    fallback_model=Config.LLM_FALLBACK_MODEL,
+    window=Config.LLM_SLO_WINDOW,
+    cooldown=Config.LLM_SLO_COOLDOWN,
+)
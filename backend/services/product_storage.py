@@ -0,0 +1,633 @@
+"""
+产品数据存储后端
+DataService之前把每个项目的产品保存在 data/products_{project_id}.json 中，任何一次修改（改价格、标记询价完成、
+保存规格和供应商）都要读取并重写整个文件（indent=2），2000个产品的项目改一个字段要重写数MB。
+这里把存储抽象为ProductStorage，DataService的接口保持不变：
+- JSONProductStorage：原有的按项目JSON文件存储
+- SQLiteProductStorage：SQLite（WAL）存储，产品、规格、供应商分表并建索引，修改只更新对应的行；
+  首次打开时一次性导入已有的JSON文件（JSON文件保留不动，可以切回JSON存储）
+默认使用JSON存储；设置 DATA_STORAGE_BACKEND=sqlite 后切换到SQLite，首次启动时导入已有数据。
+"""
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from services.project_lock import ProjectLockManager, atomic_write_json
+from utils.config import Config
+
+# products表中单独成列的字段，其余字段保存在extra（JSON）中
+_PRODUCT_COLUMNS = (
+    "id", "project_id", "project_code", "project_name", "project_features", "unit", "quantity",
+    "spec_summary", "price", "price_unit", "notes", "inquiry_completed", "created_at", "updated_at",
+)
+_CHILD_FIELDS = ("other_specs", "suppliers")
+
+
+def log_with_time(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[{timestamp}] {message}")
+
+
+class ProductStorage(ABC):
+    """产品存储接口（产品以dict表示，字段与Product模型一致）"""
+
+    @abstractmethod
+    def list_products(self, project_id: str) -> List[dict]:
+        """按创建顺序返回项目的全部产品"""
+
+    @abstractmethod
+    def list_project_ids(self) -> List[str]:
+        """返回有产品数据的项目ID"""
+
+    @abstractmethod
+    def get_product(self, product_id: str, project_id: Optional[str] = None) -> Optional[dict]:
+        """按ID获取产品（不存在时返回None）"""
+
+    @abstractmethod
+    def insert_product(self, product: dict):
+        """插入一个产品"""
+
+    def insert_products(self, products: List[dict]):
+        """批量插入产品（一次写入）"""
+        for product in products:
+            self.insert_product(product)
+
+    @abstractmethod
+    def update_product(self, product_id: str, fields: Dict[str, Any], project_id: Optional[str] = None) -> Optional[dict]:
+        """更新产品的部分字段，返回更新后的产品（不存在时返回None）"""
+
+    @abstractmethod
+    def delete_product(self, product_id: str, project_id: Optional[str] = None) -> bool:
+        """删除产品，返回是否删除"""
+
+    def list_all_products(self) -> List[dict]:
+        products = []
+        for project_id in self.list_project_ids():
+            products.extend(self.list_products(project_id))
+        return products
+
+
+class ProjectCache:
+    """
+    进程内的项目产品列表缓存（已解析的dict列表）
+    以文件的 (mtime_ns, size) 作为版本，文件被外部修改后自动失效；总大小按JSON文件大小估算，
+    超过上限时淘汰最久未访问的项目。max_bytes为0时不缓存。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, project_id: str, stamp: tuple) -> Optional[List[dict]]:
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(project_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, project_id: str, stamp: tuple, products: List[dict], size: int):
+        with self._lock:
+            self._discard(project_id)
+            if size > self.max_bytes:
+                return
+            self._entries[project_id] = (stamp, products, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, cold_size) = self._entries.popitem(last=False)
+                self._bytes -= cold_size
+                self.evictions += 1
+
+    def invalidate(self, project_id: str):
+        with self._lock:
+            self._discard(project_id)
+
+    def _discard(self, project_id: str):
+        entry = self._entries.pop(project_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "projects": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class JSONProductStorage(ProductStorage):
+    """
+    按项目保存为 products_{project_id}.json（每次修改重写整个项目文件）
+    另外维护 product_index.json（产品ID -> 项目ID），按ID查找时只读取所在项目的文件；
+    索引文件缺失或损坏时扫描全部项目文件重建；按ID查不到时补全索引中缺失的条目（数据目录有变化后才扫描，
+    只解析有变化的项目文件，反复查询不存在的ID不会重复扫描）。
+    cache_max_bytes大于0时缓存已解析的项目文件（写入时同步更新缓存）。
+    修改都在项目锁内以"读取-修改-写入"完成（modify_products），文件以临时文件+rename原子替换；
+    修改作用在列表副本上，缓存中的列表不会被原地修改，并发读取看到的总是完整的快照。
+    """
+
+    INDEX_FILE = "product_index.json"
+    INDEX_LOCK = "product_index"
+
+    def __init__(self, data_dir: str, cache_max_bytes: int = 0):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.cache = ProjectCache(cache_max_bytes)
+        self.locks = ProjectLockManager(self.data_dir)
+        self._index: Optional[Dict[str, str]] = None
+        self._index_stamp: Optional[tuple] = None
+        self._repair_dir_stamp: Optional[int] = None  # 上次补全扫描时数据目录的mtime
+        self._repair_file_stamps: Dict[str, tuple] = {}  # 上次补全扫描时各项目文件的 (mtime, size)
+
+    def _get_products_file(self, project_id: str) -> str:
+        """获取项目的产品文件路径"""
+        return os.path.join(self.data_dir, f"products_{project_id}.json")
+
+    def _load_products(self, project_id: str, strict: bool = False) -> List[dict]:
+        """
+        加载指定项目的产品数据（文件未变化时直接使用缓存）
+        文件无法解析时：strict为True抛出异常（避免修改后把空列表写回覆盖原文件），否则返回空列表
+        """
+        products_file = self._get_products_file(project_id)
+        try:
+            stat = os.stat(products_file)
+        except OSError:
+            self.cache.invalidate(project_id)
+            return []
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self.cache.get(project_id, stamp)
+        if cached is not None:
+            return cached
+        try:
+            with open(products_file, 'r', encoding='utf-8') as f:
+                products = json.load(f)
+        except Exception as e:
+            log_with_time(f"[产品存储] 读取 {products_file} 失败: {e}")
+            if strict:
+                raise
+            return []
+        self.cache.put(project_id, stamp, products, stat.st_size)
+        return products
+
+    def _save_products(self, project_id: str, products: List[dict]):
+        """原子地保存项目的产品数据，并同步更新缓存（调用方需持有项目锁）"""
+        products_file = self._get_products_file(project_id)
+        try:
+            atomic_write_json(products_file, products, ensure_ascii=False, indent=2)
+            stat = os.stat(products_file)
+        except Exception:
+            self.cache.invalidate(project_id)
+            raise
+        self.cache.put(project_id, (stat.st_mtime_ns, stat.st_size), products, stat.st_size)
+
+    def modify_products(self, project_id: str, mutate: Callable[[List[dict]], Tuple[bool, Any]]) -> Any:
+        """
+        在项目锁内读取-修改-写入项目的产品列表
+        mutate接收产品列表的副本（列表中的dict需整体替换，不要原地修改），返回 (是否写回, 结果)
+        """
+        with self.locks.lock(f"products_{project_id}"):
+            products = list(self._load_products(project_id, strict=True))
+            changed, result = mutate(products)
+            if changed:
+                self._save_products(project_id, products)
+            return result
+
+    def _get_index(self) -> Dict[str, str]:
+        """产品ID -> 项目ID 索引（索引文件被其他进程更新后重新加载，缺失或损坏时重建）"""
+        index_file = os.path.join(self.data_dir, self.INDEX_FILE)
+        try:
+            stat = os.stat(index_file)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if self._index is not None and stamp == self._index_stamp:
+            return self._index
+        with self.locks.lock(self.INDEX_LOCK):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                if not isinstance(index, dict):
+                    raise ValueError("索引格式错误")
+                self._index, self._index_stamp = index, stamp
+            except Exception:
+                self._rebuild_index()
+        return self._index
+
+    def _rebuild_index(self):
+        """扫描全部项目文件重建索引并保存"""
+        with self.locks.lock(self.INDEX_LOCK):
+            index = {}
+            for project_id in self.list_project_ids():
+                for p in self._load_products(project_id):
+                    index[p["id"]] = project_id
+            self._index = index
+            self._save_index()
+            log_with_time(f"[产品存储] 已重建产品索引：{len(index)} 个产品")
+
+    def _save_index(self):
+        index_file = os.path.join(self.data_dir, self.INDEX_FILE)
+        atomic_write_json(index_file, self._index, ensure_ascii=False)
+        stat = os.stat(index_file)
+        self._index_stamp = (stat.st_mtime_ns, stat.st_size)
+
+    def _index_set(self, product_ids: Iterable[str], project_id: Optional[str]):
+        """更新索引（project_id为None表示删除）并保存"""
+        with self.locks.lock(self.INDEX_LOCK):
+            index = self._get_index()
+            for product_id in product_ids:
+                if project_id is None:
+                    index.pop(product_id, None)
+                else:
+                    index[product_id] = project_id
+            self._save_index()
+
+    def _find_project_id(self, product_id: str) -> Optional[str]:
+        project_id = self._get_index().get(product_id)
+        if project_id:
+            return project_id
+        # 索引中没有：可能是写入项目文件后、更新索引前进程退出，或项目文件是从别处复制来的
+        return self._repair_index(product_id)
+
+    def _repair_index(self, product_id: str) -> Optional[str]:
+        """
+        补全索引中缺失的产品，返回product_id所在的项目ID（不存在时返回None）
+        项目文件的新建、替换和删除都会更新数据目录的mtime：目录自上次扫描后没有变化时直接返回None，
+        有变化时只解析 (mtime, size) 变化过的项目文件
+        """
+        if self._data_dir_stamp() == self._repair_dir_stamp:
+            return None
+        with self.locks.lock(self.INDEX_LOCK):
+            index = self._get_index()
+            if product_id in index:
+                return index[product_id]
+            # 先记下目录的mtime再扫描：扫描期间的修改会让下次查询重新扫描
+            dir_stamp = self._data_dir_stamp()
+            if dir_stamp == self._repair_dir_stamp:
+                return None
+            missing = {}
+            file_stamps = {}
+            for project_id in self.list_project_ids():
+                try:
+                    stat = os.stat(self._get_products_file(project_id))
+                except OSError:
+                    continue
+                stamp = file_stamps[project_id] = (stat.st_mtime_ns, stat.st_size)
+                if self._repair_file_stamps.get(project_id) == stamp:
+                    continue
+                for p in self._load_products(project_id):
+                    if p["id"] not in index:
+                        missing[p["id"]] = project_id
+            self._repair_dir_stamp, self._repair_file_stamps = dir_stamp, file_stamps
+            if missing:
+                index.update(missing)
+                self._save_index()
+                log_with_time(f"[产品存储] 产品索引缺少 {len(missing)} 个产品，已补全")
+            return index.get(product_id)
+
+    def _data_dir_stamp(self) -> Optional[int]:
+        try:
+            return os.stat(self.data_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def list_products(self, project_id: str) -> List[dict]:
+        return self._load_products(project_id)
+
+    def list_project_ids(self) -> List[str]:
+        return [
+            filename[len("products_"):-len(".json")]
+            for filename in os.listdir(self.data_dir)
+            if filename.startswith("products_") and filename.endswith(".json")
+        ]
+
+    def get_product(self, product_id: str, project_id: Optional[str] = None) -> Optional[dict]:
+        project_id = project_id or self._find_project_id(product_id)
+        if not project_id:
+            return None
+        for p in self._load_products(project_id):
+            if p["id"] == product_id:
+                return p
+        return None
+
+    def insert_product(self, product: dict):
+        self.insert_products([product])
+
+    def insert_products(self, products: List[dict]):
+        """按项目分组，每个项目文件只读写一次"""
+        by_project: Dict[str, List[dict]] = {}
+        for product in products:
+            by_project.setdefault(product["project_id"], []).append(product)
+        for project_id, new_products in by_project.items():
+            self.modify_products(project_id, lambda current: (current.extend(new_products) or True, None))
+            self._index_set([p["id"] for p in new_products], project_id)
+
+    def update_product(self, product_id: str, fields: Dict[str, Any], project_id: Optional[str] = None) -> Optional[dict]:
+        project_id = project_id or self._find_project_id(product_id)
+        if not project_id:
+            return None
+
+        def mutate(products: List[dict]):
+            for i, p in enumerate(products):
+                if p["id"] == product_id:
+                    products[i] = {**p, **fields}
+                    return True, products[i]
+            return False, None
+
+        return self.modify_products(project_id, mutate)
+
+    def delete_product(self, product_id: str, project_id: Optional[str] = None) -> bool:
+        project_id = project_id or self._find_project_id(product_id)
+        if not project_id:
+            return False
+
+        def mutate(products: List[dict]):
+            remaining = [p for p in products if p["id"] != product_id]
+            deleted = len(remaining) < len(products)
+            products[:] = remaining
+            return deleted, deleted
+
+        deleted = self.modify_products(project_id, mutate)
+        if deleted:
+            self._index_set([product_id], None)
+        return deleted
+
+
+class SQLiteProductStorage(ProductStorage):
+    """SQLite（WAL）存储：products / product_specs / product_suppliers 三张表，按行更新"""
+
+    def __init__(self, db_path: str, data_dir: str):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """延迟打开数据库连接、建表，并在首次打开时导入已有的JSON文件"""
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                    conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                    conn.row_factory = sqlite3.Row
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.execute("PRAGMA foreign_keys=ON")
+                    self._create_tables(conn)
+                    self._migrate_json_files(conn)
+                    self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS products (
+                id TEXT PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                project_code TEXT,
+                project_name TEXT,
+                project_features TEXT,
+                unit TEXT,
+                quantity REAL,
+                spec_summary TEXT,
+                price REAL,
+                price_unit TEXT,
+                notes TEXT,
+                inquiry_completed INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT,
+                updated_at TEXT,
+                extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_products_project ON products(project_id);
+            CREATE TABLE IF NOT EXISTS product_specs (
+                product_id TEXT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                slice_id TEXT,
+                doc_id TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (product_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS idx_product_specs_slice ON product_specs(slice_id);
+            CREATE TABLE IF NOT EXISTS product_suppliers (
+                product_id TEXT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                name TEXT,
+                source TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (product_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS idx_product_suppliers_name ON product_suppliers(name);
+            CREATE TABLE IF NOT EXISTS storage_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        conn.commit()
+
+    def _migrate_json_files(self, conn: sqlite3.Connection):
+        """一次性导入 data/products_*.json（已导入过则跳过；同一产品ID不会重复导入）"""
+        if conn.execute("SELECT 1 FROM storage_meta WHERE key = 'json_migrated'").fetchone():
+            return
+        source = JSONProductStorage(self.data_dir)
+        imported = 0
+        with conn:
+            for project_id in source.list_project_ids():
+                products = source.list_products(project_id)
+                for product in products:
+                    product.setdefault("project_id", project_id)
+                    if self._insert(conn, product, ignore_existing=True):
+                        imported += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO storage_meta (key, value) VALUES ('json_migrated', ?)",
+                (json.dumps({"at": datetime.now().isoformat(), "products": imported}),)
+            )
+        if imported:
+            log_with_time(f"[产品存储] 已从JSON文件导入 {imported} 个产品到 {self.db_path}")
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, product: dict, ignore_existing: bool = False) -> bool:
+        columns = {name: product.get(name) for name in _PRODUCT_COLUMNS}
+        columns["inquiry_completed"] = 1 if product.get("inquiry_completed") else 0
+        extra = {k: v for k, v in product.items() if k not in _PRODUCT_COLUMNS and k not in _CHILD_FIELDS}
+        columns["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+        verb = "INSERT OR IGNORE" if ignore_existing else "INSERT"
+        cursor = conn.execute(
+            f"{verb} INTO products ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            tuple(columns.values())
+        )
+        if cursor.rowcount == 0:
+            return False
+        SQLiteProductStorage._write_children(conn, product["id"], product.get("other_specs") or [],
+                                             product.get("suppliers") or [])
+        return True
+
+    @staticmethod
+    def _write_children(conn: sqlite3.Connection, product_id: str, specs: Optional[Iterable[Any]],
+                        suppliers: Optional[Iterable[Any]]):
+        """替换产品的规格/供应商行（为None的部分不修改）"""
+        if specs is not None:
+            conn.execute("DELETE FROM product_specs WHERE product_id = ?", (product_id,))
+            conn.executemany(
+                "INSERT INTO product_specs (product_id, position, slice_id, doc_id, data) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (product_id, i, _get(spec, "slice_id"), _get(spec, "doc_id"), _dumps(spec))
+                    for i, spec in enumerate(specs)
+                ]
+            )
+        if suppliers is not None:
+            conn.execute("DELETE FROM product_suppliers WHERE product_id = ?", (product_id,))
+            conn.executemany(
+                "INSERT INTO product_suppliers (product_id, position, name, source, data) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (product_id, i, _get(supplier, "name"), _get(supplier, "source"), _dumps(supplier))
+                    for i, supplier in enumerate(suppliers)
+                ]
+            )
+
+    def _assemble(self, conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> List[dict]:
+        """把products行与对应的规格、供应商行组装为产品dict（保持行的顺序）"""
+        if not rows:
+            return []
+        products = {}
+        for row in rows:
+            product = {name: row[name] for name in _PRODUCT_COLUMNS}
+            product["inquiry_completed"] = bool(row["inquiry_completed"])
+            if row["extra"]:
+                product.update(json.loads(row["extra"]))
+            product["other_specs"] = []
+            product["suppliers"] = []
+            products[row["id"]] = product
+        ids = list(products)
+        # SQLite默认最多999个参数，分批查询
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            for table, field in (("product_specs", "other_specs"), ("product_suppliers", "suppliers")):
+                for child in conn.execute(
+                    f"SELECT product_id, data FROM {table} WHERE product_id IN ({placeholders}) "
+                    f"ORDER BY product_id, position",
+                    batch
+                ):
+                    products[child["product_id"]][field].append(json.loads(child["data"]))
+        return list(products.values())
+
+    def list_products(self, project_id: str) -> List[dict]:
+        conn = self._get_conn()
+        with self._lock:
+            rows = conn.execute("SELECT * FROM products WHERE project_id = ? ORDER BY rowid", (project_id,)).fetchall()
+            return self._assemble(conn, rows)
+
+    def list_project_ids(self) -> List[str]:
+        conn = self._get_conn()
+        with self._lock:
+            return [row[0] for row in conn.execute("SELECT DISTINCT project_id FROM products")]
+
+    def list_all_products(self) -> List[dict]:
+        conn = self._get_conn()
+        with self._lock:
+            rows = conn.execute("SELECT * FROM products ORDER BY project_id, rowid").fetchall()
+            return self._assemble(conn, rows)
+
+    def get_product(self, product_id: str, project_id: Optional[str] = None) -> Optional[dict]:
+        conn = self._get_conn()
+        with self._lock:
+            row = conn.execute("SELECT * FROM products WHERE id = ?", (product_id,)).fetchone()
+            if row is None or (project_id and row["project_id"] != project_id):
+                return None
+            return self._assemble(conn, [row])[0]
+
+    def insert_product(self, product: dict):
+        conn = self._get_conn()
+        with self._lock, conn:
+            self._insert(conn, product)
+
+    def insert_products(self, products: List[dict]):
+        """在一个事务中插入全部产品"""
+        conn = self._get_conn()
+        with self._lock, conn:
+            for product in products:
+                self._insert(conn, product)
+
+    def update_product(self, product_id: str, fields: Dict[str, Any], project_id: Optional[str] = None) -> Optional[dict]:
+        conn = self._get_conn()
+        with self._lock:
+            with conn:
+                # 立即获取写锁，读取extra和写回之间不会插入其他进程的修改
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT project_id, extra FROM products WHERE id = ?", (product_id,)).fetchone()
+                if row is None or (project_id and row["project_id"] != project_id):
+                    return None
+                self._update_row(conn, product_id, row, fields)
+            return self.get_product(product_id)
+
+    @staticmethod
+    def _update_row(conn: sqlite3.Connection, product_id: str, row: sqlite3.Row, fields: Dict[str, Any]):
+        """在当前事务中更新产品行及其规格/供应商行"""
+        columns = {k: v for k, v in fields.items() if k in _PRODUCT_COLUMNS and k != "id"}
+        if "inquiry_completed" in columns:
+            columns["inquiry_completed"] = 1 if columns["inquiry_completed"] else 0
+        extra_fields = {k: v for k, v in fields.items() if k not in _PRODUCT_COLUMNS and k not in _CHILD_FIELDS}
+        if extra_fields:
+            extra = json.loads(row["extra"]) if row["extra"] else {}
+            extra.update(extra_fields)
+            columns["extra"] = json.dumps(extra, ensure_ascii=False)
+        if columns:
+            conn.execute(
+                f"UPDATE products SET {', '.join(f'{k} = ?' for k in columns)} WHERE id = ?",
+                (*columns.values(), product_id)
+            )
+        SQLiteProductStorage._write_children(conn, product_id, fields.get("other_specs"), fields.get("suppliers"))
+
+    def delete_product(self, product_id: str, project_id: Optional[str] = None) -> bool:
+        conn = self._get_conn()
+        with self._lock, conn:
+            if project_id:
+                cursor = conn.execute("DELETE FROM products WHERE id = ? AND project_id = ?", (product_id, project_id))
+            else:
+                cursor = conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            return cursor.rowcount > 0
+
+
+def _get(item: Any, key: str) -> Any:
+    return item.get(key) if isinstance(item, dict) else getattr(item, key, None)
+
+
+def _dumps(item: Any) -> str:
+    if hasattr(item, "model_dump"):
+        item = item.model_dump()
+    return json.dumps(item, ensure_ascii=False, default=str)
+
+
+def create_product_storage(backend: str) -> ProductStorage:
+    """按配置创建存储后端（json / sqlite）"""
+    if backend == "sqlite":
+        log_with_time(f"[产品存储] 使用SQLite存储: {Config.PRODUCTS_DB_PATH}")
+        return SQLiteProductStorage(Config.PRODUCTS_DB_PATH, Config.DATA_DIR)
+    if backend != "json":
+        log_with_time(f"[产品存储] 未知的DATA_STORAGE_BACKEND: {backend}，使用json")
+    storage = JSONProductStorage(Config.DATA_DIR, cache_max_bytes=Config.PRODUCT_CACHE_MAX_BYTES)
+    # 启动时加载产品索引（缺失时重建）
+    storage._get_index()
+    return storage
+
+
+# 进程内共享的产品存储（各模块的DataService实例共用）
+product_storage = create_product_storage(Config.DATA_STORAGE_BACKEND)
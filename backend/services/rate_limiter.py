@@ -0,0 +1,258 @@
+"""
+外部服务限流（Viking知识库、Ark模型）
+后台补全任务并发执行后很容易触发服务商的限流和超时，之前的重试循环只是固定等待2秒后盲目重试，
+多个线程同时重试会形成重试风暴。这里为每个外部服务维护一个限流器：
+- 令牌桶限制每秒请求数（允许一定突发）
+- 并发上限按AIMD自适应：调用成功时缓慢增加，遇到429/限流/超时时减半
+所有知识库检索和模型调用都先获取许可，当前并发上限、排队数等通过 /api/knowledge/metrics 查看。
+"""
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from utils.config import Config
+from utils.deadline import DeadlineExceeded, current_deadline, deadline_expired
+
+
+def log_with_time(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[{timestamp}] {message}")
+
+
+_OVERLOAD_MARKERS = (
+    "429", "rate limit", "ratelimit", "too many requests", "throttl",
+    "serveroverloaded", "server overloaded", "quota", "timeout", "timed out",
+)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """判断异常是否为限流（429）"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ("429", "rate limit", "ratelimit", "too many requests", "throttl"))
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """判断异常是否说明服务已过载（限流、503或超时），需要降低并发"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if getattr(error, "status_code", None) in (429, 503):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in _OVERLOAD_MARKERS)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """第attempt次重试前的等待时间：指数退避加随机抖动，避免多个线程同时重试"""
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+class RateLimitWaitTimeout(Exception):
+    """等待限流许可超过RATE_LIMIT_MAX_WAIT"""
+
+
+class _Permit:
+    """一次调用的许可；调用方可以在没有异常时标记过载（例如HTTP 429响应）"""
+
+    def __init__(self):
+        self.overloaded = False
+
+    def mark_overload(self):
+        self.overloaded = True
+
+
+class AdaptiveLimiter:
+    """令牌桶限速 + AIMD自适应并发上限"""
+
+    def __init__(self, name: str, rate: float, burst: int, min_concurrency: int, max_concurrency: int,
+                 initial_concurrency: int, max_wait: float, decrease_factor: float = 0.5,
+                 decrease_interval: float = 1.0):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(self.max_concurrency, max(self.min_concurrency, initial_concurrency)))
+        self.max_wait = max_wait
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval  # 同一波失败只减一次，避免并发上限瞬间降到最低
+        self._cond = threading.Condition()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.overloads = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _try_acquire(self) -> float:
+        """尝试获取许可（需持有锁）：成功返回0，否则返回建议的等待秒数"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.in_flight >= int(self.limit):
+            return 0.05
+        if self.rate > 0 and self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        if self.rate > 0:
+            self._tokens -= 1
+        self.in_flight += 1
+        self.calls += 1
+        return 0.0
+
+    def _wait_budget(self) -> float:
+        deadline = current_deadline()
+        if deadline is None:
+            return self.max_wait
+        deadline.check()
+        return min(self.max_wait, deadline.remaining())
+
+    def _timeout_error(self, waited: float) -> Exception:
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            return DeadlineExceeded(f"等待{self.name}限流许可时请求已截止")
+        return RateLimitWaitTimeout(f"等待{self.name}限流许可超过 {waited:.1f} 秒")
+
+    def acquire(self):
+        """阻塞获取许可（在线程池中调用），超过等待上限或请求截止时抛出异常"""
+        start = time.monotonic()
+        budget = self._wait_budget()
+        with self._cond:
+            delay = self._try_acquire()
+            if delay == 0:
+                return
+            self.waiting += 1
+            self.throttled += 1
+            try:
+                while delay > 0:
+                    waited = time.monotonic() - start
+                    if waited >= budget:
+                        raise self._timeout_error(waited)
+                    self._cond.wait(min(delay, budget - waited))
+                    delay = self._try_acquire()
+            finally:
+                self.waiting -= 1
+                self.wait_seconds += time.monotonic() - start
+
+    async def acquire_async(self):
+        """异步获取许可（在事件循环中调用，不占用线程）"""
+        start = time.monotonic()
+        budget = self._wait_budget()
+        counted = False
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_acquire()
+                    if delay == 0:
+                        return
+                    if not counted:
+                        counted = True
+                        self.waiting += 1
+                        self.throttled += 1
+                waited = time.monotonic() - start
+                if waited >= budget:
+                    raise self._timeout_error(waited)
+                await asyncio.sleep(min(delay, budget - waited))
+        finally:
+            if counted:
+                with self._cond:
+                    self.waiting -= 1
+                    self.wait_seconds += time.monotonic() - start
+
+    def release(self, error: Optional[BaseException] = None, overloaded: bool = False):
+        """释放许可并按结果调整并发上限：过载时乘性减少，成功时加性增加（每个并发窗口约+1）"""
+        # 请求截止导致的超时（超时已按剩余时间收紧）不说明服务过载
+        overloaded = overloaded or (error is not None and is_overload_error(error) and not deadline_expired())
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.overloads += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self._last_decrease = now
+                    old_limit = self.limit
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    if int(self.limit) < int(old_limit):
+                        log_with_time(f"[限流] {self.name} 服务过载，并发上限 {int(old_limit)} -> {int(self.limit)}")
+            elif error is None:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / max(1.0, self.limit))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """在许可内执行一次调用：with limiter.slot() as permit: ..."""
+        self.acquire()
+        permit = _Permit()
+        try:
+            yield permit
+        except BaseException as e:
+            # 包括流式调用被调用方提前关闭（GeneratorExit），只释放许可，不影响并发上限
+            self.release(error=e)
+            raise
+        else:
+            self.release(overloaded=permit.overloaded)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        await self.acquire_async()
+        permit = _Permit()
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        else:
+            self.release(overloaded=permit.overloaded)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "concurrency_limit": int(self.limit),
+                "min_concurrency": self.min_concurrency,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "overloads": self.overloads,
+                "avg_wait_seconds": round(self.wait_seconds / self.throttled, 3) if self.throttled else 0.0,
+            }
+
+
+# 进程内共享的限流器（每个外部服务一个）
+ark_limiter = AdaptiveLimiter(
+    name="Ark模型",
+    rate=Config.ARK_RATE_LIMIT,
+    burst=Config.ARK_RATE_BURST,
+    min_concurrency=Config.ARK_CONCURRENCY_MIN,
+    max_concurrency=Config.ARK_CONCURRENCY_MAX,
+    initial_concurrency=Config.ARK_CONCURRENCY_INITIAL,
+    max_wait=Config.RATE_LIMIT_MAX_WAIT,
+)
+viking_limiter = AdaptiveLimiter(
+    name="知识库",
+    rate=Config.VIKING_RATE_LIMIT,
+    burst=Config.VIKING_RATE_BURST,
+    min_concurrency=Config.VIKING_CONCURRENCY_MIN,
+    max_concurrency=Config.VIKING_CONCURRENCY_MAX,
+    initial_concurrency=Config.VIKING_CONCURRENCY_INITIAL,
+    max_wait=Config.RATE_LIMIT_MAX_WAIT,
+)
+
+
+def limiter_stats() -> Dict[str, Any]:
+    return {"ark": ark_limiter.stats(), "viking": viking_limiter.stats()}
@@ -0,0 +1,146 @@
+"""
+知识库检索结果缓存
+BOM清单中同一产品名称会重复出现多次，search_specs / search_suppliers_from_docs
+会用完全相同的查询参数反复调用知识库。这里在search_knowledge前面加一层
+TTL + LRU 缓存，相同查询在有效期内只调用一次远程API。
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import Config
+
+
+class SearchResultCache:
+    """知识库检索结果缓存（TTL + LRU，线程安全）"""
+
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 1800):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize_query(query: Optional[str]) -> str:
+        """规范化查询文本：去掉首尾空白、合并连续空白、统一小写"""
+        if not query:
+            return ""
+        return re.sub(r"\s+", " ", str(query)).strip().lower()
+
+    @classmethod
+    def make_key(cls, search_params: Dict[str, Any]) -> str:
+        """
+        根据检索参数生成缓存键
+        包含：规范化后的query、limit、dense_weight、post_processing、doc_filter以及集合标识
+        """
+        query_param = search_params.get("query_param") or {}
+        key_parts = {
+            "query": cls.normalize_query(search_params.get("query")),
+            "limit": search_params.get("limit"),
+            "dense_weight": search_params.get("dense_weight"),
+            "post_processing": search_params.get("post_processing"),
+            "doc_filter": query_param.get("doc_filter") if isinstance(query_param, dict) else None,
+            "collection_name": search_params.get("collection_name"),
+            "resource_id": search_params.get("resource_id"),
+        }
+        return json.dumps(key_parts, ensure_ascii=False, sort_keys=True, default=str)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """查询缓存，返回 (是否命中, 缓存值)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key: str, value: Any):
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_key(self, key: str) -> bool:
+        """删除单个缓存条目"""
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+                self.invalidations += 1
+                return True
+            return False
+
+    def invalidate(self, query: str, limit: Optional[int] = None) -> int:
+        """
+        删除指定查询的缓存条目
+
+        Args:
+            query: 查询文本（会先规范化）
+            limit: 只删除该limit的条目；为None时删除该查询的所有条目
+
+        Returns:
+            删除的条目数
+        """
+        normalized = self.normalize_query(query)
+        removed = 0
+        with self._lock:
+            for key in list(self._entries.keys()):
+                key_parts = json.loads(key)
+                if key_parts.get("query") != normalized:
+                    continue
+                if limit is not None and key_parts.get("limit") != limit:
+                    continue
+                del self._entries[key]
+                removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self) -> int:
+        """清空缓存，返回清除的条目数"""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self.invalidations += count
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": Config.KNOWLEDGE_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# 进程内共享的检索缓存（upload、knowledge等模块各自创建的KnowledgeService共用）
+search_cache = SearchResultCache(
+    max_size=Config.KNOWLEDGE_CACHE_MAX_SIZE,
+    ttl_seconds=Config.KNOWLEDGE_CACHE_TTL
+)
@@ -0,0 +1,133 @@
+"""
+进程内请求合并（single-flight）
+用户在自动查询未完成时点击"重新查询"，或多个采购员同时打开同一项目时，
+相同的规格/供应商查询会并发执行多次。这里让相同键的并发调用共享同一个
+进行中的任务，只执行一次知识库检索和LLM调用。
+共享任务的截止时间取当前所有等待者中最晚的一个（有新的等待者加入时延长，等待者离开时重新计算），
+远程调用仍只使用剩余预算；每个调用方按自己的截止时间等待，某个调用方超时或断开不影响其他调用方，
+所有调用方都离开后才取消共享任务的后续调用。
+"""
+import asyncio
+import math
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from utils.deadline import Deadline, current_deadline, detached_context
+
+
+class _Flight:
+    """一个进行中的共享任务"""
+
+    def __init__(self, task: Optional[asyncio.Future], deadline: Deadline):
+        self.task = task
+        self.deadline = deadline
+        self.waiters: List[Optional[Deadline]] = []  # 各等待者的截止时间（None表示不限制）
+
+    def refresh_deadline(self):
+        """共享截止时间 = 等待者中最晚的截止时间（任一等待者不限时则不限时）"""
+        if not self.waiters:
+            return
+        if any(d is None for d in self.waiters):
+            self.deadline.expires_at = math.inf
+        else:
+            self.deadline.expires_at = max(d.expires_at for d in self.waiters)
+
+
+class SingleFlight:
+    """相同键的并发异步调用只执行一次，其余调用等待同一结果"""
+
+    def __init__(self, poll_interval: float = 0.5, grace: float = 1.0):
+        self.poll_interval = poll_interval  # 等待时检查调用方截止时间（客户端断开）的间隔
+        self.grace = grace  # 调用方截止时共享任务也已截止（正在返回部分结果），额外等待的秒数
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.executions = 0  # 实际执行次数
+        self.coalesced = 0  # 被合并（直接等待共享结果）的调用次数
+        self.coalesced_by_operation: Dict[str, int] = {}
+        self.abandoned = 0  # 所有调用方都已离开而被取消的共享任务数
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行func，若相同key的调用正在进行则直接等待其结果
+
+        Args:
+            key: 合并键，第一个元素为操作名，例如 ("summarize_specs", product_name, product_features)
+            func: 无参数的协程工厂函数
+
+        Returns:
+            func的返回值（同一批等待者拿到的是同一个结果对象）
+
+        Raises:
+            DeadlineExceeded: 调用方自己的截止时间已到（共享任务继续为其他调用方执行）
+        """
+        loop = asyncio.get_running_loop()
+        caller_deadline = current_deadline()
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None and flight.task.get_loop() is loop and not flight.deadline.cancelled:
+                self.coalesced += 1
+                operation = str(key[0]) if isinstance(key, tuple) and key else str(key)
+                self.coalesced_by_operation[operation] = self.coalesced_by_operation.get(operation, 0) + 1
+            else:
+                # 共享任务使用自己的截止时间（跟随等待者而不是第一个调用方）：某个调用方超时或
+                # 断开连接时，不会连带截断或取消其他等待者的结果
+                # 任务创建后要等本协程让出事件循环才开始执行，此时下面已按本调用方设置好截止时间
+                flight = _Flight(None, Deadline(0))
+                flight.task = detached_context(flight.deadline).run(lambda: loop.create_task(func()))
+                self._inflight[key] = flight
+                self.executions += 1
+                flight.task.add_done_callback(lambda t, k=key, f=flight: self._on_done(k, f))
+            flight.waiters.append(caller_deadline)
+            flight.refresh_deadline()
+
+        try:
+            return await self._wait(flight)
+        finally:
+            with self._lock:
+                flight.waiters.remove(caller_deadline)
+                flight.refresh_deadline()
+                abandoned = not flight.waiters and not flight.task.done()
+                if abandoned:
+                    self.abandoned += 1
+            if abandoned:
+                flight.deadline.cancel("所有等待的请求均已结束")
+
+    async def _wait(self, flight: _Flight) -> Any:
+        """按调用方自己的截止时间等待共享任务（等待方被取消或截止时不影响共享任务）"""
+        task = flight.task
+        deadline = current_deadline()
+        if deadline is None:
+            return await asyncio.shield(task)
+        while not task.done():
+            if deadline.expired and flight.deadline.expired and self.grace > 0:
+                # 没有其他调用方需要更晚的结果：共享任务在截止检查点停止，稍等即可拿到已有的部分结果
+                await asyncio.wait({task}, timeout=self.grace)
+                if task.done():
+                    break
+            deadline.check()
+            await asyncio.wait({task}, timeout=min(self.poll_interval, deadline.remaining()))
+        return task.result()
+
+    def _on_done(self, key: Hashable, flight: _Flight):
+        """共享任务完成后移除，后续相同调用重新执行"""
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        if not flight.task.cancelled():
+            # 所有等待者都已离开时避免"exception was never retrieved"警告
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """请求合并统计"""
+        with self._lock:
+            return {
+                "inflight": len(self._inflight),
+                "executions": self.executions,
+                "coalesced_waiters": self.coalesced,
+                "coalesced_by_operation": dict(self.coalesced_by_operation),
+                "abandoned": self.abandoned,
+            }
+
+
+# 进程内共享的请求合并器
+knowledge_single_flight = SingleFlight()
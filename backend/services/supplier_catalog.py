@@ -0,0 +1,377 @@
+"""
+本地定商供应商目录
+集团/油田两个定商文档是固定表格，之前每个产品都要远程检索一次，再把最多8000字符的表格文本
+交给LLM把供应商行提取出来。这里一次性拉取两个文档的全部structured chunk（table_chunk_fields），
+按列映射后保存到本地SQLite表，并为供应商名称、子分类名称/编码、产品名称、有效期建立索引，
+另外用字符二元组建立倒排索引，供应商查询在本地毫秒级完成。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.supplier_fields import (
+    build_original_content,
+    get_table_fields,
+    map_table_fields,
+    parse_date,
+)
+from utils.config import Config
+
+# 倒排索引的字段及其权重：物资类别/产品名称命中比供应商名称命中更能说明相关性
+_TERM_FIELDS = {"sub_category_name": 1.0, "product_name": 1.0, "supplier_name": 0.5}
+_TERM_CLEAN_PATTERN = re.compile(r"[^0-9a-zA-Z\u4e00-\u9fff]+")
+
+
+def log_with_time(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[{timestamp}] {message}")
+
+
+def make_terms(text: Optional[str]) -> List[str]:
+    """把文本切分为字符二元组（单字文本返回单字），用于倒排索引和查询"""
+    cleaned = _TERM_CLEAN_PATTERN.sub("", (text or "").lower())
+    if len(cleaned) <= 1:
+        return [cleaned] if cleaned else []
+    return list(dict.fromkeys(cleaned[i:i + 2] for i in range(len(cleaned) - 1)))
+
+
+def term_match_score(query: Optional[str], texts: Iterable[Optional[str]]) -> float:
+    """query的二元组在texts中命中的比例（0-1），与目录查询的匹配分口径一致"""
+    query_terms = make_terms(query)
+    if not query_terms:
+        return 0.0
+    target = set()
+    for text in texts:
+        target.update(make_terms(text))
+    return sum(1 for term in query_terms if term in target) / len(query_terms)
+
+
+class SupplierCatalog:
+    """定商供应商目录（SQLite列式存储 + 倒排索引）"""
+
+    def __init__(self, db_path: str, refresh_hours: float, min_score: float):
+        self.db_path = db_path
+        self.refresh_hours = refresh_hours
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.syncing = False
+        self.last_sync_error: Optional[str] = None
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """延迟打开数据库连接并建表（调用方需持有self._lock）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS supplier_rows (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doc_id TEXT NOT NULL,
+                    doc_name TEXT,
+                    point_id TEXT,
+                    supplier_name TEXT NOT NULL,
+                    supplier_type TEXT,
+                    sub_category_name TEXT,
+                    sub_category_code TEXT,
+                    product_name TEXT,
+                    valid_from TEXT,
+                    valid_to TEXT,
+                    contact_person TEXT,
+                    content TEXT,
+                    fields_json TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_supplier_rows_supplier_name ON supplier_rows(supplier_name);
+                CREATE INDEX IF NOT EXISTS idx_supplier_rows_sub_category_name ON supplier_rows(sub_category_name);
+                CREATE INDEX IF NOT EXISTS idx_supplier_rows_sub_category_code ON supplier_rows(sub_category_code);
+                CREATE INDEX IF NOT EXISTS idx_supplier_rows_product_name ON supplier_rows(product_name);
+                CREATE INDEX IF NOT EXISTS idx_supplier_rows_valid_to ON supplier_rows(valid_to);
+                CREATE INDEX IF NOT EXISTS idx_supplier_rows_valid_from ON supplier_rows(valid_from);
+                CREATE INDEX IF NOT EXISTS idx_supplier_rows_doc ON supplier_rows(doc_id);
+                CREATE TABLE IF NOT EXISTS supplier_terms (
+                    term TEXT NOT NULL,
+                    row_id INTEGER NOT NULL,
+                    field TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_supplier_terms_term ON supplier_terms(term);
+                CREATE INDEX IF NOT EXISTS idx_supplier_terms_row ON supplier_terms(row_id);
+                CREATE TABLE IF NOT EXISTS catalog_sync (
+                    doc_id TEXT PRIMARY KEY,
+                    doc_name TEXT,
+                    rows INTEGER NOT NULL,
+                    points INTEGER NOT NULL,
+                    synced_at REAL NOT NULL
+                );
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    # ------------------------------------------------------------------
+    # 同步
+    # ------------------------------------------------------------------
+    def is_ready(self) -> bool:
+        """目录中是否已有数据"""
+        with self._lock:
+            row = self._get_conn().execute("SELECT COUNT(*) AS count FROM catalog_sync WHERE rows > 0").fetchone()
+        return row["count"] > 0
+
+    def is_stale(self) -> bool:
+        """目录为空或距上次同步超过refresh_hours"""
+        with self._lock:
+            row = self._get_conn().execute("SELECT MIN(synced_at) AS synced_at FROM catalog_sync").fetchone()
+        synced_at = row["synced_at"]
+        return synced_at is None or time.time() - synced_at > self.refresh_hours * 3600
+
+    def sync(self, knowledge_service: Any) -> Dict[str, Any]:
+        """
+        从知识库拉取两个定商文档的全部structured chunk并重建目录
+        每个文档在一个事务内替换，同步过程中查询仍然读取旧数据
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return {"status": "running"}
+        self.syncing = True
+        start_time = time.time()
+        result: Dict[str, Any] = {"status": "ok", "docs": {}}
+        try:
+            docs = {
+                knowledge_service.group_doc_id: "集团定商采购",
+                knowledge_service.oilfield_doc_id: "油田定商采购",
+            }
+            for doc_id, doc_name in docs.items():
+                if not doc_id:
+                    continue
+                doc_start = time.time()
+                points = knowledge_service.list_doc_points(doc_id)
+                rows = list(self._points_to_rows(points, doc_id, doc_name))
+                self._replace_doc(doc_id, doc_name, rows, len(points))
+                result["docs"][doc_id] = {"doc_name": doc_name, "points": len(points), "rows": len(rows)}
+                log_with_time(
+                    f"[供应商目录] 文档 {doc_name} 同步完成 (耗时: {time.time() - doc_start:.2f}秒)，"
+                    f"chunk数: {len(points)}，供应商行数: {len(rows)}"
+                )
+            self.last_sync_error = None
+        except Exception as e:
+            self.last_sync_error = str(e)
+            result = {"status": "error", "error": str(e), "docs": result["docs"]}
+            log_with_time(f"[供应商目录] 同步失败: {e}")
+        finally:
+            result["elapsed"] = round(time.time() - start_time, 2)
+            self.syncing = False
+            self._sync_lock.release()
+        return result
+
+    def sync_async_if_stale(self, service_factory):
+        """目录为空或过期时在后台线程中同步（service_factory在线程中创建KnowledgeService）"""
+        if not self.is_stale():
+            return
+
+        def _run():
+            try:
+                self.sync(service_factory())
+            except Exception as e:
+                self.last_sync_error = str(e)
+                log_with_time(f"[供应商目录] 后台同步失败: {e}")
+
+        threading.Thread(target=_run, name="supplier-catalog-sync", daemon=True).start()
+
+    def _points_to_rows(self, points: Iterable[Any], doc_id: str, doc_name: str) -> Iterable[Dict[str, Any]]:
+        """structured chunk -> 供应商行（按列名映射，不调用LLM）"""
+        for point in points:
+            if isinstance(point, dict):
+                chunk_type = point.get("chunk_type", "")
+                content = point.get("content", "") or ""
+                point_id = point.get("point_id", point.get("id", point.get("chunk_id", ""))) or ""
+            else:
+                chunk_type = getattr(point, "chunk_type", "") or ""
+                content = getattr(point, "content", "") or ""
+                point_id = getattr(point, "point_id", None) or getattr(point, "chunk_id", "") or ""
+            table_fields = get_table_fields(point)
+            if not table_fields or (chunk_type and chunk_type != "structured"):
+                continue
+            mapped = map_table_fields(table_fields)
+            if not mapped.get("supplier_name"):
+                continue
+            yield {
+                "doc_id": doc_id,
+                "doc_name": doc_name,
+                "point_id": str(point_id),
+                "supplier_name": mapped["supplier_name"],
+                "supplier_type": mapped.get("supplier_type"),
+                "sub_category_name": mapped.get("sub_category_name"),
+                "sub_category_code": mapped.get("sub_category_code"),
+                "product_name": mapped.get("product_name"),
+                # 规范化为YYYY-MM-DD便于按日期比较，无法解析时保留原文
+                "valid_from": parse_date(mapped.get("valid_from")) or mapped.get("valid_from"),
+                "valid_to": parse_date(mapped.get("valid_to")) or mapped.get("valid_to"),
+                "contact_person": mapped.get("contact_person"),
+                "content": build_original_content(table_fields, content),
+                "fields_json": json.dumps(table_fields, ensure_ascii=False),
+            }
+
+    def _replace_doc(self, doc_id: str, doc_name: str, rows: List[Dict[str, Any]], point_count: int):
+        with self._lock:
+            conn = self._get_conn()
+            try:
+                conn.execute("BEGIN")
+                conn.execute(
+                    "DELETE FROM supplier_terms WHERE row_id IN (SELECT id FROM supplier_rows WHERE doc_id = ?)",
+                    (doc_id,)
+                )
+                conn.execute("DELETE FROM supplier_rows WHERE doc_id = ?", (doc_id,))
+                for row in rows:
+                    cursor = conn.execute(
+                        """
+                        INSERT INTO supplier_rows
+                            (doc_id, doc_name, point_id, supplier_name, supplier_type, sub_category_name,
+                             sub_category_code, product_name, valid_from, valid_to, contact_person, content, fields_json)
+                        VALUES (:doc_id, :doc_name, :point_id, :supplier_name, :supplier_type, :sub_category_name,
+                                :sub_category_code, :product_name, :valid_from, :valid_to, :contact_person, :content, :fields_json)
+                        """,
+                        row
+                    )
+                    row_id = cursor.lastrowid
+                    conn.executemany(
+                        "INSERT INTO supplier_terms (term, row_id, field) VALUES (?, ?, ?)",
+                        [(term, row_id, field) for field in _TERM_FIELDS for term in make_terms(row.get(field))]
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO catalog_sync (doc_id, doc_name, rows, points, synced_at) VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, doc_name, len(rows), point_count, time.time())
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def search(self, product_name: str, limit: int = 30, exclude_expired: bool = False,
+               min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        按产品名称在本地目录中查找候选供应商
+
+        Args:
+            product_name: 产品名称
+            limit: 最多返回的候选数
+            exclude_expired: 是否排除有效期已过的供应商
+            min_score: 最低匹配分（0-1，产品名称二元组的加权命中比例）
+
+        Returns:
+            供应商行字典列表（含score），按匹配分降序；同一供应商同一子分类只保留一行
+        """
+        start_time = time.time()
+        query_terms = make_terms(product_name)
+        if not query_terms:
+            return []
+        min_score = self.min_score if min_score is None else min_score
+
+        placeholders = ",".join("?" for _ in query_terms)
+        with self._lock:
+            conn = self._get_conn()
+            hits = conn.execute(
+                f"SELECT row_id, field, COUNT(DISTINCT term) AS matched FROM supplier_terms "
+                f"WHERE term IN ({placeholders}) GROUP BY row_id, field",
+                query_terms
+            ).fetchall()
+            scores: Dict[int, float] = defaultdict(float)
+            for hit in hits:
+                scores[hit["row_id"]] += hit["matched"] * _TERM_FIELDS.get(hit["field"], 0.0)
+            candidates = sorted(
+                ((row_id, min(score / len(query_terms), 1.0)) for row_id, score in scores.items()),
+                key=lambda item: item[1],
+                reverse=True
+            )
+            candidates = [(row_id, score) for row_id, score in candidates if score >= min_score]
+            rows_by_id: Dict[int, Dict[str, Any]] = {}
+            # 先多取一些，去重和过滤过期后再截断
+            for chunk_start in range(0, min(len(candidates), limit * 4), 500):
+                ids = [row_id for row_id, _ in candidates[chunk_start:chunk_start + 500]]
+                id_placeholders = ",".join("?" for _ in ids)
+                for row in conn.execute(f"SELECT * FROM supplier_rows WHERE id IN ({id_placeholders})", ids):
+                    rows_by_id[row["id"]] = dict(row)
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        results = []
+        seen: set = set()
+        for row_id, score in candidates:
+            row = rows_by_id.get(row_id)
+            if row is None:
+                continue
+            if exclude_expired and row.get("valid_to") and re.match(r"\d{4}-\d{2}-\d{2}$", row["valid_to"]) and row["valid_to"] < today:
+                continue
+            dedupe_key = (row["supplier_name"], row.get("sub_category_code") or row.get("sub_category_name"))
+            if dedupe_key in seen:
+                continue
+            seen.add(dedupe_key)
+            row["score"] = round(score, 4)
+            results.append(row)
+            if len(results) >= limit:
+                break
+
+        elapsed = time.time() - start_time
+        self.lookups += 1
+        self.lookup_seconds += elapsed
+        log_with_time(f"[供应商目录] 本地查询: {product_name}，候选 {len(results)} 个 (耗时: {elapsed * 1000:.1f}毫秒)")
+        return results
+
+    def find_by_supplier_name(self, supplier_name: str) -> List[Dict[str, Any]]:
+        """按供应商名称精确查找目录行"""
+        with self._lock:
+            rows = self._get_conn().execute(
+                "SELECT * FROM supplier_rows WHERE supplier_name = ?", (supplier_name,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_by_sub_category(self, code: Optional[str] = None, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按子分类编码或名称精确查找目录行"""
+        if not code and not name:
+            return []
+        column, value = ("sub_category_code", code) if code else ("sub_category_name", name)
+        with self._lock:
+            rows = self._get_conn().execute(
+                f"SELECT * FROM supplier_rows WHERE {column} = ?", (value,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """目录统计信息"""
+        with self._lock:
+            conn = self._get_conn()
+            docs = [dict(row) for row in conn.execute("SELECT * FROM catalog_sync")]
+            total_rows = conn.execute("SELECT COUNT(*) AS count FROM supplier_rows").fetchone()["count"]
+            total_terms = conn.execute("SELECT COUNT(*) AS count FROM supplier_terms").fetchone()["count"]
+        return {
+            "enabled": Config.SUPPLIER_CATALOG_ENABLED,
+            "db_path": self.db_path,
+            "rows": total_rows,
+            "terms": total_terms,
+            "docs": docs,
+            "syncing": self.syncing,
+            "last_sync_error": self.last_sync_error,
+            "lookups": self.lookups,
+            "avg_lookup_ms": round(self.lookup_seconds * 1000 / self.lookups, 2) if self.lookups else 0.0,
+        }
+
+
+# 进程内共享的供应商目录
+supplier_catalog = SupplierCatalog(
+    db_path=Config.SUPPLIER_CATALOG_PATH,
+    refresh_hours=Config.SUPPLIER_CATALOG_REFRESH_HOURS,
+    min_score=Config.SUPPLIER_CATALOG_MIN_SCORE,
+)
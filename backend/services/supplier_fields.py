@@ -0,0 +1,159 @@
+"""
+定商表格字段映射
+定商文档是固定结构的表格，知识库返回的structured chunk中 table_chunk_fields 为
+[{"field_name": "供应商名称", "field_value": "..."}, ...]。这里按列名把字段映射为
+供应商名称、类型、子分类、产品名称、有效期、联系人等标准字段，不需要调用LLM。
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.config import Config
+
+# 标准字段 -> 列名别名（先精确匹配，再按最长别名包含匹配）
+FIELD_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "supplier_name": ("供应商名称", "供应商全称", "厂商名称", "厂家名称", "企业名称", "单位名称", "公司名称", "供应商", "厂家", "厂商"),
+    "supplier_type": ("供应商类型", "供应商类别", "厂商类型", "供应商性质", "类型"),
+    "sub_category_name": ("子分类名称", "子类名称", "物资小类名称", "小类名称", "物资类别", "物资分类", "品类名称", "子分类", "小类"),
+    "sub_category_code": ("子分类编码", "子类编码", "物资小类编码", "小类编码", "物资分类编码", "分类编码", "品类编码", "物资编码"),
+    "product_name": ("产品名称", "物资名称", "商品名称", "品名", "产品"),
+    "valid_from": ("有效期开始", "有效期起", "有效期自", "开始日期", "起始日期", "生效日期"),
+    "valid_to": ("有效期结束", "有效期止", "有效期至", "截止日期", "结束日期", "到期日期", "失效日期"),
+    "validity": ("有效期限", "有效日期", "有效期"),
+    "contact_person": ("联系人姓名", "业务联系人", "联系人"),
+    "contact_phone": ("联系电话", "联系方式", "手机号码", "电话"),
+}
+
+
+
+def _load_extra_aliases(raw: str) -> None:
+    """合并配置中追加的列名别名（SUPPLIER_FIELD_ALIASES），配置格式错误时忽略"""
+    if not raw:
+        return
+    try:
+        extra = json.loads(raw)
+    except json.JSONDecodeError as e:
+        print(f"[定商字段] SUPPLIER_FIELD_ALIASES 不是有效的JSON，已忽略: {e}")
+        return
+    if not isinstance(extra, dict):
+        return
+    for canonical, aliases in extra.items():
+        if isinstance(aliases, str):
+            aliases = [aliases]
+        names = tuple(_normalize_field_name(str(alias)) for alias in aliases or [] if alias)
+        # 配置的别名优先于内置别名
+        FIELD_ALIASES[canonical] = names + tuple(a for a in FIELD_ALIASES.get(canonical, ()) if a not in names)
+
+
+# 字段值中出现这些词时不是供应商名称
+_NON_SUPPLIER_VALUES = {"制造商", "供货商", "定商定价", "定商", "集团", "油田"}
+
+_DATE_PATTERN = re.compile(r"(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*日?")
+_RANGE_SPLIT_PATTERN = re.compile(r"\s*(?:至|到|~|～|—+|--)\s*")
+_NAME_CLEAN_PATTERN = re.compile(r"[\s:：()（）\[\]【】_\-]+")
+
+
+def _normalize_field_name(name: str) -> str:
+    return _NAME_CLEAN_PATTERN.sub("", name or "")
+
+
+_load_extra_aliases(Config.SUPPLIER_FIELD_ALIASES)
+
+
+def canonical_field(field_name: str) -> Optional[str]:
+    """列名 -> 标准字段名，无法识别时返回None"""
+    name = _normalize_field_name(field_name)
+    if not name:
+        return None
+    for canonical, aliases in FIELD_ALIASES.items():
+        if name in aliases:
+            return canonical
+    best, best_len = None, 0
+    for canonical, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            if alias in name and len(alias) > best_len:
+                best, best_len = canonical, len(alias)
+    return best
+
+
+def parse_date(value: Optional[str]) -> Optional[str]:
+    """把常见日期写法规范为YYYY-MM-DD，无法解析时返回None"""
+    if not value:
+        return None
+    match = _DATE_PATTERN.search(str(value))
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def get_table_fields(point: Any) -> List[Dict[str, str]]:
+    """读取point的table_chunk_fields，统一为 [{"field_name", "field_value"}] 列表（兼容dict和对象）"""
+    if isinstance(point, dict):
+        raw_fields = point.get("table_chunk_fields") or []
+    else:
+        raw_fields = getattr(point, "table_chunk_fields", None) or []
+    if isinstance(raw_fields, str):
+        try:
+            raw_fields = json.loads(raw_fields)
+        except (json.JSONDecodeError, TypeError):
+            return []
+    fields = []
+    for field in raw_fields:
+        if isinstance(field, dict):
+            name = field.get("field_name", "")
+            value = field.get("field_value", "")
+        else:
+            name = getattr(field, "field_name", "")
+            value = getattr(field, "field_value", field if isinstance(field, str) else "")
+        value = "" if value is None else str(value).strip()
+        fields.append({"field_name": str(name or "").strip(), "field_value": value})
+    return fields
+
+
+def map_table_fields(table_fields: List[Dict[str, str]]) -> Dict[str, str]:
+    """
+    按列名把表格字段映射为标准字段
+    同一标准字段出现多列时保留第一个非空值；"有效期"列会拆分为开始/结束日期
+    """
+    mapped: Dict[str, str] = {}
+    for field in table_fields:
+        value = field.get("field_value", "")
+        if not value:
+            continue
+        canonical = canonical_field(field.get("field_name", ""))
+        if canonical and canonical not in mapped:
+            mapped[canonical] = value
+
+    validity = mapped.pop("validity", None)
+    if validity:
+        parts = [part for part in _RANGE_SPLIT_PATTERN.split(validity) if part]
+        if parts and "valid_from" not in mapped:
+            mapped["valid_from"] = parts[0]
+        if len(parts) > 1 and "valid_to" not in mapped:
+            mapped["valid_to"] = parts[-1]
+
+    if "supplier_name" not in mapped:
+        # 列名无法识别时按旧规则从字段值中找公司名称
+        for field in table_fields:
+            value = field.get("field_value", "")
+            if ("公司" in value or "集团" in value or "厂" in value) and value not in _NON_SUPPLIER_VALUES:
+                mapped["supplier_name"] = value
+                break
+    return mapped
+
+
+def build_original_content(table_fields: List[Dict[str, str]], content: str = "") -> str:
+    """构建查看原文用的完整内容（字段名: 字段值，每行一个），与批量提取保持一致"""
+    parts = []
+    for field in table_fields:
+        name, value = field.get("field_name", ""), field.get("field_value", "")
+        if name and value:
+            parts.append(f"{name}: {value}")
+        elif value:
+            parts.append(value)
+    if content:
+        parts.append(content)
+    return "\n".join(parts)
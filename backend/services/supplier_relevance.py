@@ -0,0 +1,160 @@
+"""
+多产品供应商相关性批量判断
+批量查询（/api/knowledge/search-batch）和后台补全任务会同时处理多个产品，之前每个产品各调用一次LLM
+判断候选供应商的相关性。这里把短时间窗口内到达的多个产品的判断请求合并为一次LLM调用：
+第一个到达的请求作为leader等待窗口结束（或凑满一批），然后一次性处理所有等待中的请求，
+再把结果按产品拆分返回给各自的调用线程。交互式单产品查询不启用合并，避免额外等待。
+合并后的判断在独立的线程池中执行，不使用leader的请求截止时间（截止时间取这一批中最晚的一个）；
+每个请求按自己的剩余时间等待，等不到时改为单独判断或直接使用匹配分结果，不会被其他请求拖慢或截断。
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+from utils.config import Config
+from utils.deadline import Deadline, current_deadline, detached_context, remaining_time
+
+# 当前调用是否处于批量场景（由批量查询和后台补全任务设置，随contextvars传递到线程池）
+_batched_relevance: contextvars.ContextVar = contextvars.ContextVar("batched_supplier_relevance", default=False)
+
+
+def log_with_time(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[{timestamp}] {message}")
+
+
+@contextmanager
+def batched_relevance():
+    """在该上下文中发起的供应商查询使用多产品合并的相关性判断"""
+    token = _batched_relevance.set(True)
+    try:
+        yield
+    finally:
+        _batched_relevance.reset(token)
+
+
+def is_batched_relevance() -> bool:
+    return _batched_relevance.get() and Config.SUPPLIER_RELEVANCE_BATCH_SIZE > 1
+
+
+class _RankRequest:
+    def __init__(self, payload: Any, deadline: Optional[Deadline]):
+        self.payload = payload
+        self.deadline = deadline
+        self.result: Optional[Any] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class SupplierRelevanceBatcher:
+    """把并发到达的相关性判断请求按窗口合并后批量执行"""
+
+    def __init__(self, batch_size: int, max_wait: float, wait_timeout: float, max_workers: int = 4):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.wait_timeout = wait_timeout  # 没有请求截止时间时，等待合并结果的最长时间
+        self.max_workers = max_workers
+        self._cond = threading.Condition()
+        self._pending: List[_RankRequest] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.requests = 0
+        self.llm_calls = 0
+        self.wait_timeouts = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._cond:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="supplier-relevance"
+                    )
+        return self._executor
+
+    def rank(self, rank_batch: Callable[[List[Any]], List[Any]], payload: Any, fallback: Callable[[], Any]) -> Any:
+        """
+        提交一个产品的判断请求并等待结果（阻塞调用，需在线程池中执行）
+        rank_batch接收多个payload，按相同顺序返回各自的结果；
+        在当前请求的剩余时间内（没有截止时间时为wait_timeout）等不到结果时返回fallback()
+        """
+        request = _RankRequest(payload, current_deadline())
+        with self._cond:
+            self._pending.append(request)
+            self.requests += 1
+            leader = len(self._pending) == 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+        if leader:
+            window_end = time.time() + min(self.max_wait, remaining_time(self.max_wait))
+            with self._cond:
+                while len(self._pending) < self.batch_size:
+                    remaining = window_end - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+            for start in range(0, len(batch), self.batch_size):
+                self._submit(rank_batch, batch[start:start + self.batch_size])
+
+        if not request.done.wait(max(0.0, remaining_time(self.wait_timeout))):
+            with self._cond:
+                if request in self._pending:
+                    self._pending.remove(request)
+                self.wait_timeouts += 1
+            log_with_time("[供应商相关性-批量] 等待合并判断结果超时，改为单独处理")
+            return fallback()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _submit(self, rank_batch: Callable[[List[Any]], List[Any]], batch: List[_RankRequest]):
+        """
+        在独立线程中执行一批判断：不继承leader的截止时间，改用这一批中最晚的截止时间
+        （有请求没有截止时间时不设截止时间，由模型调用超时兜底）
+        """
+        if any(request.deadline is None for request in batch):
+            deadline = None
+        else:
+            deadline = Deadline(max(request.deadline.remaining() for request in batch))
+        ctx = detached_context(deadline)
+        self._get_executor().submit(ctx.run, self._run, rank_batch, batch)
+
+    def _run(self, rank_batch: Callable[[List[Any]], List[Any]], batch: List[_RankRequest]):
+        start_time = time.time()
+        try:
+            results = rank_batch([request.payload for request in batch])
+            with self._cond:
+                self.llm_calls += 1
+            for request, result in zip(batch, results):
+                request.result = result
+            log_with_time(f"[供应商相关性-批量] {len(batch)} 个产品合并为一次判断 (耗时: {time.time() - start_time:.2f}秒)")
+        except BaseException as e:
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "batch_size": self.batch_size,
+                "max_wait": self.max_wait,
+                "requests": self.requests,
+                "llm_calls": self.llm_calls,
+                "wait_timeouts": self.wait_timeouts,
+                "pending": len(self._pending),
+            }
+
+
+supplier_relevance_batcher = SupplierRelevanceBatcher(
+    batch_size=Config.SUPPLIER_RELEVANCE_BATCH_SIZE,
+    max_wait=Config.SUPPLIER_RELEVANCE_BATCH_WAIT,
+    wait_timeout=Config.LLM_TIMEOUT_PROFILES["supplier_filter"] + Config.SUPPLIER_RELEVANCE_BATCH_WAIT
+)
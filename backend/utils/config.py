@@ -13,6 +13,74 @@ class Config:
     ARK_API_KEY = os.getenv("ARK_API_KEY", "")
     ARK_BASE_URL = os.getenv("ARK_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
     ARK_MODEL = os.getenv("ARK_MODEL", "doubao-seed-1-6-flash-250828")
+    # Ark模型客户端连接池（进程内共享，保持长连接复用TLS会话）
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    # 各类任务的模型调用超时（秒）
+    LLM_TIMEOUT_PROFILES = {
+        "default": float(os.getenv("LLM_TIMEOUT_DEFAULT", "180")),
+        "spec_summary": float(os.getenv("LLM_TIMEOUT_SPEC_SUMMARY", "180")),
+        "supplier_extract": float(os.getenv("LLM_TIMEOUT_SUPPLIER_EXTRACT", "180")),
+        "supplier_filter": float(os.getenv("LLM_TIMEOUT_SUPPLIER_FILTER", "180")),
+        "qa": float(os.getenv("LLM_TIMEOUT_QA", "180")),
+        "certificate": float(os.getenv("LLM_TIMEOUT_CERTIFICATE", "180")),
+    }
+    # 按任务路由模型：每个任务的模型、温度、max_tokens、超时（秒）和延迟SLO（秒，0表示不检查）
+    # model为空时使用ARK_MODEL；主模型近期延迟超过SLO时在冷却期内改用备用模型
+    LLM_ROUTES = {
+        "default": {"temperature": 0.3, "max_tokens": 2000, "timeout": LLM_TIMEOUT_PROFILES["default"], "slo": 0},
+        "spec_summary": {"temperature": 0.3, "max_tokens": 2000, "timeout": LLM_TIMEOUT_PROFILES["spec_summary"], "slo": 60},
+        "qa": {"temperature": 0.3, "max_tokens": 2000, "timeout": LLM_TIMEOUT_PROFILES["qa"], "slo": 60},
+        "supplier_extract_batch": {"temperature": 0.1, "max_tokens": 2000, "timeout": LLM_TIMEOUT_PROFILES["supplier_extract"], "slo": 40},
+        "supplier_extract": {"temperature": 0.1, "max_tokens": 500, "timeout": LLM_TIMEOUT_PROFILES["supplier_extract"], "slo": 20},
+        "supplier_filter": {"temperature": 0.1, "max_tokens": 200, "timeout": LLM_TIMEOUT_PROFILES["supplier_filter"], "slo": 20},
+        "supplier_rank": {"temperature": 0.1, "max_tokens": 800, "timeout": LLM_TIMEOUT_PROFILES["supplier_filter"], "slo": 15},
+        "supplier_rank_batch": {"temperature": 0.1, "max_tokens": 1000, "timeout": LLM_TIMEOUT_PROFILES["supplier_filter"], "slo": 30},
+        "certificate": {"temperature": 0.1, "max_tokens": 4000, "timeout": LLM_TIMEOUT_PROFILES["certificate"], "slo": 60},
+    }
+    # 覆盖路由表（JSON），例如 {"supplier_rank": {"model": "doubao-lite-32k", "slo": 5}}
+    LLM_ROUTES_OVERRIDE = os.getenv("LLM_ROUTES", "")
+    LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+    # 最近多少次调用用于判断是否超出SLO（p90），以及降级到备用模型后的冷却时间（秒）
+    LLM_SLO_WINDOW = int(os.getenv("LLM_SLO_WINDOW", "20"))
+    LLM_SLO_COOLDOWN = float(os.getenv("LLM_SLO_COOLDOWN", "120"))
+    # 流式调用是否请求返回token用量（stream_options.include_usage）
+    LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "True").lower() == "true"
+    
+    # 外部服务限流：令牌桶限制每秒请求数（RATE/BURST），并发上限按AIMD自适应调整——
+    # 成功时缓慢增加，遇到429/限流/超时时减半（不低于MIN、不超过MAX）
+    ARK_RATE_LIMIT = float(os.getenv("ARK_RATE_LIMIT", "10"))
+    ARK_RATE_BURST = int(os.getenv("ARK_RATE_BURST", "20"))
+    ARK_CONCURRENCY_MIN = int(os.getenv("ARK_CONCURRENCY_MIN", "2"))
+    ARK_CONCURRENCY_MAX = int(os.getenv("ARK_CONCURRENCY_MAX", "16"))
+    ARK_CONCURRENCY_INITIAL = int(os.getenv("ARK_CONCURRENCY_INITIAL", "8"))
+    VIKING_RATE_LIMIT = float(os.getenv("VIKING_RATE_LIMIT", "20"))
+    VIKING_RATE_BURST = int(os.getenv("VIKING_RATE_BURST", "20"))
+    VIKING_CONCURRENCY_MIN = int(os.getenv("VIKING_CONCURRENCY_MIN", "2"))
+    VIKING_CONCURRENCY_MAX = int(os.getenv("VIKING_CONCURRENCY_MAX", "16"))
+    VIKING_CONCURRENCY_INITIAL = int(os.getenv("VIKING_CONCURRENCY_INITIAL", "8"))
+    # 等待限流许可的最长时间（秒），请求有截止时间时以截止时间为准
+    RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "120"))
+    # 模型调用被限流（429）时的重试次数（指数退避+随机抖动）；OpenAI SDK自身不再重试，避免绕过限流器
+    LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "2"))
+    
+    # 提示词参考资料的token预算（按任务），以及单个chunk的token上限（超过时按行截断）
+    CONTEXT_TOKEN_BUDGETS = {
+        "default": int(os.getenv("CONTEXT_TOKENS_DEFAULT", "4000")),
+        "spec_summary": int(os.getenv("CONTEXT_TOKENS_SPEC_SUMMARY", "3200")),
+        "qa": int(os.getenv("CONTEXT_TOKENS_QA", "4000")),
+        "supplier_extract": int(os.getenv("CONTEXT_TOKENS_SUPPLIER_EXTRACT", "6000")),
+        "certificate": int(os.getenv("CONTEXT_TOKENS_CERTIFICATE", "16000")),
+    }
+    CONTEXT_CHUNK_TOKEN_LIMITS = {
+        "default": int(os.getenv("CONTEXT_CHUNK_TOKENS_DEFAULT", "1000")),
+        "spec_summary": int(os.getenv("CONTEXT_CHUNK_TOKENS_SPEC_SUMMARY", "1000")),
+        "qa": int(os.getenv("CONTEXT_CHUNK_TOKENS_QA", "1000")),
+        "supplier_extract": int(os.getenv("CONTEXT_CHUNK_TOKENS_SUPPLIER_EXTRACT", "500")),
+        "certificate": int(os.getenv("CONTEXT_CHUNK_TOKENS_CERTIFICATE", "1500")),
+    }
     
     # 阿里云百炼配置（用于MCP WebSearch网络搜索）
     DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "")
@@ -34,12 +102,107 @@ class Config:
     # retrieve_count: 检索数量（重排序前的候选数量，默认None使用系统默认值）
     KNOWLEDGE_RETRIEVE_COUNT = os.getenv("KNOWLEDGE_RETRIEVE_COUNT", "15")
     KNOWLEDGE_RETRIEVE_COUNT = int(KNOWLEDGE_RETRIEVE_COUNT) if KNOWLEDGE_RETRIEVE_COUNT else None
+    # max_workers: 知识库/LLM阻塞调用线程池大小，也是知识库连接池大小（默认16）
+    KNOWLEDGE_MAX_WORKERS = int(os.getenv("KNOWLEDGE_MAX_WORKERS", "16"))
+    # 组合查询（/api/knowledge/search）中规格、供应商两条流水线各自的超时（秒）
+    # 默认略小于前端120秒的请求超时，保证超时前能返回部分结果
+    KNOWLEDGE_SPEC_TIMEOUT = float(os.getenv("KNOWLEDGE_SPEC_TIMEOUT", "110"))
+    KNOWLEDGE_SUPPLIER_TIMEOUT = float(os.getenv("KNOWLEDGE_SUPPLIER_TIMEOUT", "110"))
+    # 请求级截止时间（秒）：前端通过 X-Request-Timeout 请求头告知自己的超时，后端减去余量后作为截止时间，
+    # 知识库检索和模型调用只使用剩余时间；没有请求头时使用 KNOWLEDGE_REQUEST_TIMEOUT
+    KNOWLEDGE_REQUEST_TIMEOUT = float(os.getenv("KNOWLEDGE_REQUEST_TIMEOUT", "110"))
+    KNOWLEDGE_REQUEST_TIMEOUT_MAX = float(os.getenv("KNOWLEDGE_REQUEST_TIMEOUT_MAX", "300"))
+    KNOWLEDGE_DEADLINE_MARGIN = float(os.getenv("KNOWLEDGE_DEADLINE_MARGIN", "5"))
+    # 检查客户端是否断开的间隔（秒），断开后取消请求的截止时间，停止后续的检索和模型调用
+    KNOWLEDGE_DISCONNECT_POLL_INTERVAL = float(os.getenv("KNOWLEDGE_DISCONNECT_POLL_INTERVAL", "1"))
+    # 批量查询（/api/knowledge/search-batch）同时处理的产品数
+    KNOWLEDGE_BATCH_CONCURRENCY = int(os.getenv("KNOWLEDGE_BATCH_CONCURRENCY", "4"))
+    
+    # 知识库检索结果缓存（TTL + LRU）
+    # 相同的规范化查询+检索参数在TTL内只调用一次知识库API
+    KNOWLEDGE_CACHE_ENABLED = os.getenv("KNOWLEDGE_CACHE_ENABLED", "True").lower() == "true"
+    KNOWLEDGE_CACHE_MAX_SIZE = int(os.getenv("KNOWLEDGE_CACHE_MAX_SIZE", "2048"))
+    # TTL不宜过长：结果中的图片链接（get_attachment_link）有有效期
+    KNOWLEDGE_CACHE_TTL = float(os.getenv("KNOWLEDGE_CACHE_TTL", "1800"))
+    
+    # 知识库检索对冲请求：检索超过该调用点最近的p95延迟仍未返回时，再发出一个相同请求，先返回的生效
+    # 按调用点开关（证书查询返回的结果很大，默认不对冲）
+    KNOWLEDGE_HEDGE_SITES = {
+        "spec": os.getenv("KNOWLEDGE_HEDGE_SPEC", "True").lower() == "true",
+        "supplier": os.getenv("KNOWLEDGE_HEDGE_SUPPLIER", "True").lower() == "true",
+        "qa": os.getenv("KNOWLEDGE_HEDGE_QA", "True").lower() == "true",
+        "certificate": os.getenv("KNOWLEDGE_HEDGE_CERTIFICATE", "False").lower() == "true",
+    }
+    # 对冲请求数占检索请求数的比例上限（默认5%）
+    KNOWLEDGE_HEDGE_BUDGET = float(os.getenv("KNOWLEDGE_HEDGE_BUDGET", "0.05"))
+    KNOWLEDGE_HEDGE_PERCENTILE = float(os.getenv("KNOWLEDGE_HEDGE_PERCENTILE", "0.95"))
+    # 调用点至少有多少个耗时样本才开始对冲；对冲等待时间不低于MIN_DELAY秒
+    KNOWLEDGE_HEDGE_MIN_SAMPLES = int(os.getenv("KNOWLEDGE_HEDGE_MIN_SAMPLES", "20"))
+    KNOWLEDGE_HEDGE_MIN_DELAY = float(os.getenv("KNOWLEDGE_HEDGE_MIN_DELAY", "0.3"))
+    KNOWLEDGE_HEDGE_WINDOW = int(os.getenv("KNOWLEDGE_HEDGE_WINDOW", "200"))
+    # 对冲请求线程池大小，也是被丢弃的慢对冲请求最多占用的线程数（正常请求使用单独的线程池，大小不小于
+    # KNOWLEDGE_MAX_WORKERS和知识库并发上限；线程池占满时正常请求在调用方线程中直接执行，不对冲）
+    KNOWLEDGE_HEDGE_MAX_WORKERS = int(os.getenv("KNOWLEDGE_HEDGE_MAX_WORKERS", "8"))
     
     # 数据存储路径
     DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", "data")
     PRODUCTS_FILE = os.path.join(DATA_DIR, "products.json")
     PROJECTS_FILE = os.path.join(DATA_DIR, "projects.json")
-    
+    # 产品存储后端：json（默认，按项目保存JSON文件）或 sqlite（需显式开启，首次启动时一次性导入已有的 products_*.json，
+    # JSON文件保留不动，可以切回json）
+    DATA_STORAGE_BACKEND = os.getenv("DATA_STORAGE_BACKEND", "json").lower()
+    PRODUCTS_DB_PATH = os.getenv("PRODUCTS_DB_PATH", os.path.join(DATA_DIR, "products.sqlite3"))
+    # JSON存储的项目产品缓存上限（字节，按JSON文件大小估算，默认128MB，0表示不缓存），超过后淘汰最久未访问的项目
+    PRODUCT_CACHE_MAX_BYTES = int(os.getenv("PRODUCT_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+    # LLM结果磁盘缓存（SQLite），重启后仍然有效
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(DATA_DIR, "llm_cache.sqlite3"))
+    # 缓存总大小上限（字节，默认200MB），超过后按最近访问时间淘汰
+    LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+    LLM_CACHE_DEFAULT_TTL = float(os.getenv("LLM_CACHE_DEFAULT_TTL", str(7 * 24 * 3600)))
+    # 各任务的缓存有效期（秒）
+    LLM_CACHE_TASK_TTLS = {
+        "spec_summary": float(os.getenv("LLM_CACHE_TTL_SPEC_SUMMARY", str(7 * 24 * 3600))),
+        "supplier_extract_batch": float(os.getenv("LLM_CACHE_TTL_SUPPLIER_EXTRACT", str(3 * 24 * 3600))),
+        "supplier_extract": float(os.getenv("LLM_CACHE_TTL_SUPPLIER_EXTRACT", str(3 * 24 * 3600))),
+        "supplier_filter": float(os.getenv("LLM_CACHE_TTL_SUPPLIER_FILTER", str(3 * 24 * 3600))),
+        "supplier_rank": float(os.getenv("LLM_CACHE_TTL_SUPPLIER_FILTER", str(3 * 24 * 3600))),
+        "supplier_rank_batch": float(os.getenv("LLM_CACHE_TTL_SUPPLIER_FILTER", str(3 * 24 * 3600))),
+    }
+
+    # 本地定商供应商目录（从两个定商文档同步，供应商查询在本地完成）
+    SUPPLIER_CATALOG_ENABLED = os.getenv("SUPPLIER_CATALOG_ENABLED", "True").lower() == "true"
+    SUPPLIER_CATALOG_PATH = os.getenv("SUPPLIER_CATALOG_PATH", os.path.join(DATA_DIR, "supplier_catalog.sqlite3"))
+    # 距上次同步超过该时长（小时）后，启动时自动重新同步
+    SUPPLIER_CATALOG_REFRESH_HOURS = float(os.getenv("SUPPLIER_CATALOG_REFRESH_HOURS", "24"))
+    # 本地候选数量和最低匹配分（产品名称二元组的加权命中比例，0-1）
+    SUPPLIER_CATALOG_CANDIDATES = int(os.getenv("SUPPLIER_CATALOG_CANDIDATES", "30"))
+    SUPPLIER_CATALOG_MIN_SCORE = float(os.getenv("SUPPLIER_CATALOG_MIN_SCORE", "0.3"))
+    # 是否对本地候选再做一次LLM相关性判断（关闭时按匹配分判断）
+    SUPPLIER_CATALOG_LLM_RELEVANCE = os.getenv("SUPPLIER_CATALOG_LLM_RELEVANCE", "True").lower() == "true"
+    SUPPLIER_CATALOG_EXCLUDE_EXPIRED = os.getenv("SUPPLIER_CATALOG_EXCLUDE_EXPIRED", "False").lower() == "true"
+    # 定商表格按列名直接解析供应商字段（不调用LLM提取，LLM只判断相关性）
+    SUPPLIER_FIELD_MAPPING_ENABLED = os.getenv("SUPPLIER_FIELD_MAPPING_ENABLED", "True").lower() == "true"
+    # 追加列名别名（JSON），例如 {"supplier_name": ["中标单位"], "valid_to": ["协议到期日"]}
+    SUPPLIER_FIELD_ALIASES = os.getenv("SUPPLIER_FIELD_ALIASES", "")
+    # 批量查询/后台补全时，多个产品的供应商相关性判断合并为一次LLM调用
+    # BATCH_SIZE为每次调用最多包含的产品数（1表示不合并），BATCH_WAIT为等待凑批的时间窗口（秒）
+    SUPPLIER_RELEVANCE_BATCH_SIZE = int(os.getenv("SUPPLIER_RELEVANCE_BATCH_SIZE", "8"))
+    SUPPLIER_RELEVANCE_BATCH_WAIT = float(os.getenv("SUPPLIER_RELEVANCE_BATCH_WAIT", "0.3"))
+    # 批量提取失败后逐个提取的并发数和总截止时间（秒），截止时返回已完成的结果
+    SUPPLIER_FALLBACK_WORKERS = int(os.getenv("SUPPLIER_FALLBACK_WORKERS", "4"))
+    SUPPLIER_FALLBACK_TIMEOUT = float(os.getenv("SUPPLIER_FALLBACK_TIMEOUT", "60"))
+
+    # 后台补全任务队列（大批量BOM的规格/供应商查询，重启后继续执行）
+    ENRICHMENT_QUEUE_PATH = os.getenv("ENRICHMENT_QUEUE_PATH", os.path.join(DATA_DIR, "enrichment_queue.sqlite3"))
+    ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", "2"))
+    ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "3"))
+    # 重试退避：第n次失败后等待 BASE * 2^(n-1) 秒，最多 MAX 秒
+    ENRICHMENT_RETRY_BASE_DELAY = float(os.getenv("ENRICHMENT_RETRY_BASE_DELAY", "10"))
+    ENRICHMENT_RETRY_MAX_DELAY = float(os.getenv("ENRICHMENT_RETRY_MAX_DELAY", "300"))
+    ENRICHMENT_POLL_INTERVAL = float(os.getenv("ENRICHMENT_POLL_INTERVAL", "1.0"))
+
     # 证书文件目录（如果未配置，使用项目目录下的certificates目录）
     _default_cert_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", "certificates")
     CERTIFICATE_DIR = os.getenv("CERTIFICATE_DIR", _default_cert_dir)
@@ -0,0 +1,144 @@
+"""
+按token预算组装LLM提示词的参考资料
+之前各处按字符数截断（content[:800]、每个表格500字符、总长8000字符、最多30个chunk），
+总长度超限时会把表格从中间截断。这里统一估算token数，按检索得分排序、去掉几乎相同的chunk，
+再按任务的token预算整块装入；单个chunk超过上限时按行截断并明确标记，不会截出半行。
+"""
+import re
+from typing import Any, List, Optional, Sequence
+
+from utils.config import Config
+
+TRUNCATION_MARK = "\n……（内容过长，已截断）"
+
+# 中日韩文字及全角标点按1个token估算，其余字符按4个字符1个token估算
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_SHINGLE_CLEAN_PATTERN = re.compile(r"\s+")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """粗略估算文本的token数（偏保守，只用于预算控制）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """把文本截断到max_tokens以内：优先保留完整的行，单行超长时才按字符截断"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - estimate_tokens(TRUNCATION_MARK))
+    kept, used = [], 0
+    for line in text.split("\n"):
+        line_tokens = estimate_tokens(line) + 1
+        if used + line_tokens > budget:
+            break
+        kept.append(line)
+        used += line_tokens
+    if not kept:
+        # 第一行就超过上限（例如没有换行的长文本）
+        cut = 0
+        for char in text:
+            used += estimate_tokens(char)
+            if used > budget:
+                break
+            cut += 1
+        return text[:cut] + TRUNCATION_MARK
+    return "\n".join(kept) + TRUNCATION_MARK
+
+
+def _shingles(text: str) -> set:
+    cleaned = _SHINGLE_CLEAN_PATTERN.sub("", text)
+    if len(cleaned) < 3:
+        return {cleaned}
+    return {cleaned[i:i + 3] for i in range(len(cleaned) - 2)}
+
+
+class PackedContext:
+    """装箱结果：items/texts为保留的chunk及其文本（按得分从高到低）"""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.items: List[Any] = []
+        self.texts: List[str] = []
+        self.tokens = 0
+        self.dropped_duplicates = 0
+        self.dropped_budget = 0
+        self.truncated = 0
+
+    def summary(self) -> str:
+        """用于日志的一行说明"""
+        return (
+            f"保留 {len(self.items)} 个chunk，约 {self.tokens}/{self.budget} tokens，"
+            f"去重 {self.dropped_duplicates} 个，超预算 {self.dropped_budget} 个，截断 {self.truncated} 个"
+        )
+
+
+def pack_context(
+    items: Sequence[Any],
+    texts: Sequence[str],
+    budget: int,
+    scores: Optional[Sequence[Optional[float]]] = None,
+    max_chunk_tokens: Optional[int] = None,
+    max_items: Optional[int] = None,
+    separator_tokens: int = 2,
+    dedupe_threshold: float = 0.9,
+) -> PackedContext:
+    """
+    按token预算挑选chunk
+
+    Args:
+        items: chunk对象（原样返回，便于调用方保留slice_id等信息）
+        texts: 每个chunk放入提示词的文本
+        budget: 参考资料的token预算
+        scores: 检索得分（越大越相关），为None或缺失时按原顺序（检索排名）
+        max_chunk_tokens: 单个chunk的token上限，超过时按行截断
+        max_items: 最多保留的chunk数
+        separator_tokens: chunk之间分隔符的token估算
+        dedupe_threshold: 文本三元组Jaccard相似度达到该值视为重复
+    """
+    packed = PackedContext(budget)
+    order = list(range(len(items)))
+    if scores is not None:
+        # 有得分的按得分降序，得分相同或缺失的保持检索顺序
+        order.sort(key=lambda i: -(scores[i] if scores[i] is not None else float("-inf")))
+
+    kept_shingles = []
+    for index in order:
+        text = texts[index] or ""
+        if not text.strip():
+            # 没有文本的chunk（例如只有图片链接）不参与去重和预算，由调用方决定如何展示
+            packed.items.append(items[index])
+            packed.texts.append(text)
+            continue
+        shingles = _shingles(text)
+        if any(len(shingles & other) / max(1, len(shingles | other)) >= dedupe_threshold for other in kept_shingles):
+            packed.dropped_duplicates += 1
+            continue
+        if max_items is not None and len(packed.items) >= max_items:
+            packed.dropped_budget += 1
+            continue
+        if max_chunk_tokens and estimate_tokens(text) > max_chunk_tokens:
+            text = truncate_to_tokens(text, max_chunk_tokens)
+            packed.truncated += 1
+        cost = estimate_tokens(text) + (separator_tokens if packed.items else 0)
+        if packed.tokens + cost > budget:
+            # 整块放不下就跳过，继续尝试后面更短的chunk
+            packed.dropped_budget += 1
+            continue
+        packed.items.append(items[index])
+        packed.texts.append(text)
+        packed.tokens += cost
+        kept_shingles.append(shingles)
+    return packed
+
+
+def budget_for(task: str) -> int:
+    """获取任务的参考资料token预算"""
+    return Config.CONTEXT_TOKEN_BUDGETS.get(task, Config.CONTEXT_TOKEN_BUDGETS["default"])
+
+
+def chunk_limit_for(task: str) -> int:
+    """获取任务中单个chunk的token上限"""
+    return Config.CONTEXT_CHUNK_TOKEN_LIMITS.get(task, Config.CONTEXT_CHUNK_TOKEN_LIMITS["default"])
@@ -0,0 +1,119 @@
+"""
+请求级截止时间
+之前每一层各自写死超时（知识库SDK读取120秒、OpenAI客户端180秒、前端axios 120秒），浏览器放弃请求后
+后端还会继续调用几分钟模型。这里在API层为每个请求创建截止时间，通过contextvars随调用链传递
+（_run_blocking会复制上下文到线程池），远程调用只使用剩余时间，客户端断开时取消，
+各环节在检查点发现截止后停止后续调用，返回已有的部分结果。
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求已到截止时间或客户端已断开"""
+
+
+class Deadline:
+    """截止时间（time.time()），可以提前取消（例如客户端断开）"""
+
+    def __init__(self, seconds: float, parent: Optional["Deadline"] = None):
+        self.expires_at = time.time() + seconds
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+        self.parent = parent
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        """剩余秒数（已取消或已过期时为0）"""
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - time.time())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cancel(self, reason: str = "客户端已断开"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self):
+        """已截止时抛出DeadlineExceeded"""
+        if self.expired:
+            raise DeadlineExceeded(self.reason or (self.parent.reason if self.parent else None) or "已到请求截止时间")
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """在该上下文中发起的调用共享截止时间（嵌套时取更早的一个）"""
+    deadline = Deadline(seconds, parent=_current_deadline.get())
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current_deadline.reset(token)
+        except ValueError:
+            # 异步生成器被垃圾回收时可能在另一个上下文中关闭，此时无需恢复
+            pass
+
+
+def detached_context(deadline: Optional[Deadline] = None) -> contextvars.Context:
+    """
+    复制当前上下文，但不继承调用方的截止时间（换成deadline）
+    用于多个请求共享的任务：某个调用方超时或断开时不应截断其他调用方的结果
+    """
+    ctx = contextvars.copy_context()
+    ctx.run(_current_deadline.set, deadline)
+    return ctx
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def remaining_time(default: float) -> float:
+    """远程调用可用的超时：不超过default，也不超过当前请求的剩余时间"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    return min(default, deadline.remaining())
+
+
+def check_deadline():
+    """检查点：当前请求已截止（或客户端已断开）时抛出DeadlineExceeded，没有截止时间时不做任何事"""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def deadline_expired() -> bool:
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.expired
+
+
+def clamp_timeout(timeout):
+    """
+    按当前请求的剩余时间收紧requests风格的超时参数（秒数或 (连接, 读取) 元组）
+    用于无法按次传入超时的SDK（知识库SDK的超时在初始化时固定）
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = max(0.1, deadline.remaining())
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if value is None else min(value, remaining) for value in timeout)
+    return min(timeout, remaining)
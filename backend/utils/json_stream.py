@@ -0,0 +1,113 @@
+"""
+流式JSON数组解析
+模型逐token输出JSON数组时，每个数组元素（对象）一闭合就解析并返回，不必等待完整回复。
+回复被截断或尾部格式错误时，已经闭合的元素仍然保留，不需要整次重试。
+支持顶层数组（[{...}, ...]），也支持对象中指定键对应的数组（{"personnel_list": [{...}]}），
+前后的```json代码块标记和说明文字会被忽略。
+"""
+import json
+from typing import Any, List, Optional
+
+
+class JSONArrayStreamParser:
+    """按片段接收模型输出，返回新闭合的数组元素（只处理对象元素）"""
+
+    def __init__(self, array_key: Optional[str] = None):
+        self.array_key = array_key  # 为None时解析出现的第一个数组
+        self.items: List[Any] = []
+        self.errors = 0             # 闭合但无法解析的元素数
+        self.complete = False       # 数组是否已正常闭合
+        self.text = ""              # 收到的完整原始文本
+        self._buffer = ""
+        self._pos = 0               # 下一个待扫描字符在_buffer中的位置
+        self._in_array = False
+        self._depth = 0             # 数组内的嵌套深度（0表示位于数组元素之间）
+        self._in_string = False
+        self._escape = False
+        self._item_start = -1
+
+    def feed(self, text: str) -> List[Any]:
+        """追加一个片段，返回其中新闭合的元素"""
+        if not text:
+            return []
+        self.text += text
+        if self.complete:
+            return []
+        self._buffer += text
+        if not self._in_array and not self._find_array_start():
+            return []
+        return self._scan()
+
+    def _find_array_start(self) -> bool:
+        """定位目标数组的 '['，找到后从其后开始扫描"""
+        search_from = 0
+        if self.array_key:
+            key_pos = self._buffer.find(f'"{self.array_key}"')
+            if key_pos == -1:
+                # 保留尾部以防键名被拆到两个片段中
+                self._trim_prefix(len(self._buffer) - len(self.array_key) - 2)
+                return False
+            search_from = key_pos + len(self.array_key) + 2
+        bracket = self._buffer.find("[", search_from)
+        if bracket == -1:
+            return False
+        self._in_array = True
+        self._pos = bracket + 1
+        self._trim_prefix(self._pos)
+        return True
+
+    def _trim_prefix(self, length: int):
+        """丢弃已扫描且不再需要的前缀，避免缓冲区无限增长"""
+        if length <= 0:
+            return
+        self._buffer = self._buffer[length:]
+        self._pos = max(0, self._pos - length)
+        if self._item_start >= 0:
+            self._item_start -= length
+
+    def _scan(self) -> List[Any]:
+        new_items = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._item_start = pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    if char == "]":
+                        self.complete = True
+                        pos += 1
+                        break
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._item_start >= 0:
+                        item = self._parse_item(buffer[self._item_start:pos + 1])
+                        if item is not None:
+                            new_items.append(item)
+                        self._item_start = -1
+            pos += 1
+        self._pos = pos
+        # 位于元素之间时，已扫描的部分都可以丢弃
+        self._trim_prefix(self._item_start if self._item_start >= 0 else self._pos)
+        self.items.extend(new_items)
+        return new_items
+
+    def _parse_item(self, text: str) -> Optional[Any]:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return None
+        return item if isinstance(item, dict) else None
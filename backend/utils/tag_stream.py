@@ -0,0 +1,70 @@
+"""
+流式输出的标签完整性处理
+模型逐token输出时，<reference data-ref="..."></reference> 和 <illustration ...></illustration>
+可能被拆到多个片段中，前端逐段渲染会出现半截标签。TagSafeChunker 会暂存未闭合的标签，
+等整个标签对输出完成后再一起下发。
+"""
+from typing import Sequence
+
+DEFAULT_TAGS = ("reference", "illustration")
+
+
+class TagSafeChunker:
+    """按片段接收模型输出，只返回不会截断指定标签对的部分"""
+
+    def __init__(self, tags: Sequence[str] = DEFAULT_TAGS, max_pending: int = 2000):
+        self.tags = tuple(tags)
+        self.max_pending = max_pending  # 标签迟迟不闭合（模型输出格式错误）时强制下发
+        self._buffer = ""
+
+    def feed(self, text: str) -> str:
+        """追加一个片段，返回可以安全下发的文本（可能为空字符串）"""
+        if not text:
+            return ""
+        self._buffer += text
+        cut = self._safe_length(self._buffer)
+        if cut == 0 and len(self._buffer) > self.max_pending:
+            cut = len(self._buffer)
+        ready, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return ready
+
+    def flush(self) -> str:
+        """输出结束时返回剩余的全部文本"""
+        rest, self._buffer = self._buffer, ""
+        return rest
+
+    def _safe_length(self, text: str) -> int:
+        """返回text中可以安全下发的前缀长度（从第一个未完成的标签处截断）"""
+        pos = 0
+        while True:
+            start = text.find("<", pos)
+            if start == -1:
+                return len(text)
+            tail = text[start:]
+            tag = self._match_tag(tail)
+            if tag is None:
+                # 可能是某个标签名的前缀（如 "<refer"），等待更多内容
+                if any(f"<{name}".startswith(tail) for name in self.tags):
+                    return start
+                pos = start + 1
+                continue
+            open_end = tail.find(">")
+            if open_end == -1:
+                return start
+            if tail[open_end - 1] == "/":
+                # 自闭合写法 <reference data-ref="..."/>
+                pos = start + open_end + 1
+                continue
+            close_tag = f"</{tag}>"
+            close_start = tail.find(close_tag, open_end + 1)
+            if close_start == -1:
+                return start
+            pos = start + close_start + len(close_tag)
+
+    def _match_tag(self, tail: str):
+        """tail以某个完整标签名开头时返回标签名"""
+        for name in self.tags:
+            prefix = f"<{name}"
+            if tail.startswith(prefix) and len(tail) > len(prefix) and tail[len(prefix)] in " >/\t\n":
+                return name
+        return None
@@ -1,5 +1,5 @@
 import { useState } from 'react';
-import { answerQuestion } from '../services/api';
+import { answerQuestionStream } from '../services/api';
 
 interface KnowledgeQAProps {
   onClose?: () => void;
@@ -22,34 +22,43 @@ export default function KnowledgeQA({ onClose: _onClose, onResultChange }: Knowl
     }
 
     try {
-      console.log('[KnowledgeQA] 开始发送问答请求:', question);
+      console.log('[KnowledgeQA] 开始发送流式问答请求:', question);
       const startTime = Date.now();
       
-      // 使用知识库问答API
-      const response = await answerQuestion(question);
-      
-      const elapsed = Date.now() - startTime;
-      console.log('[KnowledgeQA] 请求完成，耗时:', elapsed, 'ms');
-      console.log('[KnowledgeQA] 响应数据:', response);
-      console.log('[KnowledgeQA] answer类型:', typeof response?.answer);
-      console.log('[KnowledgeQA] answer长度:', response?.answer?.length);
-      console.log('[KnowledgeQA] references类型:', typeof response?.references);
-      console.log('[KnowledgeQA] references长度:', response?.references?.length);
-      
-      if (!response) {
-        throw new Error('响应数据为空');
-      }
-      
-      const result = {
-        question,
-        answer: response.answer || '未找到相关信息',
-        references: response.references || [],
+      // 使用流式问答API：先显示参考资料，再逐段显示答案
+      let answer = '';
+      let references: any[] = [];
+      let finished = false;
+      const emit = (streaming: boolean) => {
+        if (onResultChange) {
+          onResultChange({ question, answer, references, streaming });
+        }
       };
       
-      console.log('[KnowledgeQA] 准备返回结果:', result);
+      await answerQuestionStream(question, {
+        onReferences: (refs) => {
+          references = refs;
+          console.log('[KnowledgeQA] 收到参考资料，耗时:', Date.now() - startTime, 'ms，数量:', refs.length);
+          emit(true);
+        },
+        onDelta: (text) => {
+          answer += text;
+          emit(true);
+        },
+        onError: (message) => {
+          console.error('[KnowledgeQA] 生成答案出错:', message);
+        },
+        onDone: (result) => {
+          finished = true;
+          answer = result.answer || answer || '未找到相关信息';
+          references = result.references || references;
+          console.log('[KnowledgeQA] 请求完成，耗时:', Date.now() - startTime, 'ms，答案长度:', answer.length);
+          emit(false);
+        },
+      });
       
-      if (onResultChange) {
-        onResultChange(result);
+      if (!finished) {
+        throw new Error('连接中断，答案可能不完整');
       }
     } catch (err: any) {
       console.error('[KnowledgeQA] 请求失败:', err);
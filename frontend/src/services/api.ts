@@ -10,6 +10,10 @@ const api = axios.create({
 api.interceptors.request.use(
   (config) => {
     console.log('[API] 请求:', config.method?.toUpperCase(), config.url, '超时设置:', config.timeout || '使用默认值');
+    // 把本次请求的超时告诉后端，后端在此之前返回部分结果，超时后不再继续调用模型
+    if (config.timeout) {
+      config.headers.set('X-Request-Timeout', String(config.timeout / 1000));
+    }
     return config;
   },
   (error) => {
@@ -89,6 +93,73 @@ export const answerQuestion = async (question: string) => {
   return response.data;
 };
 
+// 以POST方式请求SSE接口，逐个事件回调（axios不支持流式读取响应，这里使用fetch）
+const postSSE = async (
+  url: string,
+  body: unknown,
+  onEvent: (event: string, data: any) => void,
+  signal?: AbortSignal,
+) => {
+  const response = await fetch(`/api${url}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify(body),
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    let detail = `请求失败: ${response.status}`;
+    try {
+      detail = (await response.json())?.detail || detail;
+    } catch {
+      // 响应不是JSON
+    }
+    throw new Error(detail);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      const dataLines: string[] = [];
+      for (const line of raw.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+      }
+      if (dataLines.length > 0) {
+        onEvent(event, JSON.parse(dataLines.join('\n')));
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+};
+
+// 流式知识库问答：先返回参考资料，再逐段返回答案（引用/配图标签不会被拆开）
+export const answerQuestionStream = async (
+  question: string,
+  handlers: {
+    onReferences?: (references: any[]) => void;
+    onDelta?: (text: string) => void;
+    onError?: (message: string) => void;
+    onDone?: (result: { answer: string; references: any[] }) => void;
+  },
+  signal?: AbortSignal,
+) => {
+  await postSSE('/knowledge/qa/stream', { question }, (event, data) => {
+    if (event === 'references') handlers.onReferences?.(data.references || []);
+    else if (event === 'delta') handlers.onDelta?.(data.text || '');
+    else if (event === 'error') handlers.onError?.(data.message || '');
+    else if (event === 'done') handlers.onDone?.(data);
+  }, signal);
+};
+
 // 网络搜索供应商
 export const searchSuppliers = async (productName: string, limit: number = 5) => {
   const response = await api.post('/search/suppliers', {